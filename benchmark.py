@@ -0,0 +1,1744 @@
+# Headless benchmarks for main.py / main.py 的无窗口性能测试
+#
+#   python benchmark.py            run every benchmark but render
+#   python benchmark.py storage    run only the named benchmarks
+#   python benchmark.py render     draw offscreen, needs EGL (Mesa llvmpipe
+#                                  will do: EGL_PLATFORM=surfaceless)
+
+import csv
+import io
+import json
+import math
+import os
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pyglet
+
+# Never open a window (or the shadow window) while benchmarking.
+pyglet.options['shadow_window'] = False
+if 'render' in sys.argv[1:]:
+    # Windows are offscreen EGL surfaces.
+    pyglet.options['headless'] = True
+
+import main
+
+# Benchmarks run on the flat world, generated on the main thread, unless
+# they say otherwise.
+main.WORLD_GENERATOR = 'flat'
+main.GENERATION_WORKERS = 0
+
+
+# Number of checks that failed so far, see check().
+failures = 0
+
+
+def check(ok, failed='FAILED'):
+    """ Return 'ok' if the check `ok` passed, else `failed`, counting the
+    failure so that the run exits with an error.
+
+    """
+    global failures
+    if not ok:
+        failures += 1
+    return 'ok' if ok else failed
+
+
+def timed(func, *args, **kwargs):
+    """ Call `func` and return its result along with the elapsed seconds.
+
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def flat_world_positions():
+    """ Positions of the flat stone-plus-grass world of `FlatGenerator`,
+    stone ids first.
+
+    """
+    n = main.WORLD_WIDTH
+    for x in range(-n, n + 1):
+        for z in range(-n, n + 1):
+            for y in range(0, 64):
+                yield (x, y, z), 1
+            yield (x, 64, z), 0
+
+
+def flat_model(**kwargs):
+    """ A headless `Model` of the flat world with every chunk generated up
+    front, as the world used to be built. With a `path` the chunks are
+    marked for saving.
+
+    """
+    model = main.Model(headless=True, **kwargs)
+    n = main.WORLD_WIDTH // main.SECTOR_SIZE
+    sectors = [(x, 0, z) for x in range(-n, n + 1) for z in range(-n, n + 1)]
+    for sector in sectors:
+        model.world.load(sector)
+    if model.autosave is not None:
+        model.autosave.mark_dirty(sectors)
+    return model
+
+
+def bench_storage():
+    """ Memory and per-operation latency of the chunk storage against the
+    plain tuple-keyed dict `Model.world` used to be.
+
+    """
+    print('storage: %d blocks' % (257 * 257 * 65))
+    probes = [(x, y, z) for x in range(-40, 40, 3)
+              for y in range(0, 80, 3) for z in range(-40, 40, 3)]
+    for name, factory in (('dict', dict), ('ChunkedWorld', main.ChunkedWorld)):
+        tracemalloc.start()
+        world = factory()
+        start = time.perf_counter()
+        for position, block_id in flat_world_positions():
+            world[position] = block_id
+        fill = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        for position in probes:
+            position in world
+        lookup = (time.perf_counter() - start) / len(probes)
+
+        start = time.perf_counter()
+        for position in probes:
+            world.get(position)
+        get = (time.perf_counter() - start) / len(probes)
+
+        edits = [(x, 64, z) for x in range(-50, 50) for z in range(-50, 50)]
+        start = time.perf_counter()
+        for position in edits:
+            del world[position]
+        for position in edits:
+            world[position] = 0
+        edit = (time.perf_counter() - start) / (2 * len(edits))
+
+        print('  %-12s  %8.1f MB  fill %6.2f s  in %5.0f ns  get %5.0f ns'
+              '  set/del %5.0f ns' % (name, memory / 2.0 ** 20, fill,
+                                       lookup * 1e9, get * 1e9, edit * 1e9))
+        del world
+
+
+def bench_generate():
+    """ Chunks per second of each terrain generator, whether a seed builds
+    the same chunks whatever order they are visited in, and whether showing
+    the sectors around spawn generates nothing else. Then bulk writes of the
+    flat world against one `add_block(..., immediate=False)` call per block.
+
+    """
+    sectors = [(x, 0, z) for x in range(-8, 8) for z in range(-8, 8)]
+    print('generate: %d chunks' % len(sectors))
+    for name, cls in sorted(main.GENERATORS.items()):
+        generator = cls(1234)
+        _, elapsed = timed(lambda: [generator.generate(sector)
+                                    for sector in sectors])
+        print('  %-6s %7.0f chunks/s' % (name, len(sectors) / elapsed))
+
+    generator = main.NoiseGenerator(1234)
+    chunks = {sector: generator.generate(sector) for sector in sectors}
+    shuffled = list(sectors)
+    random.Random(0).shuffle(shuffled)
+    again = main.NoiseGenerator(1234)
+    other = main.NoiseGenerator(4321)
+    model = main.Model(headless=True, generator=main.NoiseGenerator(1234))
+    model.change_sectors(None, (0, 0, 0))
+    visited = set(model.shown)
+    for x, y, z in model.shown:
+        visited.update([(x - 1, y, z), (x + 1, y, z), (x, y, z - 1),
+                        (x, y, z + 1)])
+    checks = [
+        ('the same seed in shuffled order, same chunks',
+         all((again.generate(sector) == chunks[sector]).all()
+             for sector in shuffled)),
+        ('another seed, other chunks',
+         all((other.generate(sector) != chunks[sector]).any()
+             for sector in sectors[:8])),
+        ('only the shown sectors and their neighbours are generated',
+         set(model.sectors) == visited),
+        ('the shown chunks are the generated ones',
+         all((model.sectors[sector].blocks == chunks[sector]).all()
+             for sector in visited if sector in chunks)),
+    ]
+    model.close()
+    for name, ok in checks:
+        print('  %-58s %s' % (name, check(ok)))
+
+    _, up_front = timed(flat_model)
+    print('  flat world generated up front  %7.3f s' % up_front)
+    model = main.Model(headless=True)
+    model.world.generator = None
+    n = main.WORLD_WIDTH
+    start = time.perf_counter()
+    model.fill_region(-n, 0, -n, n, 63, n, 1)
+    model.fill_region(-n, 64, -n, n, 64, n, 0)
+    print('  fill_region                    %7.3f s' % (
+        time.perf_counter() - start))
+    heights = [[64] * (2 * main.WORLD_WIDTH + 1)] * (2 * main.WORLD_WIDTH + 1)
+    _, columns = timed(model.set_column_heights, heights,
+                       [(1, 0), (None, 1)])
+    print('  set_column_heights             %7.3f s' % columns)
+    model.world = main.ChunkedWorld()
+    model.sectors = model.world.chunks
+    start = time.perf_counter()
+    for position, block_id in flat_world_positions():
+        model.add_block(position, block_id, immediate=False)
+    print('  add_block                      %7.3f s' % (
+        time.perf_counter() - start))
+
+
+def loaded_sectors(pad=4):
+    """ The sectors `Model.change_sectors` shows around the origin.
+
+    """
+    return [(dx, 0, dz) for dx in range(-pad, pad + 1)
+            for dz in range(-pad, pad + 1)
+            if dx ** 2 + dz ** 2 <= (pad + 1) ** 2]
+
+
+def bench_pool():
+    """ Chunks per second of a `GenerationPool` pre-generating a large area
+    with 1, 2, 4 and 8 workers, against generating on the main thread, and
+    the main thread time spent merging each chunk.
+
+    """
+    radius = 16
+    sectors = [(x, 0, z) for x in range(-radius, radius)
+               for z in range(-radius, radius)]
+    generator = main.NoiseGenerator(1234)
+    print('pool: %d chunks, %d CPUs' % (len(sectors), os.cpu_count() or 1))
+    _, inline = timed(lambda: [generator.generate(sector)
+                               for sector in sectors[:256]])
+    print('  main thread      %7.0f chunks/s' % (256 / inline))
+    sample = {sector: generator.generate(sector) for sector in sectors[::97]}
+    for workers in (1, 2, 4, 8):
+        finished = queue.Queue()
+        pool = main.GenerationPool(generator, workers, finished.put)
+        start = time.perf_counter()
+        for sector in sectors + sectors:
+            # Every sector twice, the second request is dropped.
+            pool.request(sector, math.hypot(sector[0], sector[2]))
+        pool.submit()
+        order = []
+        same = True
+        merge = 0.0
+        first = None
+        while len(order) < len(sectors) or pool.requested:
+            future = finished.get()
+            if first is None:
+                first = time.perf_counter()
+            begin = time.perf_counter()
+            sector, blocks = pool.collect(future)
+            pool.submit()
+            merge += time.perf_counter() - begin
+            order.append(sector)
+            if sector in sample:
+                same = same and (blocks == sample[sector]).all()
+        end = time.perf_counter()
+        pool.close()
+        tenth = len(order) // 10
+        near = sum(math.hypot(x, z) for x, _, z in order[:tenth]) / tenth
+        far = sum(math.hypot(x, z) for x, _, z in order[-tenth:]) / tenth
+        print('  %d workers  %7.0f chunks/s  (%.2f s to start)  merge %3.0f us'
+              '  first/last tenth at %4.1f/%4.1f  %s' % (
+                  workers, (len(order) - 1) / (end - first), first - start,
+                  merge / len(order) * 1e6, near, far,
+                  check(same and len(order) == len(sectors), 'MISMATCH')))
+
+    # The player's own sector is loaded on the main thread while the pool
+    # generates it too: its neighbours must still get their meshes.
+    workers = main.GENERATION_WORKERS
+    main.GENERATION_WORKERS = 2
+    unmeshed = 0
+    try:
+        for _ in range(4):
+            model = main.Model(headless=True,
+                               generator=main.FlatGenerator(0))
+            model.change_sectors(None, (7, 0, 0))
+            model.process_entire_queue()
+            unmeshed += sum(sector in model.world.chunks and
+                            sector not in model.meshes
+                            for sector in model.shown)
+            model.close()
+    finally:
+        main.GENERATION_WORKERS = workers
+    print('  every shown sector meshed with 2 workers  %s' % (
+        check(not unmeshed)))
+
+
+def bench_mesh():
+    """ Face-culled chunk meshes against one 24-vertex cube per exposed
+    block, over the sectors loaded around spawn in the default world.
+
+    """
+    model = flat_model()
+    sectors = loaded_sectors()
+    print('mesh: %d sectors' % len(sectors))
+
+    start = time.perf_counter()
+    quads = 0
+    for sector in sectors:
+        x, _, z = sector
+        origin = (x * main.SECTOR_SIZE, 0, z * main.SECTOR_SIZE)
+        vertices, _ = main.build_chunk_mesh(model.world.padded(sector), origin)
+        quads += len(vertices) // 12
+    culled = time.perf_counter() - start
+
+    # The texture lists BLOCKS used to hold, copied for every shown block.
+    textures = [main.tex_coords(*material.squares[:3])
+                for material in main.BLOCKS]
+    start = time.perf_counter()
+    blocks = 0
+    for sector in sectors:
+        for position in model.sectors[sector].positions():
+            if model.exposed(position):
+                main.cube_vertices(*position, 0.5)
+                list(textures[model.world[position]])
+                blocks += 1
+    per_block = time.perf_counter() - start
+
+    print('  culled     %8d triangles  %7.3f s' % (2 * quads, culled))
+    print('  per block  %8d triangles  %7.3f s (vertex data only)'
+          % (12 * blocks, per_block))
+
+
+def bench_greedy():
+    """ Plain face culling against greedy meshing over every chunk of the
+    default world.
+
+    """
+    model = flat_model()
+    sectors = sorted(model.sectors)
+    padded = [(model.world.padded(sector), model.sectors[sector].origin)
+              for sector in sectors]
+    print('greedy: %d sectors' % len(sectors))
+
+    start = time.perf_counter()
+    quads = 0
+    for blocks, origin in padded:
+        vertices, _ = main.build_chunk_mesh(blocks, origin)
+        quads += len(vertices) // 12
+    print('  culled  %8d quads  %7.3f s' % (quads, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    quads = 0
+    for blocks, origin in padded:
+        for vertices, _ in main.build_greedy_mesh(blocks, origin).values():
+            quads += len(vertices) // 12
+    print('  greedy  %8d quads  %7.3f s' % (quads, time.perf_counter() - start))
+
+
+def bench_workers():
+    """ Main thread time spent showing the sectors around spawn with the
+    meshes built inline against on the mesh worker pool.
+
+    """
+    sectors = loaded_sectors()
+    print('workers: %d sectors, %d mesh workers'
+          % (len(sectors), main.MESH_WORKERS))
+    model = main.Model(headless=True)
+    start = time.perf_counter()
+    for sector in sectors:
+        model.show_sector(sector, immediate=True)
+    print('  inline  main thread %7.3f s' % (time.perf_counter() - start))
+    model.close()
+
+    model = main.Model(headless=True)
+    start = time.perf_counter()
+    for sector in sectors:
+        model.show_sector(sector)
+    busy = time.perf_counter() - start
+    frames = 0
+    while model.queue or model._pending:
+        # One process_queue() per frame, as Simulation.update does.
+        frame = time.perf_counter()
+        model.process_queue()
+        busy += time.perf_counter() - frame
+        frames += 1
+        time.sleep(0.002)
+    done = time.perf_counter() - start
+    print('  pool    main thread %7.3f s over %d frames,'
+          ' all shown after %.3f s' % (busy, frames, done))
+    model.close()
+
+
+def bench_save():
+    """ Save the whole flat world to region files, check it loads back
+    unchanged, and compare a cold start from the save against generating
+    the world up front.
+
+    """
+    path = tempfile.mkdtemp()
+    try:
+        model, generate = timed(flat_model, path=path)
+        _, save = timed(model.save)
+        model.close()
+        size = sum(os.path.getsize(os.path.join(path, name))
+                   for name in os.listdir(path))
+        print('save: %d sectors, %.1f KB on disk, saved in %.3f s'
+              % (len(model.sectors), size / 1024.0, save))
+
+        loaded, cold = timed(main.Model, headless=True, path=path)
+        start = time.perf_counter()
+        for sector in loaded_sectors():
+            loaded.show_sector(sector)
+        loaded.process_entire_queue()
+        spawn = time.perf_counter() - start
+        for sector in loaded.store.sectors():
+            loaded.world.load(sector)
+        same = sorted(loaded.sectors) == sorted(model.sectors) and all(
+            (loaded.sectors[sector].blocks == chunk.blocks).all()
+            for sector, chunk in model.sectors.items())
+        loaded.close()
+        print('  round trip %s' % check(same, 'MISMATCH'))
+        print('  generate           %7.3f s' % generate)
+        print('  cold start         %7.3f s (+%.3f s loading and meshing'
+              ' spawn)' % (cold, spawn))
+    finally:
+        shutil.rmtree(path)
+
+    # Saving the same chunks over and over must not grow the file without
+    # bound, and closing it leaves only the live records.
+    path = tempfile.mkdtemp()
+    try:
+        store = main.RegionStore(path)
+        rng = main.numpy.random.default_rng(0)
+        sectors = [(x, 0, 0) for x in range(8)]
+        blocks = {}
+        largest = 0
+        for _ in range(50):
+            for sector in sectors:
+                # Random columns of random height, records of every size.
+                height = int(rng.integers(1, 64))
+                blocks[sector] = main.numpy.zeros(
+                    (main.SECTOR_SIZE, main.WORLD_HEIGHT, main.SECTOR_SIZE),
+                    dtype=main.numpy.uint8)
+                blocks[sector][:, :height] = rng.integers(
+                    1, 3, (main.SECTOR_SIZE, height, main.SECTOR_SIZE))
+                store.save(sector, blocks[sector])
+            store.flush()
+            largest = max(largest, sum(
+                os.path.getsize(os.path.join(path, name))
+                for name in os.listdir(path)))
+        region_file = store.regions[(0, 0)]
+        live = region_file.live()
+        store.close()
+        size = os.path.getsize(region_file.path)
+        same = all((main.RegionStore(path).load(sector) == blocks[sector]
+                    ).all() for sector in sectors)
+        print('  400 rewrites  largest %.1f KB, closed %.1f KB for %.1f KB'
+              ' of records  %s' % (
+                  largest / 1024.0, size / 1024.0, live / 1024.0,
+                  check(same and size == region_file.data_start + live and
+                        largest <= 3 * live + region_file.data_start)))
+    finally:
+        shutil.rmtree(path)
+
+
+def bench_autosave():
+    """ Incremental autosave after a handful of edits against the first
+    save of the whole flat world.
+
+    """
+    path = tempfile.mkdtemp()
+    try:
+        model = flat_model(path=path)
+        model.autosave.interval = 3600
+        model.save()
+        metrics = model.autosave.metrics()
+        print('autosave:')
+        print('  full world  %4d sectors  %8d bytes  %7.3f s' % (
+            len(model.sectors), metrics['last_flush_bytes'],
+            metrics['last_flush_seconds']))
+        for x in range(-40, 40, 8):
+            model.remove_block((x, 64, x))
+            model.add_block((x, 66, -x), 0)
+        dirty = len(model.autosave.dirty)
+        model.save()
+        metrics = model.autosave.metrics()
+        print('  20 edits    %4d sectors  %8d bytes  %7.3f s' % (
+            dirty, metrics['last_flush_bytes'],
+            metrics['last_flush_seconds']))
+
+        # A failing write keeps the chunks dirty and their journal records,
+        # and the journal is written between two chunk saves.
+        autosave = model.autosave
+        model.add_block((3, 66, 3), 0)
+        save = model.store.save
+
+        def fail(sector, blocks):
+            raise OSError('disk full')
+        model.store.save = fail
+        try:
+            autosave.flush()
+            kept = False
+        except OSError:
+            kept = (3 // main.SECTOR_SIZE, 0, 3 // main.SECTOR_SIZE) in \
+                autosave.dirty
+        model.store.save = save
+        journaled = os.path.getsize(autosave.journal_path)
+        model.remove_block((3, 66, 3))
+        deadline = time.perf_counter() + 3 * main.JOURNAL_INTERVAL
+        while os.path.getsize(autosave.journal_path) == journaled and \
+                time.perf_counter() < deadline:
+            time.sleep(0.05)
+        behind = os.path.getsize(autosave.journal_path) > journaled
+        model.save()
+        print('  failed write kept  %s' % (
+            check(kept and journaled == autosave.RECORD.size)))
+        print('  journal written behind  %s' % (
+            check(behind and not autosave.edits)))
+
+        # Region operations the journal can not describe are saved at once,
+        # or at the end of the outermost batch, not at the next autosave.
+        def on_disk(position):
+            x, y, z = position
+            blocks = main.RegionStore(path).load(main.sectorize(position))
+            return int(blocks[x % main.SECTOR_SIZE, y, z % main.SECTOR_SIZE])
+        model.replace_region(-20, 64, -20, 20, 64, 20, 0, 1)
+        replaced = on_disk((-20, 64, 20)) == 2 and not autosave.dirty
+        with model.batch_edit():
+            # Air over the stone.
+            model.paste(model.copy_region(0, 65, 0, 3, 65, 3), (0, 64, 0))
+            waited = on_disk((2, 64, 1)) == 2
+        pasted = on_disk((2, 64, 1)) == main.AIR and not autosave.dirty
+        print('  region edits saved at once  %s' % check(
+            replaced and waited and pasted))
+        model.close()
+    finally:
+        shutil.rmtree(path)
+
+
+def legacy_hit_test(world, position, vector, max_distance=8):
+    """ The fixed 1/8 block stepping `Model.hit_test` used before the voxel
+    traversal.
+
+    """
+    m = 8
+    x, y, z = position
+    dx, dy, dz = vector
+    previous = None
+    for _ in range(max_distance * m):
+        key = main.normalize((x, y, z))
+        if key != previous and key in world:
+            return key, previous
+        previous = key
+        x, y, z = x + dx / m, y + dy / m, z + dz / m
+    return None, None
+
+
+def reference_hit_test(world, position, vector, max_distance=8):
+    """ Brute force ray cast: intersect the ray with the box of every
+    block near it and return the nearest one.
+
+    """
+    best, best_t = None, None
+    lo = [int(math.floor(p - max_distance)) for p in position]
+    hi = [int(math.ceil(p + max_distance)) for p in position]
+    for x in range(lo[0], hi[0] + 1):
+        for y in range(lo[1], hi[1] + 1):
+            for z in range(lo[2], hi[2] + 1):
+                if (x, y, z) not in world:
+                    continue
+                enter, leave = -math.inf, math.inf
+                for p, d, c in zip(position, vector, (x, y, z)):
+                    if d == 0:
+                        if not c - 0.5 <= p < c + 0.5:
+                            enter = math.inf
+                        continue
+                    t1, t2 = (c - 0.5 - p) / d, (c + 0.5 - p) / d
+                    enter = max(enter, min(t1, t2))
+                    leave = min(leave, max(t1, t2))
+                if enter <= leave and leave >= 0 and enter <= max_distance:
+                    if best is None or enter < best_t:
+                        best, best_t = (x, y, z), enter
+    return best
+
+
+def random_rays(count, seed=0):
+    rng = random.Random(seed)
+    world = main.ChunkedWorld()
+    for _ in range(600):
+        world[(rng.randint(-6, 6), rng.randint(0, 12), rng.randint(-6, 6))] = 1
+    rays = []
+    for _ in range(count):
+        position = (rng.uniform(-3, 3), rng.uniform(3, 9), rng.uniform(-3, 3))
+        vector = [rng.gauss(0, 1) for _ in range(3)]
+        norm = math.sqrt(sum(v * v for v in vector))
+        rays.append((position, tuple(v / norm for v in vector)))
+    return world, rays
+
+
+def bench_raycast():
+    """ Check the voxel traversal of `Model.hit_test` against a brute force
+    reference, and time it against the old fixed stepping.
+
+    """
+    model = flat_model()
+    world, rays = random_rays(2000)
+    model.world = world
+    wrong = legacy_wrong = 0
+    for position, vector in rays:
+        expected = reference_hit_test(world, position, vector)
+        block, previous, face = model.hit_test(position, vector)
+        if block != expected:
+            wrong += 1
+        elif block is not None and previous is not None and previous != tuple(
+                b + f for b, f in zip(block, face)):
+            wrong += 1
+        if legacy_hit_test(world, position, vector)[0] != expected:
+            legacy_wrong += 1
+    print('raycast: %d random rays' % len(rays))
+    print('  voxel traversal  %4d disagree with the reference  %s' % (
+        wrong, check(not wrong)))
+    print('  1/8 stepping     %4d disagree with the reference' % legacy_wrong)
+
+    model = flat_model()
+    position = (0.3, 65.6, 0.2)
+    for name, vector in (('flat ground', (0.6, -0.64, 0.48)),
+                         ('open sky', (0.0, 1.0, 0.0))):
+        start = time.perf_counter()
+        for _ in range(2000):
+            model.hit_test(position, vector)
+        voxel = (time.perf_counter() - start) / 2000
+        start = time.perf_counter()
+        for _ in range(2000):
+            legacy_hit_test(model.world, position, vector)
+        legacy = (time.perf_counter() - start) / 2000
+        print('  %-12s  voxel %6.1f us  stepping %6.1f us'
+              % (name, voxel * 1e6, legacy * 1e6))
+
+
+class Body(main.Player):
+    """ `main.Player` stepped directly in `model`, with any `dt`.
+
+    """
+
+    def __init__(self, model, position):
+        super(Body, self).__init__(position)
+        self.model = model
+
+    def tick(self, count=1, dt=1.0 / main.TICKS_PER_SEC):
+        for _ in range(count):
+            self.update(min(dt, 0.2), self.model.world)
+
+
+class LegacyBody(Body):
+    """ `Body` with the fixed-overlap collision and 8 substeps per tick
+    used before the swept collision.
+
+    """
+
+    def tick(self, count=1, dt=1.0 / main.TICKS_PER_SEC):
+        for _ in range(count):
+            dt = min(dt, 0.2)
+            for _ in range(8):
+                self.update(dt / 8, self.model.world)
+
+    def collide(self, world, position, motion, height):
+        pad = 0.25
+        p = [a + b for a, b in zip(position, motion)]
+        np = main.normalize(p)
+        for face in main.FACES:
+            for i in range(3):
+                if not face[i]:
+                    continue
+                d = (p[i] - np[i]) * face[i]
+                if d < pad:
+                    continue
+                for dy in range(int(height)):
+                    op = list(np)
+                    op[1] -= dy
+                    op[i] += face[i]
+                    if tuple(op) not in world:
+                        continue
+                    p[i] -= (d - pad) * face[i]
+                    if face == (0, -1, 0) or face == (0, 1, 0):
+                        self.dy = 0
+                    break
+        return tuple(p)
+
+
+def bench_physics():
+    """ Falling, wall sliding and ceiling bump scenarios for the swept
+    collision, and the cost of a physics tick.
+
+    """
+    model = flat_model()
+    # Standing on the grass at y = 64 puts the eye 1.25 above its top.
+    ground = 64.5 + 1.25
+    checks = []
+
+    body = Body(model, (0.3, 100, 0.3))
+    body.tick(5 * main.TICKS_PER_SEC)
+    checks.append(('fall onto the ground',
+                   abs(body.position[1] - ground) < 1e-6 and body.dy == 0))
+
+    body = Body(model, (0.3, 200, 0.3))
+    body.dy = -main.TERMINAL_VELOCITY
+    body.tick(40, dt=0.2)
+    checks.append(('land at terminal velocity with 0.2 s ticks',
+                   abs(body.position[1] - ground) < 1e-6))
+
+    model.fill_region(3, 65, -5, 3, 67, 5, 1)
+    body = Body(model, (0, ground, 0))
+    body.rotation = (45, 0)
+    body.strafe = [-1, 0]
+    body.tick(main.TICKS_PER_SEC)
+    x, y, z = body.position
+    checks.append(('slide along a wall',
+                   abs(x - 2.25) < 1e-6 and z < -2 and abs(y - ground) < 1e-6))
+
+    model.fill_region(-5, 67, -5, 2, 67, 5, 1)
+    body = Body(model, (0, ground, 0))
+    body.dy = main.JUMP_SPEED
+    top = ground
+    for _ in range(main.TICKS_PER_SEC):
+        body.tick()
+        top = max(top, body.position[1])
+    checks.append(('bump the ceiling',
+                   abs(top - 66.25) < 1e-6 and
+                   abs(body.position[1] - ground) < 1e-6))
+
+    print('physics:')
+    for name, ok in checks:
+        print('  %-44s %s' % (name, check(ok)))
+
+    model = flat_model()
+    for cls in (Body, LegacyBody):
+        body = cls(model, (0.3, ground, 0.3))
+        body.rotation = (30, 0)
+        body.strafe = [-1, 0]
+        start = time.perf_counter()
+        body.tick(2000)
+        tick = (time.perf_counter() - start) / 2000
+        print('  %-10s %6.1f us per tick' % (cls.__name__, tick * 1e6))
+
+
+def legacy_sector_sets(before, after, pad=4):
+    """ The show / hide sets `Model.change_sectors` built before the offsets
+    were precomputed.
+
+    """
+    before_set = set()
+    after_set = set()
+    for dx in range(-pad, pad + 1):
+        for dz in range(-pad, pad + 1):
+            if dx ** 2 + dz ** 2 > (pad + 1) ** 2:
+                continue
+            if before:
+                before_set.add((before[0] + dx, 0, before[2] + dz))
+            if after:
+                after_set.add((after[0] + dx, 0, after[2] + dz))
+    return after_set - before_set, before_set - after_set
+
+
+def bench_sectors():
+    """ Sector diffing against the old set differences, and showing a
+    sector from the mesh cache against meshing it again.
+
+    """
+    rng = random.Random(0)
+    walk = [(0, 0, 0)]
+    for _ in range(5000):
+        x, _, z = walk[-1]
+        if rng.random() < 0.02:
+            walk.append((rng.randint(-50, 50), 0, rng.randint(-50, 50)))
+        else:
+            walk.append((x + rng.randint(-1, 1), 0, z + rng.randint(-1, 1)))
+    wrong = 0
+    for before, after in zip(walk, walk[1:]):
+        move = (after[0] - before[0], 0, after[2] - before[2])
+        show, hide = main.sector_deltas(4, move)
+        show = {(after[0] + dx, 0, after[2] + dz) for dx, _, dz in show}
+        hide = {(before[0] + dx, 0, before[2] + dz) for dx, _, dz in hide}
+        if (show, hide) != legacy_sector_sets(before, after):
+            wrong += 1
+    start = time.perf_counter()
+    for before, after in zip(walk, walk[1:]):
+        legacy_sector_sets(before, after)
+    legacy = (time.perf_counter() - start) / (len(walk) - 1)
+    start = time.perf_counter()
+    for before, after in zip(walk, walk[1:]):
+        main.sector_deltas(4, (after[0] - before[0], 0, after[2] - before[2]))
+    deltas = (time.perf_counter() - start) / (len(walk) - 1)
+    print('sectors: %d crossings' % (len(walk) - 1))
+    print('  deltas  %4d disagree with the set differences  %s' % (
+        wrong, check(not wrong)))
+    print('  set differences %6.1f us  precomputed deltas %6.1f us' % (
+        legacy * 1e6, deltas * 1e6))
+
+    model = flat_model()
+    path = [(x, 0, 0) for x in range(-4, 5)] + \
+        [(x, 0, 0) for x in range(3, -5, -1)]
+    for name in ('cold', 'cached'):
+        model.shown.clear()
+        model._shown.clear()
+        if name == 'cold':
+            model.meshes.clear()
+        start = time.perf_counter()
+        previous = None
+        for sector in path:
+            model.change_sectors(previous, sector)
+            model.process_entire_queue()
+            previous = sector
+        elapsed = time.perf_counter() - start
+        expected = {(dx, 0, dz) for dx, _, dz in main.sector_offsets(4)}
+        print('  walk there and back, %-6s %7.3f s, shown %s' % (
+            name, elapsed,
+            check(model.shown == {(-4 + dx, 0, dz)
+                                  for dx, _, dz in expected}, 'WRONG')))
+    # Editing a block must not leave the old mesh cached as current.
+    stamp = model.world.stamp((0, 0, 0))
+    model.remove_block((0, 64, 0))
+    current = model.meshes[(0, 0, 0)][0]
+    print('  edited sector remeshed  %s' % check(
+        current != stamp and current == model.world.stamp((0, 0, 0)),
+        'STALE'))
+    model.close()
+
+    # Chunks left behind are unloaded: walking 200 sectors keeps about the
+    # circle around the player in memory, and an edit made at the start is
+    # saved and loaded back on the way home.
+    path = tempfile.mkdtemp()
+    try:
+        model = main.Model(headless=True, path=path,
+                           generator=main.NoiseGenerator(0))
+        model.change_sectors(None, (0, 0, 0))
+        model.process_entire_queue()
+        model.add_block((5, 250, 5), 0)
+        start = time.perf_counter()
+        previous, peak = (0, 0, 0), 0
+        for x in list(range(1, 201)) + list(range(199, -1, -1)):
+            model.change_sectors(previous, (x, 0, 0))
+            model.process_entire_queue()
+            previous = (x, 0, 0)
+            peak = max(peak, len(model.world.chunks))
+        elapsed = time.perf_counter() - start
+        bound = len(main.sector_offsets(model.render_distance + 1))
+        print('  walk 200 sectors and back  %7.3f s, at most %d chunks'
+              ' loaded (bound %d), %d cave graphs  %s' % (
+                  elapsed, peak, bound, len(model.visgraph),
+                  check(peak <= bound and len(model.visgraph) <= bound)))
+        print('  edit kept across unloading  %s' % (
+            check(model.world.get((5, 250, 5)) == 0)))
+        model.close()
+    finally:
+        shutil.rmtree(path)
+
+
+def crater(center, count):
+    """ The `count` positions of the flat world nearest to `center`, the
+    blocks an explosion there would remove.
+
+    """
+    cx, cy, cz = center
+    radius = int((count * 3 / (4 * math.pi)) ** (1.0 / 3)) + 2
+    positions = [(cx + dx, cy + dy, cz + dz)
+                 for dx in range(-radius, radius + 1)
+                 for dy in range(-radius, radius + 1)
+                 for dz in range(-radius, radius + 1)
+                 if 0 <= cy + dy <= 64]
+    positions.sort(key=lambda p: ((p[0] - cx) ** 2 + (p[1] - cy) ** 2 +
+                                  (p[2] - cz) ** 2, p))
+    return positions[:count]
+
+
+def bench_explosion(count=10000):
+    """ An explosion removing `count` blocks: removal from the chunk arrays
+    against the old per-sector lists of positions, then `remove_block` on
+    the shown world, and how many mesh builds the deferred edits cost.
+
+    """
+    blocks = crater((0, 56, 0), count)
+    print('explosion: %d blocks' % len(blocks))
+
+    # The old index: one list of positions per sector, `list.remove` on
+    # every removal.
+    model = flat_model()
+    touched = {main.sectorize(position) for position in blocks}
+    lists = {sector: list(model.sectors[sector].positions())
+             for sector in touched}
+    _, legacy = timed(lambda: [lists[main.sectorize(position)].remove(position)
+                               for position in blocks])
+    world = model.world
+    _, chunked = timed(lambda: [world.__delitem__(position)
+                                for position in blocks])
+    print('  sector lists %8.3f s  chunk arrays %8.3f s  (%.0fx)' % (
+        legacy, chunked, legacy / chunked))
+    model.close()
+
+    model = flat_model()
+    model.change_sectors(None, (0, 0, 0))
+    model.process_entire_queue()
+    builds = []
+    submit = model.mesher.submit
+    model.mesher.submit = lambda *args: builds.append(args) or submit(*args)
+    start = time.perf_counter()
+    for position in blocks:
+        model.remove_block(position, immediate=False)
+    edits = time.perf_counter() - start
+    model.process_entire_queue()
+    elapsed = time.perf_counter() - start
+    hollow = all(position not in model.world for position in blocks)
+    current = all(model.meshes[sector][0] == model.world.stamp(sector)
+                  for sector in touched)
+    print('  remove_block %8.3f s, meshed by %8.3f s, %d mesh builds for '
+          '%d sectors, %s' % (edits, elapsed, len(builds), len(touched),
+                              check(hollow and current, 'WRONG')))
+    model.close()
+
+
+def shown_meshes(model):
+    """ The meshes last built for the sectors `model` shows, as bytes.
+
+    """
+    return {sector: {tile: (vertices.tobytes(), tex_coords.tobytes())
+                     for tile, (vertices, tex_coords) in meshes.items()}
+            for sector, (_, meshes) in model.meshes.items()
+            if sector in model.shown}
+
+
+def bench_batch(size=(16, 4, 16)):
+    """ Clearing then refilling a box one `add_block`/`remove_block` at a
+    time against the same edits inside `batch_edit()`, then undoing the
+    batch. The meshes must end up the same either way.
+
+    """
+    w, h, d = size
+    box = [(x, y, z) for x in range(-w // 2, w - w // 2)
+           for y in range(65 - h, 65) for z in range(-d // 2, d - d // 2)]
+    print('batch: %d blocks cleared and refilled' % len(box))
+    results = []
+    for name in ('one by one', 'batch_edit'):
+        model = flat_model()
+        model.change_sectors(None, (0, 0, 0))
+        model.process_entire_queue()
+        before = shown_meshes(model)
+        blocks = {sector: model.sectors[sector].blocks.copy()
+                  for sector in model.sectors}
+        builds = []
+        rebuild = model._show_sector
+        model._show_sector = lambda sector: builds.append(sector) or \
+            rebuild(sector)
+        start = time.perf_counter()
+        if name == 'batch_edit':
+            with model.batch_edit() as batch:
+                for position in box:
+                    model.remove_block(position)
+        else:
+            for position in box:
+                model.remove_block(position)
+        cleared = time.perf_counter() - start
+        after = shown_meshes(model)
+        start = time.perf_counter()
+        if name == 'batch_edit':
+            batch.undo()
+        else:
+            for position in box:
+                model.add_block(position, 0 if position[1] == 64 else 1)
+        refilled = time.perf_counter() - start
+        restored = shown_meshes(model) == before and \
+            all((model.sectors[sector].blocks == blocks[sector]).all()
+                for sector in blocks)
+        print('  %-10s  clear %7.3f s  refill %7.3f s  %5d mesh builds  '
+              'restored %s' % (name, cleared, refilled, len(builds),
+                               check(restored, 'WRONG')))
+        results.append(after)
+        model.close()
+    print('  same meshes after clearing                %s' % (
+        check(results[0] == results[1], 'WRONG')))
+
+    # An exception inside the batch takes its edits back.
+    model = flat_model()
+    model.change_sectors(None, (0, 0, 0))
+    model.process_entire_queue()
+    before = shown_meshes(model)
+    try:
+        with model.batch_edit():
+            for position in box:
+                model.remove_block(position)
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    print('  an exception rolls the batch back         %s' % (
+        check(all(position in model.world for position in box) and
+              shown_meshes(model) == before, 'WRONG')))
+    model.close()
+
+
+def snapshot(model):
+    """ Copies of the block arrays of every chunk of `model`.
+
+    """
+    return {sector: chunk.blocks.copy()
+            for sector, chunk in model.sectors.items()}
+
+
+def meshes_current(model):
+    """ Whether every shown sector of `model` has the mesh its blocks give
+    now. Sectors next to an edit keep their mesh, built for an older stamp,
+    when the edit does not reach their faces.
+
+    """
+    for sector in model.shown:
+        _, meshes = model.meshes.get(sector, (None, None))
+        if meshes is None:
+            return False
+        x, _, z = sector
+        fresh = main.build_sector_mesh(
+            model.world.padded(sector),
+            (x * main.SECTOR_SIZE, 0, z * main.SECTOR_SIZE), model.greedy)
+        if {tile: (v.tobytes(), t.tobytes())
+                for tile, (v, t) in meshes.items()} != \
+                {tile: (v.tobytes(), t.tobytes())
+                 for tile, (v, t) in fresh.items()}:
+            return False
+    return True
+
+
+def bench_regions():
+    """ Millions of blocks per second written by the region operations on
+    a 1M-block box, their results against the same edits made a block at a
+    time, and the shown meshes after editing, undoing and redoing them.
+
+    """
+    model = flat_model()
+    box = (-64, 0, -64, 63, 63, 63)
+    cells = 128 * 64 * 128
+    print('regions: %d blocks' % cells)
+    clipboard = model.copy_region(*box)
+    for name, func in (
+            ('fill', lambda: model.fill_region(*(box + (0,)))),
+            ('replace', lambda: model.replace_region(*(box + (0, 1)))),
+            ('copy', lambda: model.copy_region(*box)),
+            ('paste', lambda: model.paste(clipboard, box[:3])),
+            ('paste, no air', lambda: model.paste(clipboard, box[:3],
+                                                  air=False)),
+            ('rotate', lambda: clipboard.rotated(1)),
+            ('clone, turned', lambda: model.clone_region(
+                *box, position=(-64, 0, -64), turns=1))):
+        _, elapsed = timed(func)
+        print('  %-14s %7.1f M blocks/s' % (name, cells / elapsed / 1e6))
+    model.close()
+
+    # The same edits a block at a time, on a small box.
+    model, reference = flat_model(), flat_model()
+    small = (-3, 62, 5, 4, 67, 9)
+    x0, y0, z0, x1, y1, z1 = small
+    positions = [(x, y, z) for x in range(x0, x1 + 1)
+                 for y in range(y0, y1 + 1) for z in range(z0, z1 + 1)]
+    model.fill_region(*(small + (1,)))
+    for position in positions:
+        reference.add_block(position, 1, immediate=False)
+    model.fill_region(0, 66, 5, 4, 67, 9, None)
+    for x, y, z in positions:
+        if x >= 0 and y >= 66:
+            reference.remove_block((x, y, z), immediate=False)
+    replaced = model.replace_region(*(small + (1, 0)))
+    count = 0
+    for position in positions:
+        if reference.world.get(position) == 1:
+            reference.add_block(position, 0, immediate=False)
+            count += 1
+    # A quarter turn takes (i, j, k) of the box to (size z - 1 - k, j, i).
+    model.clone_region(*small, position=(20, 60, 20), turns=1)
+    for x, y, z in positions:
+        block_id = reference.world.get((x, y, z))
+        target = (20 + z1 - z, 60 + y - y0, 20 + x - x0)
+        if block_id is None:
+            if target in reference.world:
+                reference.remove_block(target, immediate=False)
+        else:
+            reference.add_block(target, block_id, immediate=False)
+    a, b = snapshot(model), snapshot(reference)
+    checks = [
+        ('fill, clear, replace and clone as block by block',
+         replaced == count and a.keys() == b.keys() and
+         all((a[sector] == b[sector]).all() for sector in a)),
+        ('four quarter turns change nothing',
+         (clipboard.rotated(4).blocks == clipboard.blocks).all() and
+         (clipboard.rotated(3).rotated(1).blocks == clipboard.blocks).all()),
+        ('a box past the world edge is clipped',
+         model.copy_region(120, 0, 0, 140, 3, 3).size == (9, 4, 4)),
+    ]
+    model.close()
+    reference.close()
+
+    # Edits to shown sectors, then undone and redone in a batch.
+    model = flat_model()
+    model.change_sectors(None, (0, 0, 0))
+    model.process_entire_queue()
+    before = snapshot(model)
+    with model.batch_edit(immediate=False) as batch:
+        model.fill_region(-20, 60, -20, 20, 64, 20, None)
+        model.add_block((0, 59, 0), 0)
+        model.replace_region(-30, 58, -30, 30, 59, 30, 1, 0)
+        model.clone_region(-5, 50, -5, 5, 58, 5, (10, 65, 10), turns=3)
+        model.paste(model.copy_region(-40, 40, -40, -30, 64, -30),
+                    (30, 65, 30), air=False)
+    model.process_entire_queue()
+    edited = snapshot(model)
+    checks.append(('shown meshes are current after editing',
+                   meshes_current(model)))
+    redo = batch.undo()
+    model.process_entire_queue()
+    restored = snapshot(model)
+    checks.append(('undo restores the blocks and meshes',
+                   all((before[sector] == restored[sector]).all()
+                       for sector in before) and meshes_current(model)))
+    redo.undo()
+    model.process_entire_queue()
+    again = snapshot(model)
+    checks.append(('redo edits them again',
+                   all((edited[sector] == again[sector]).all()
+                       for sector in edited) and meshes_current(model)))
+    model.close()
+
+    # Endless terrain takes blocks anywhere, the flat world only on its
+    # square.
+    far = main.WORLD_WIDTH + 42
+    for generator, inside in ((main.NoiseGenerator(0), True),
+                              (main.FlatGenerator(0), False)):
+        model = main.Model(headless=True, generator=generator)
+        model.add_block((far, 250, 0), 0)
+        model.fill_region(far, 250, 2, far + 2, 250, 4, 0)
+        placed = [(far, 250, 0) in model.world,
+                  (far + 2, 250, 4) in model.world]
+        checks.append(('blocks past %d on %s terrain %s' % (
+            main.WORLD_WIDTH, generator.name,
+            'are placed' if inside else 'are refused'),
+            placed == [inside, inside]))
+        model.close()
+    for name, ok in checks:
+        print('  %-50s %s' % (name, check(ok)))
+
+
+def bench_schematic():
+    """ Export and import of a 1M-block box of noise terrain as a schematic,
+    with and without zlib, and how the format copes with other registries,
+    other versions and damaged files.
+
+    """
+    box = (-64, 32, -64, 63, 95, 63)
+    cells = 128 * 64 * 128
+    source = main.Model(headless=True, generator=main.NoiseGenerator(1234))
+    blocks = source.copy_region(*box).blocks
+    print('schematic: %d blocks, %d of them air' % (
+        cells, cells - main.numpy.count_nonzero(blocks)))
+    files = {}
+    checks = []
+    for compress in (False, True):
+        f = io.BytesIO()
+        _, export = timed(source.export_schematic, f, *box,
+                          compress=compress)
+        files[compress] = f.getvalue()
+        target = flat_model()
+        tracemalloc.start()
+        _, load = timed(target.import_schematic, io.BytesIO(f.getvalue()),
+                        box[:3])
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print('  %-5s %8d bytes  export %6.3f s  import %6.3f s  '
+              '(%.1f MB peak)' % ('zlib' if compress else 'runs',
+                                  len(f.getvalue()), export, load,
+                                  peak / 2 ** 20))
+        checks.append(('%s round trip' % ('zlib' if compress else 'runs'),
+                       (target.copy_region(*box).blocks == blocks).all()))
+        target.close()
+
+    values = [0, 1, 127, 128, 16383, 16384, 2 ** 32, 2 ** 64 - 1]
+    checks.append(('varints round trip',
+                   main.unpack_varints(main.pack_varints(values)).tolist() ==
+                   values))
+
+    registry = main.BLOCKS
+    main.BLOCKS = main.BlockRegistry()
+    try:
+        stone = main.BLOCKS.register('stone', (1, 0))
+        grass = main.BLOCKS.register('grass', (0, 0))
+        target = main.Model(headless=True)
+        target.import_schematic(io.BytesIO(files[True]), box[:3])
+        renumbered = main.numpy.zeros(len(registry) + 1,
+                                       dtype=main.numpy.uint8)
+        renumbered[registry.names['stone'] + 1] = stone + 1
+        renumbered[registry.names['grass'] + 1] = grass + 1
+        checks.append(('block types are matched by name',
+                       (target.copy_region(*box).blocks ==
+                        renumbered[blocks]).all()))
+        main.BLOCKS.register('glass', (2, 0), transparent=True)
+        f = io.BytesIO()
+        target.export_schematic(f, 0, 60, 0, 3, 63, 3)
+        glass = f.getvalue()
+        target.close()
+    finally:
+        main.BLOCKS = registry
+
+    target = flat_model()
+    before = target.copy_region(*box).blocks
+    newer = bytearray(files[True])
+    newer[8] = main.Schematic.VERSION + 1
+    for name, data in (('unknown block types are refused', glass),
+                       ('newer versions are refused', bytes(newer)),
+                       ('a truncated file changes nothing',
+                        files[True][:len(files[True]) // 2])):
+        try:
+            target.import_schematic(io.BytesIO(data), box[:3])
+            ok = False
+        except ValueError:
+            ok = (target.copy_region(*box).blocks == before).all()
+        checks.append((name, ok))
+    target.close()
+    source.close()
+    for name, ok in checks:
+        print('  %-40s %s' % (name, check(ok)))
+
+
+def stream(model, sector, direction=(1.0, 0.0)):
+    """ Move `model` to `sector`, looking along `direction`, and process
+    its queue one frame at a time until every sector is shown. Return the
+    sectors in the order they were uploaded.
+
+    """
+    model.direction = direction
+    model.change_sectors(model.center, sector)
+    order = []
+    while model.queue or model._pending:
+        model.process_queue()
+        order.extend(s for s in model.resident if s not in order)
+        time.sleep(0.002)
+    order.extend(s for s in model.resident if s not in order)
+    return order
+
+
+def bench_streaming():
+    """ Load order and loading time per render distance, and the bound on
+    uploaded vertices.
+
+    """
+    print('streaming:')
+    for distance in (2, 4, 8):
+        model = main.Model(headless=True)
+        model.render_distance = distance
+        start = time.perf_counter()
+        order = stream(model, (0, 0, 0))
+        elapsed = time.perf_counter() - start
+        half = len(order) // 2
+        ahead = sum(1 for x, _, _ in order[:half] if x > 0)
+        behind = sum(1 for x, _, _ in order[:half] if x < 0)
+        near = sum(math.hypot(x, z) for x, _, z in order[:10]) / 10
+        far = sum(math.hypot(x, z) for x, _, z in order[-10:]) / 10
+        print('  distance %d  %3d sectors in %.3f s, first 10 at %.1f,'
+              ' last 10 at %.1f sectors, first half %d ahead / %d behind'
+              % (distance, len(order), elapsed, near, far, ahead, behind))
+        model.close()
+
+    model = main.Model(headless=True)
+    stream(model, (0, 0, 0))
+    full = model.resident_vertices
+    bound = main.MAX_RESIDENT_VERTICES
+    main.MAX_RESIDENT_VERTICES = full // 2
+    try:
+        model = main.Model(headless=True)
+        stream(model, (0, 0, 0))
+        kept = max(math.hypot(x, z) for x, _, z in model.resident)
+        print('  bound %d vertices: %d resident in %d sectors, farthest'
+              ' kept %.1f sectors away (%d unbounded)' % (
+                  main.MAX_RESIDENT_VERTICES, model.resident_vertices,
+                  len(model.resident), kept, full))
+        model.close()
+    finally:
+        main.MAX_RESIDENT_VERTICES = bound
+
+
+def rotate(vector, angle, axis):
+    """ Rotate `vector` by `angle` degrees around the unit `axis`, as
+    glRotatef does.
+
+    """
+    c, s = math.cos(math.radians(angle)), math.sin(math.radians(angle))
+    k = axis
+    dot = sum(a * b for a, b in zip(k, vector))
+    cross = (k[1] * vector[2] - k[2] * vector[1],
+             k[2] * vector[0] - k[0] * vector[2],
+             k[0] * vector[1] - k[1] * vector[0])
+    return tuple(v * c + x * s + a * dot * (1 - c)
+                 for v, x, a in zip(vector, cross, k))
+
+
+def reference_visible(point, position, rotation, aspect, far):
+    """ Whether `point` lands inside the view volume of the matrices
+    `Window.set_3d` builds, transformed step by step.
+
+    """
+    x, y = rotation
+    eye = tuple(p - c for p, c in zip(point, position))
+    eye = rotate(eye, -y, (math.cos(math.radians(x)), 0,
+                           math.sin(math.radians(x))))
+    eye = rotate(eye, x, (0, 1, 0))
+    depth = -eye[2]
+    tan_y = math.tan(math.radians(main.FIELD_OF_VIEW) / 2)
+    return (main.NEAR_PLANE <= depth <= far and
+            abs(eye[0]) <= depth * tan_y * aspect and
+            abs(eye[1]) <= depth * tan_y)
+
+
+def bench_frustum():
+    """ Check the frustum planes against the view volume of `set_3d`, and
+    count the sectors culled around spawn.
+
+    """
+    rng = random.Random(0)
+    aspect, far = 854 / 480.0, 64.0
+    wrong = tested = 0
+    for _ in range(200):
+        position = (rng.uniform(-20, 20), rng.uniform(50, 80),
+                    rng.uniform(-20, 20))
+        rotation = (rng.uniform(-360, 360), rng.uniform(-90, 90))
+        planes = main.frustum_planes(position, rotation, main.FIELD_OF_VIEW,
+                                     aspect, main.NEAR_PLANE, far)
+        for _ in range(200):
+            point = tuple(c + rng.uniform(-70, 70) for c in position)
+            inside = main.box_in_frustum(planes, point, point)
+            margin = min(nx * point[0] + ny * point[1] + nz * point[2] + d
+                         for nx, ny, nz, d in planes)
+            if abs(margin) < 1e-6:
+                continue
+            tested += 1
+            if inside != reference_visible(point, position, rotation,
+                                           aspect, far):
+                wrong += 1
+    print('frustum:')
+    print('  %d points, %d disagree with the set_3d matrices  %s' % (
+        tested, wrong, check(not wrong)))
+
+    model = main.Model(headless=True)
+    model.change_sectors(None, (0, 0, 0))
+    model.process_entire_queue()
+    far = main.far_plane(model.render_distance)
+    for rotation in ((0, 0), (90, -30), (225, 10), (0, -90)):
+        planes = main.frustum_planes((0.5, 66.0, 0.5), rotation,
+                                     main.FIELD_OF_VIEW, aspect,
+                                     main.NEAR_PLANE, far)
+        start = time.perf_counter()
+        model.visible(planes)
+        elapsed = time.perf_counter() - start
+        print('  looking %-10s %3d drawn / %3d culled  (%.0f us)' % (
+            rotation, model.drawn, model.culled, elapsed * 1e6))
+    # The far plane reaches the far corner of every shown sector from
+    # anywhere in the spawn sector, the outer ring is not cut off.
+    size = main.SECTOR_SIZE
+    reach = max(math.hypot(max(abs(lo[0] - x), abs(hi[0] - x)),
+                           max(abs(lo[2] - z), abs(hi[2] - z)))
+                for lo, hi in model.bounds.values()
+                for x in (-0.5, size - 0.5) for z in (-0.5, size - 0.5))
+    print('  far plane %.1f blocks, shown sectors reach %.1f  %s' % (
+        far, reach, check(reach <= far + 1e-6)))
+    model.close()
+
+
+def bench_caves():
+    """ Cave culling on hand built layouts: which sectors a camera may see
+    through air, and what that saves in drawing and meshing.
+
+    """
+    print('caves:')
+
+    def fresh():
+        model = flat_model()
+        model.change_sectors(None, (0, 0, 0))
+        model.process_entire_queue()
+        return model
+
+    def dig(model, x0, y0, z0, x1, y1, z1):
+        model.fill_region(x0, y0, z0, x1, y1, z1, None)
+
+    def around(sectors):
+        # The camera's section looks out through all of its faces, so
+        # the solid sections around it are reached too.
+        return {(x + dx, 0, z + dz) for x, _, z in sectors
+                for dx, dz in ((0, 0), (-1, 0), (1, 0), (0, -1), (0, 1))}
+
+    checks = []
+    model = fresh()
+    model.update_occlusion((0.5, 66.0, 0.5))
+    checks.append(('above ground nothing is pruned', model.pruned == 0))
+
+    # A sealed room deep in the stone.
+    dig(model, 2, 20, 2, 6, 23, 6)
+    start = time.perf_counter()
+    model.update_occlusion((4, 21.5, 4))
+    elapsed = time.perf_counter() - start
+    checks.append(('a sealed room sees only around its own sector',
+                   model.reached == around({(0, 0, 0)})))
+    print('  sealed room   %3d of %d sectors pruned  (%.1f ms cold)' % (
+        model.pruned, len(model.shown), elapsed * 1e3))
+
+    # A tunnel east to x = 40, then a shaft up to the sky.
+    dig(model, 6, 21, 4, 40, 22, 4)
+    dig(model, 40, 21, 4, 40, 64, 4)
+    start = time.perf_counter()
+    model.update_occlusion((4, 21.5, 4))
+    elapsed = time.perf_counter() - start
+    tunnel = {(x // 16, 0, 0) for x in range(0, 41)}
+    checks.append(('the tunnel and the sky beyond the shaft are reached',
+                   tunnel <= model.reached and (3, 0, 0) in model.reached))
+    checks.append(('the sky behind the room is not',
+                   (-3, 0, 0) not in model.reached))
+    print('  tunnel+shaft  %3d of %d sectors pruned  (%.1f ms)' % (
+        model.pruned, len(model.shown), elapsed * 1e3))
+
+    # Filling the shaft in seals the cave again.
+    model.fill_region(40, 60, 4, 40, 60, 4, 1)
+    model.update_occlusion((4, 21.5, 4))
+    checks.append(('sealing the shaft prunes the sky again',
+                   model.reached == tunnel | around({(0, 0, 0)})))
+
+    # Sectors shown from inside a sealed cave are not meshed until seen.
+    model.change_sectors((0, 0, 0), (1, 0, 0))
+    model.update_occlusion((4, 21.5, 4))
+    model.process_entire_queue()
+    deferred = len(model.deferred)
+    model.update_occlusion((4, 80.5, 4))
+    model.process_entire_queue()
+    checks.append(('new sectors wait until seen, then get meshed',
+                   deferred > 0 and not model.deferred and
+                   set(model.resident) == model.shown))
+    print('  %d new sectors deferred from the cave, meshed once above' %
+          deferred)
+    model.close()
+
+    for name, ok in checks:
+        print('  %-52s %s' % (name, check(ok)))
+
+
+def render_frames(indexed, greedy, frames=60):
+    """ Draw the view from spawn in an offscreen `main.Window` of a new
+    world, with sector meshes drawn indexed or as GL_QUADS batches and
+    greedy or not. Return the pixels, the seconds per frame and the bytes
+    of vertex data uploaded.
+
+    """
+    from pyglet import gl
+    settings = main.INDEXED_MESHES, main.GREEDY_MESHING
+    main.INDEXED_MESHES, main.GREEDY_MESHING = indexed, greedy
+    cwd, path = os.getcwd(), tempfile.mkdtemp()
+    os.chdir(path)
+    try:
+        window = main.Window(width=640, height=360)
+        main.setup()
+        window.on_resize(640, 360)
+        window.player.rotation = (30, -25)
+        window.update(1.0 / main.TICKS_PER_SEC)
+        window.model.process_entire_queue()
+        # Dig a hole in view, to draw rebuilt meshes too.
+        for x in range(-2, 3):
+            for y in range(60, 65):
+                for z in range(-8, -3):
+                    window.model.remove_block((x, y, z))
+        window.on_draw()
+        gl.glFinish()
+        start = time.perf_counter()
+        for _ in range(frames):
+            window.on_draw()
+        gl.glFinish()
+        elapsed = (time.perf_counter() - start) / frames
+        buffer = pyglet.image.get_buffer_manager().get_color_buffer()
+        pixels = buffer.get_image_data().get_data('RGB', 640 * 3)
+        model = window.model
+        if indexed:
+            size = model.resident_vertices * main.SectorMesh.VERTEX_SIZE + \
+                model.indices.quads * 24
+        else:
+            size = model.resident_vertices * 20
+        drawn = model.drawn
+        window.on_close()
+        pyglet.clock.unschedule(window.update)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path)
+        main.INDEXED_MESHES, main.GREEDY_MESHING = settings
+    return pixels, elapsed, size, drawn
+
+
+def bench_render():
+    """ Frame time and vertex memory of indexed sector buffers against the
+    GL_QUADS batches, and whether both draw the same picture.
+
+    """
+    from pyglet import gl
+    window = pyglet.window.Window(16, 16)
+    print('render: %s, OpenGL %s' % (gl.gl_info.get_renderer(),
+                                     gl.gl_info.get_version()))
+    window.close()
+    for greedy in (False, True):
+        results = {}
+        for indexed in (False, True):
+            results[indexed] = render_frames(indexed, greedy)
+            pixels, elapsed, size, drawn = results[indexed]
+            print('  %-8s %-7s %6.2f ms per frame, %5.2f MB of vertices'
+                  ' (%d sectors drawn)' % (
+                      'greedy' if greedy else 'culled',
+                      'indexed' if indexed else 'quads', elapsed * 1e3,
+                      size / 2.0 ** 20, drawn))
+        a, b = results[False][0], results[True][0]
+        differ = sum(1 for i in range(0, len(a), 3) if a[i:i + 3] != b[i:i + 3])
+        # The driver may split GL_QUADS along the other diagonal, which
+        # moves a few edge pixels, nothing more.
+        print('  %d of %d pixels differ  %s' % (
+            differ, len(a) // 3, check(differ <= len(a) // 3 // 1000)))
+
+
+def mesh_sectors(model, sectors):
+    """ Build the face-culled meshes of `sectors`.
+
+    """
+    for x, y, z in sectors:
+        origin = (x * main.SECTOR_SIZE, 0, z * main.SECTOR_SIZE)
+        main.build_chunk_mesh(model.world.padded((x, y, z)), origin)
+
+
+def row_faces(*block_ids):
+    """ Number of faces `build_chunk_mesh` emits for a row of blocks along
+    x, surrounded by air.
+
+    """
+    blocks = main.numpy.zeros((len(block_ids) + 2, 3, 3), dtype=main.numpy.uint8)
+    blocks[1:-1, 1, 1] = [block_id + 1 for block_id in block_ids]
+    vertices, _ = main.build_chunk_mesh(blocks, (0, 0, 0))
+    return len(vertices) // 12
+
+
+def bench_registry():
+    """ Block types registered at runtime: texture coordinates from a larger
+    atlas, faces behind transparent blocks, collision with non solid ones,
+    and the cost of meshing once a transparent block type exists.
+
+    """
+    blocks = main.BLOCKS
+    main.BLOCKS = main.BlockRegistry()
+    try:
+        main.BLOCKS.register('grass', (0, 0))
+        stone = main.BLOCKS.register('stone', (1, 0))
+        model = flat_model()
+        sectors = loaded_sectors()
+        _, opaque = timed(mesh_sectors, model, sectors)
+
+        _, register = timed(main.BLOCKS.register, 'glass', (2, 0),
+                            transparent=True)
+        glass = main.BLOCKS['glass'].id
+        model.load_atlas(None, 32)
+        flower = main.BLOCKS.register('flower', (20, 3), solid=False,
+                                      transparent=True)
+        checks = []
+        u = main.BLOCKS.uvs[stone + 1, 0, 0::2].tolist()
+        checks.append(('stone keeps its square in a 32x32 atlas',
+                       u == [1 / 32.0, 2 / 32.0, 2 / 32.0, 1 / 32.0]))
+        u, v = main.BLOCKS.uvs[flower + 1, 2, :2].tolist()
+        checks.append(('a new block uses the new squares',
+                       (u, v) == (20 / 32.0, 3 / 32.0)))
+        checks.append(('faces between opaque blocks are hidden',
+                       row_faces(stone, stone) == 10))
+        checks.append(('faces behind glass show',
+                       row_faces(stone, glass) == 11))
+        checks.append(('faces between glass blocks are hidden',
+                       row_faces(glass, glass) == 10))
+
+        ground = 64.5 + 1.25
+        model.fill_region(-2, 65, -2, 2, 65, 2, flower)
+        body = Body(model, (0.3, 100, 0.3))
+        body.tick(5 * main.TICKS_PER_SEC)
+        checks.append(('fall through flowers onto the grass',
+                       abs(body.position[1] - ground) < 1e-6))
+        model.fill_region(-2, 65, -2, 2, 65, 2, glass)
+        body = Body(model, (0.3, 100, 0.3))
+        body.tick(5 * main.TICKS_PER_SEC)
+        checks.append(('land on glass',
+                       abs(body.position[1] - ground - 1) < 1e-6))
+
+        checks.append(('blocks registered later can be picked',
+                       flower in main.Player().inventory))
+
+        model = flat_model()
+        _, transparent = timed(mesh_sectors, model, sectors)
+        count = len(main.BLOCKS)
+
+        # Block ids past what a chunk cell holds are refused, not wrapped
+        # to air.
+        full = main.BlockRegistry()
+        for i in range(main.BlockRegistry.LIMIT):
+            full.register('block %d' % i, (0, 0))
+        try:
+            full.register('one too many', (0, 0))
+            refused = False
+        except ValueError:
+            refused = len(full) == main.BlockRegistry.LIMIT
+        checks.append(('a full registry refuses new block types', refused))
+    finally:
+        main.BLOCKS = blocks
+    print('registry: %d block types' % count)
+    for name, ok in checks:
+        print('  %-44s %s' % (name, check(ok)))
+    print('  register a block type        %8.3f ms' % (register * 1e3))
+    print('  mesh %d sectors, all opaque   %8.3f s' % (len(sectors), opaque))
+    print('  mesh %d sectors, transparent  %8.3f s' % (len(sectors),
+                                                       transparent))
+
+
+def bench_simulation():
+    """ Ticks per second of the headless `Simulation`, walking and turning
+    across the default world, and the time spent in each subsystem.
+
+    """
+    simulation = main.Simulation(main.Model(headless=True))
+    player = simulation.player
+    player.strafe = [-1, 0]
+    simulation.update(0.0)
+    simulation.tick()
+    # Frame rates the fixed tick has to absorb.
+    frames = [1.0 / 144, 1.0 / 60, 1.0 / 30, 0.1]
+    count = 20000
+    start = time.perf_counter()
+    for i in range(count):
+        if i % 300 == 0:
+            # A quarter turn every 25 blocks keeps the walk on the map.
+            player.look(600, 0)
+            player.jump()
+        simulation.tick()
+    elapsed = time.perf_counter() - start
+    player.strafe = [0, 0]
+    ticks = 0
+    for i in range(4000):
+        ticks += simulation.update(frames[i % len(frames)])
+    expected = sum(frames) * 1000 * main.TICKS_PER_SEC
+    print('simulation:')
+    print('  %d ticks  %8.0f ticks/s  (%.1f us per tick)' % (
+        count, count / elapsed, elapsed / count * 1e6))
+    print('  fixed step: %d ticks for %.0f expected over mixed frame times'
+          % (ticks, expected))
+    for name, seconds in simulation.timings.items():
+        print('  %-8s %8.1f us per tick' % (
+            name, seconds / simulation.ticks * 1e6))
+    print('  player at (%.1f, %.1f, %.1f), %d sectors shown' % (
+        player.position + (len(simulation.model.shown),)))
+
+
+
+def bench_profiler():
+    """ Cost of a profiler scope, its rolling percentiles, the scopes of a
+    headless walk and the CSV and JSON dumps.
+
+    """
+    profiler = main.Profiler(samples=600)
+    scope = profiler.scope('empty')
+    count = 100000
+    start = time.perf_counter()
+    for _ in range(count):
+        with scope:
+            pass
+    elapsed = time.perf_counter() - start
+    print('profiler:')
+    print('  %.2f us per scope' % (elapsed / count * 1e6))
+
+    profiler = main.Profiler(samples=600)
+    for ms in range(1, 1001):
+        profiler.record('ramp', ms / 1e3)
+    stat = profiler.stats()['ramp']
+    kept = [ms / 1e3 for ms in range(401, 1001)]
+    checks = [
+        ('percentiles of the latest samples only',
+         stat['count'] == 1000 and
+         [stat[key] for key in ('p50', 'p95', 'p99')] ==
+         main.numpy.percentile(kept, (50, 95, 99)).tolist()),
+        ('history oldest first', profiler.history('ramp') == kept),
+    ]
+
+    main.PROFILER.reset()
+    simulation = main.Simulation(main.Model(headless=True))
+    simulation.player.strafe = [-1, 0]
+    for i in range(2000):
+        if i % 300 == 0:
+            simulation.player.look(600, 0)
+        main.PROFILER.frame()
+        simulation.update(1.0 / main.TICKS_PER_SEC)
+    stats = main.PROFILER.stats()
+    print('  %-16s %8s %8s %8s %8s' % ('2000 frames, ms', 'p50', 'p95',
+                                       'p99', 'max'))
+    for name, stat in stats.items():
+        print('  %-16s %8.3f %8.3f %8.3f %8.3f' % (
+            name, stat['p50'] * 1e3, stat['p95'] * 1e3, stat['p99'] * 1e3,
+            stat['max'] * 1e3))
+    checks.append(('the game loop scopes are recorded',
+                   {'update', 'tick', 'player', 'collide', 'process_queue',
+                    'change_sectors', 'frame'} <= set(stats)))
+
+    directory = tempfile.mkdtemp()
+    try:
+        counters = simulation.model.counters()
+        path = os.path.join(directory, 'profile')
+        main.PROFILER.dump(path + '.json', counters)
+        main.PROFILER.dump(path + '.csv', counters)
+        with open(path + '.json') as f:
+            dumped = json.load(f)
+        with open(path + '.csv', newline='') as f:
+            rows = {row['name']: row for row in csv.DictReader(f)}
+        checks.append(('the JSON dump holds the same numbers',
+                       dumped['counters'] == counters and
+                       all(abs(dumped['scopes'][name]['p99_ms'] -
+                               stat['p99'] * 1e3) < 1e-9
+                           for name, stat in stats.items()) and
+                       len(dumped['frames_ms']) == 600))
+        checks.append(('the CSV dump holds the same numbers',
+                       all(abs(float(rows[name]['p95_ms']) -
+                               stat['p95'] * 1e3) < 1e-9
+                           for name, stat in stats.items()) and
+                       int(rows['queue']['value']) == counters['queue']))
+    finally:
+        shutil.rmtree(directory)
+        simulation.model.close()
+    for name, ok in checks:
+        print('  %-40s %s' % (name, check(ok)))
+
+
+BENCHMARKS = {
+    'storage': bench_storage,
+    'generate': bench_generate,
+    'pool': bench_pool,
+    'mesh': bench_mesh,
+    'greedy': bench_greedy,
+    'workers': bench_workers,
+    'save': bench_save,
+    'autosave': bench_autosave,
+    'raycast': bench_raycast,
+    'physics': bench_physics,
+    'sectors': bench_sectors,
+    'explosion': bench_explosion,
+    'batch': bench_batch,
+    'regions': bench_regions,
+    'schematic': bench_schematic,
+    'streaming': bench_streaming,
+    'frustum': bench_frustum,
+    'caves': bench_caves,
+    'registry': bench_registry,
+    'simulation': bench_simulation,
+    'profiler': bench_profiler,
+    'render': bench_render,
+}
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or [name for name in BENCHMARKS
+                                 if name != 'render']:
+        BENCHMARKS[name]()
+    if failures:
+        print('%d checks failed' % failures)
+        sys.exit(1)
@@ -1,14 +1,45 @@
 # 除法精度更新(对于Py2)
 from __future__ import division
 
+import argparse
 import configparser
+import csv
+import ctypes
+import functools
+import heapq
+import json
 import math
+import mmap
+import multiprocessing
 import os
 import pathlib
+import queue
 import random
+import struct
 import sys
+import threading
 import time
+import traceback
+import zlib
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy
+import pyglet
+
+# Generation workers (see GenerationPool) and the command line tools (see
+# main()) never draw, so they must not open pyglet's shadow window: there may
+# be no display at all. Workers started from `python main.py` run this
+# script as __mp_main__, workers of a frozen build (PyInstaller) run it as
+# __main__ with --multiprocessing-fork, see freeze_support().
+if multiprocessing.parent_process() is not None or \
+        __name__ == '__mp_main__' or \
+        '--multiprocessing-fork' in sys.argv or \
+        (__name__ == '__main__' and sys.argv[1:2] == ['pregen']):
+    pyglet.options['shadow_window'] = False
 
 from pyglet import image
 from pyglet.gl import *
@@ -52,10 +83,73 @@ TERMINAL_VELOCITY = 50
 # 玩家模型高度
 PLAYER_HEIGHT = 2
 
-# WORLD_WIDTH
-# 世界宽度
+# Height of the world, blocks may be placed at 0 <= y < WORLD_HEIGHT.
+# 世界高度
+WORLD_HEIGHT = 256
+
+# Value stored in chunk arrays for empty cells. Block ids are stored shifted
+# by one so that id 0 (GRASS) stays distinguishable from air.
+# 空气在区块数组中的值, 方块ID在存储时加1
+AIR = 0
+
+# WORLD_WIDTH: half the side of the flat world, see FlatGenerator. Other
+# terrain is endless.
+# 世界宽度(平坦地形)
 WORLD_WIDTH = 128
 
+# Saved worlds are split into region files of REGION_SIZE x REGION_SIZE sectors.
+# 每个区域文件包含的区块数(边长)
+REGION_SIZE = 32
+
+# Directory the world is saved to.
+# 存档目录
+WORLD_PATH = 'world'
+
+# Terrain generator of new worlds, a key of GENERATORS, and its seed (None
+# for a random one). Saved worlds keep the generator and seed they were
+# created with.
+# 新世界的地形生成器与种子
+WORLD_GENERATOR = 'noise'
+WORLD_SEED = None
+
+# Radius, in sectors, of the circle of sectors shown around the player. The
+# far clipping plane is set just beyond it, see far_plane().
+# 渲染距离(区块)
+RENDER_DISTANCE = 4
+
+# Vertical field of view of the camera, in degrees.
+# 视野角度
+FIELD_OF_VIEW = 65.0
+
+# Distance from the camera to the near clipping plane.
+NEAR_PLANE = 0.1
+
+# Upper bound on the number of vertices uploaded for drawing at once (16
+# bytes each, 20 without INDEXED_MESHES). Past it the sectors farthest from
+# the player are hidden.
+# 显存中顶点数量上限
+MAX_RESIDENT_VERTICES = 2000000
+
+# Seconds between two incremental saves of the edited chunks.
+# 自动保存间隔(秒)
+AUTOSAVE_INTERVAL = 10.0
+
+# Seconds between two appends of the recorded edits to the autosave journal.
+# A crash loses at most the edits of this last second.
+# 编辑日志写入间隔(秒)
+JOURNAL_INTERVAL = 1.0
+
+# Whether the scopes of the game loop are timed for the F3 screen, see
+# Profiler. Each timed call costs a microsecond or two.
+# 是否启用性能分析
+PROFILING = True
+
+# Number of latest timings each profiler scope keeps its percentiles over,
+# about ten seconds of frames, see Profiler. Dumps go to PROFILE_PATH.
+# 性能分析器保留的最近样本数, 以及导出目录
+PROFILE_SAMPLES = 600
+PROFILE_PATH = 'profiles'
+
 # Py2 Py3 版本兼容
 if sys.version_info[0] >= 3:
     xrange = range
@@ -118,13 +212,13 @@ def tex_coord(x, y, n=4):
     return dx, dy, dx + m, dy, dx + m, dy + m, dx, dy + m
 
 
-def tex_coords(top, bottom, side):
+def tex_coords(top, bottom, side, n=4):
     """ Return a list of the texture squares for the top, bottom and side.
         返回材质列表
     """
-    top = tex_coord(*top)
-    bottom = tex_coord(*bottom)
-    side = tex_coord(*side)
+    top = tex_coord(*top, n=n)
+    bottom = tex_coord(*bottom, n=n)
+    side = tex_coord(*side, n=n)
     result = []
     result.extend(top)
     result.extend(bottom)
@@ -135,16 +229,8 @@ def tex_coords(top, bottom, side):
 # 材质包路径
 TEXTURE_PATH = get_resource_path('terrain.png')
 
-# 定义方块材质
-GRASS = tex_coords((0, 0), (0, 0), (0, 0))
-# SAND = tex_coords((1, 1), (1, 1), (1, 1))
-# BRICK = tex_coords((2, 0), (2, 0), (2, 0))
-STONE = tex_coords((1, 0), (1, 0), (1, 0))
-
-BLOCKS = [
-    GRASS,
-    STONE
-]
+# Number of texture squares along each side of TEXTURE_PATH, see tex_coord().
+TEXTURE_TILES = 16
 
 FACES = [
     (0, 1, 0),
@@ -156,6 +242,190 @@ FACES = [
 ]
 
 
+class Material(object):
+    """ A block type: its name, properties and texture squares.
+    方块类型
+
+    """
+
+    __slots__ = ('id', 'name', 'squares', 'solid', 'transparent')
+
+    def __init__(self, id, name, squares, solid=True, transparent=False):
+        self.id = id
+        self.name = name
+        # The (column, row) texture square of each face, in FACES order.
+        self.squares = squares
+        # Whether the player collides with the block.
+        self.solid = solid
+        # Whether the faces behind the block show through it.
+        self.transparent = transparent
+
+    def __repr__(self):
+        return '<%s %d %r>' % (type(self).__name__, self.id, self.name)
+
+
+class BlockRegistry(object):
+    """ The block types, indexed by block id and by name. Everything the
+    mesher needs is kept in arrays indexed by the value chunk arrays store,
+    `block_id + 1` (0 for AIR), so it can look whole chunks up at once.
+    方块注册表
+
+    """
+
+    # Chunks store `block_id + 1` in a uint8 and 0 for air, so 255 block
+    # types fit.
+    LIMIT = 255
+
+    def __init__(self, size=TEXTURE_TILES):
+        # Number of texture squares along each side of the texture atlas.
+        self.size = size
+        self.materials = []
+        self.names = {}
+        # Texture coordinates of every face, float32 [value, face, 8].
+        self.uvs = numpy.zeros((1, len(FACES), 8), dtype=numpy.float32)
+        # Index into `tiles` of the texture square of every face.
+        self.face_tiles = numpy.full((1, len(FACES)), -1, dtype=numpy.intp)
+        # Whether the block hides the faces behind it.
+        self.opaque = numpy.zeros(1, dtype=bool)
+        # Whether the player collides with block id i, as a list for lookups
+        # of single blocks.
+        self.solid = []
+        # The (column, row) of every texture square in use. Greedy meshes
+        # are drawn with one repeating texture per square.
+        self.tiles = []
+
+    def __len__(self):
+        return len(self.materials)
+
+    def __iter__(self):
+        return iter(self.materials)
+
+    def __getitem__(self, key):
+        """ Return the Material of a block id or name.
+
+        """
+        if isinstance(key, str):
+            key = self.names[key]
+        return self.materials[key]
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def register(self, name, top, bottom=None, side=None, solid=True,
+                 transparent=False):
+        """ Add a block type and return its block id. Can be called at any
+        time, blocks already placed keep their ids.
+        注册方块类型
+
+        Parameters
+        ----------
+        name : str
+            Unique name of the block type.
+        top, bottom, side : tuple of len 2
+            The (column, row) texture squares of the faces, as for
+            `tex_coords()`. `bottom` and `side` default to `top`.
+        solid : bool
+            Whether the player collides with the block.
+        transparent : bool
+            Whether the faces behind the block show through it.
+
+        Returns
+        -------
+        block_id : int
+
+        Raises ValueError if `name` is taken, a texture square is outside the
+        atlas or the registry holds LIMIT block types already.
+
+        """
+        if name in self.names:
+            raise ValueError('block %r is already registered' % name)
+        if len(self.materials) >= self.LIMIT:
+            raise ValueError('no room for block %r, chunks hold %d block'
+                             ' types' % (name, self.LIMIT))
+        bottom = top if bottom is None else bottom
+        side = top if side is None else side
+        squares = (top, bottom) + (side,) * 4
+        for column, row in squares:
+            if not (0 <= column < self.size and 0 <= row < self.size):
+                raise ValueError('texture square %r is outside the atlas'
+                                 % ((column, row),))
+        material = Material(len(self.materials), name, squares, solid,
+                            transparent)
+        self.materials.append(material)
+        self.names[name] = material.id
+        self._pack()
+        return material.id
+
+    def resize(self, size):
+        """ Switch to an atlas of `size` squares per side, its squares at the
+        same columns and rows as before.
+
+        """
+        self.size = size
+        self._pack()
+
+    def _pack(self):
+        """ Rebuild the lookup arrays. The new arrays replace the old ones
+        instead of being written in place, as mesh workers may be reading.
+
+        """
+        uvs = numpy.zeros((len(self.materials) + 1, len(FACES), 8),
+                          dtype=numpy.float32)
+        face_tiles = numpy.full((len(self.materials) + 1, len(FACES)), -1,
+                                dtype=numpy.intp)
+        opaque = numpy.zeros(len(self.materials) + 1, dtype=bool)
+        for material in self.materials:
+            value = material.id + 1
+            top, bottom, side = material.squares[:3]
+            uvs[value] = numpy.reshape(
+                tex_coords(top, bottom, side, n=self.size / 4.0),
+                (len(FACES), 8))
+            for face, square in enumerate(material.squares):
+                if square not in self.tiles:
+                    self.tiles.append(square)
+                face_tiles[value, face] = self.tiles.index(square)
+            opaque[value] = not material.transparent
+        self.uvs, self.face_tiles, self.opaque = uvs, face_tiles, opaque
+        self.solid = [material.solid for material in self.materials]
+
+
+# 定义方块材质
+BLOCKS = BlockRegistry()
+GRASS = BLOCKS.register('grass', (0, 0))
+# SAND = BLOCKS.register('sand', (1, 1))
+# BRICK = BLOCKS.register('brick', (2, 0))
+STONE = BLOCKS.register('stone', (1, 0))
+
+# The corners of each face of a unit cube around the origin, in FACES order.
+# 按面索引的顶点偏移, 供区块网格生成使用
+FACE_VERTICES = numpy.array(cube_vertices(0, 0, 0, 0.5),
+                            dtype=numpy.float32).reshape(len(FACES), 4, 3)
+
+# Merge coplanar faces of the same texture into larger quads when meshing.
+# 贪心网格合并开关
+GREEDY_MESHING = False
+
+# Draw sector meshes as indexed triangles from vertex buffers of small
+# integer positions (see SectorMesh) rather than as GL_QUADS vertex lists.
+# 使用索引三角形与顶点缓冲绘制区块
+INDEXED_MESHES = True
+
+# Number of threads building sector meshes in the background.
+# 后台生成网格的线程数
+MESH_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# Number of sector meshes kept after their sector is hidden, so showing it
+# again does not remesh it unless its blocks changed.
+# 缓存的区块网格数量
+MESH_CACHE_SIZE = 512
+
+# Number of worker processes generating terrain, see GenerationPool. With 0
+# chunks are generated on the main thread when first shown, which is faster
+# than a pool on a single core.
+# 后台生成地形的进程数
+GENERATION_WORKERS = (os.cpu_count() or 1) - 1
+
+
 def normalize(position, ndigits=None):
     """ Accepts `position` of arbitrary precision and returns the block
     containing that position.
@@ -196,366 +466,3660 @@ def sectorize(position):
     return (x, 0, z)
 
 
-class Model(object):
+def region_sectors(x0, z0, x1, z1):
+    """ Return the sectors overlapping the columns x0..x1, z0..z1
+    (inclusive).
+    返回与区域重叠的区块
 
-    def __init__(self):
+    """
+    return [(sx, 0, sz)
+            for sx in xrange(x0 // SECTOR_SIZE, x1 // SECTOR_SIZE + 1)
+            for sz in xrange(z0 // SECTOR_SIZE, z1 // SECTOR_SIZE + 1)]
 
-        # A Batch is a collection of vertex lists for batched rendering.
-        self.batch = pyglet.graphics.Batch()
 
-        # A TextureGroup manages an OpenGL texture.
-        # 定义材质表
-        self.group = TextureGroup(image.load(TEXTURE_PATH).get_texture())
+_SECTOR_OFFSETS = {}
+_SECTOR_DELTAS = {}
+_FAR_PLANES = {}
 
-        # A mapping from position to the texture of the block at that position.
-        # This defines all the blocks that are currently in the world.
-        # 存档数据
-        self.world = {}
 
-        # Same mapping as `world` but only contains blocks that are shown.
-        # 方块渲染优化: 可视的方块
-        self.shown = {}
+def far_plane(pad):
+    """ Return the distance of the far clipping plane for a render distance
+    of `pad` sectors: the farthest corner of the sectors of
+    `sector_offsets(pad)`, seen from anywhere in the player's sector.
+    Computed once per `pad`.
+    返回远裁剪面距离
 
-        # Mapping from position to a pyglet `VertextList` for all shown blocks.
-        self._shown = {}
+    """
+    far = _FAR_PLANES.get(pad)
+    if far is None:
+        far = _FAR_PLANES[pad] = SECTOR_SIZE * max(
+            math.hypot(abs(dx) + 1, abs(dz) + 1)
+            for dx, _, dz in sector_offsets(pad))
+    return far
 
-        # Mapping from sector to a list of positions inside that sector.
-        self.sectors = {}
-
-        # Simple function queue implementation. The queue is populated with
-        # _show_block() and _hide_block() calls
-        self.queue = deque()
-
-        self._initialize()
-
-    def _initialize(self):
-        """ Initialize the world by placing all the blocks.
-        初始化世界
-        TODO
-
-        """
-        # 世界长宽的一半
-        # n = 64  # 1/2 width and height of world(deprecated)
-        s = 1  # step size
-        # y = 0  # initial y height 初始y坐标
-        # for x in xrange(-n, n + 1, s):
-        #     for z in xrange(-n, n + 1, s):
-        #         # create a layer stone an grass everywhere.
-        #         # 创建地基
-        #         self.add_block((x, y - 2, z), GRASS, immediate=False)
-        #         self.add_block((x, y - 3, z), STONE, immediate=False)
-        #         # if x in (-n, n) or z in (-n, n):
-        #         #    # create outer walls.
-        #         #    for dy in xrange(-2, 3):
-        #         #         self.add_block((x, y + dy, z), STONE, immediate=False)
-        for x in xrange(-WORLD_WIDTH, WORLD_WIDTH + 1, s):
-            for z in xrange(-WORLD_WIDTH, WORLD_WIDTH + 1, s):
-                # Add STONE LAYER
-                for y in xrange(0, 64, s):
-                    self.add_block((x, y, z), 1, immediate=False)
-                self.add_block((x, 64, z), 0, immediate=False)
-
-
-        # generate the hills randomly
-        # 随机生成山丘地形
-        # o = n - 10
-        # for _ in xrange(120):
-        #     a = random.randint(-o, o)  # x position of the hill
-        #     b = random.randint(-o, o)  # z position of the hill
-        #     c = -1  # base of the hill
-        #     h = random.randint(1, 6)  # height of the hill
-        #     s = random.randint(4, 8)  # 2 * s is the side length of the hill
-        #     d = 1  # how quickly to taper off the hills
-        #     t = random.choice([GRASS, SAND, BRICK])
-        #     for y in xrange(c, c + h):
-        #         for x in xrange(a - s, a + s + 1):
-        #             for z in xrange(b - s, b + s + 1):
-        #                 if (x - a) ** 2 + (z - b) ** 2 > (s + 1) ** 2:
-        #                     continue
-        #                 if (x - 0) ** 2 + (z - 0) ** 2 < 5 ** 2:
-        #                     continue
-        #                 self.add_block((x, y, z), t, immediate=False)
-        #         s -= d  # decrement side length so hills taper off
 
-    def hit_test(self, position, vector, max_distance=8):
-        """ Line of sight search from current position. If a block is
-        intersected it is returned, along with the block previously in the line
-        of sight. If no block is found, return None, None.
-        测试能都触碰到方块
-        通过连线, 最远8格
+def sector_offsets(pad):
+    """ Return the (dx, 0, dz) offsets of the sectors kept shown around the
+    player's sector: a circle of radius `pad` + 1. Computed once per `pad`.
+    返回以玩家区块为中心的圆形区块偏移(按pad缓存)
 
-        Parameters
-        ----------
-        position : tuple of len 3
-            The (x, y, z) position to check visibility from.
-        vector : tuple of len 3
-            The line of sight vector.
-        max_distance : int
-            How many blocks away to search for a hit.
+    """
+    offsets = _SECTOR_OFFSETS.get(pad)
+    if offsets is None:
+        offsets = _SECTOR_OFFSETS[pad] = frozenset(
+            (dx, 0, dz)
+            for dx in xrange(-pad, pad + 1) for dz in xrange(-pad, pad + 1)
+            if dx ** 2 + dz ** 2 <= (pad + 1) ** 2)
+    return offsets
+
+
+def sector_deltas(pad, move):
+    """ Return `(show, hide)` for a player moving by `move` sectors: the
+    offsets, from the new sector, of the sectors entering the circle of
+    `sector_offsets(pad)`, and the offsets, from the old sector, of those
+    leaving it. Computed once per `pad` and `move`.
+    返回玩家移动`move`个区块时需要显示和隐藏的区块偏移(缓存)
 
-        """
-        m = 8
-        x, y, z = position
-        dx, dy, dz = vector
-        previous = None
-        for _ in xrange(max_distance * m):
-            key = normalize((x, y, z))
-            if key != previous and key in self.world:
-                return key, previous
-            previous = key
-            x, y, z = x + dx / m, y + dy / m, z + dz / m
-        return None, None
+    """
+    mx, _, mz = move
+    if max(abs(mx), abs(mz)) > 2 * pad + 1:
+        # The circles do not overlap, e.g. after a respawn.
+        offsets = sector_offsets(pad)
+        return offsets, offsets
+    key = (pad, mx, mz)
+    deltas = _SECTOR_DELTAS.get(key)
+    if deltas is None:
+        offsets = sector_offsets(pad)
+        show = offsets - {(dx - mx, 0, dz - mz) for dx, _, dz in offsets}
+        hide = offsets - {(dx + mx, 0, dz + mz) for dx, _, dz in offsets}
+        deltas = _SECTOR_DELTAS[key] = (tuple(show), tuple(hide))
+    return deltas
+
+
+def sweep_box(world, lo, hi, motion):
+    """ Move the axis aligned box from `lo` to `hi` by `motion`, one axis at
+    a time (y, then x, then z). Along each axis the box stops against the
+    first block it would run into, testing only the cells between its
+    leading face and where the face ends up that the box overlaps on the
+    other two axes. Nothing is skipped however fast the box moves.
+    扫掠碰撞检测: 逐轴移动碰撞箱, 在第一个阻挡的方块前停下
 
-    def exposed(self, position):
-        """ Returns False is given `position` is surrounded on all 6 sides by
-        blocks, True otherwise.
-        检查方块是否被完全遮蔽
+    Parameters
+    ----------
+    world : ChunkedWorld or dict
+        The blocks to collide with.
+    lo, hi : tuple of len 3
+        The minimum and maximum corners of the box.
+    motion : tuple of len 3
+        The (dx, dy, dz) to move by.
 
-        """
-        x, y, z = position
-        for dx, dy, dz in FACES:
-            if (x + dx, y + dy, z + dz) not in self.world:
-                return True
-        return False
+    Returns
+    -------
+    moved : tuple of len 3
+        How far the box actually moved along each axis.
+    hit : tuple of len 3
+        For each axis, the direction (1 or -1) in which the box was stopped
+        by a block, or 0.
 
-    def add_block(self, position, block_id, immediate=True):
-        """ Add a block with the given `texture` and `position` to the world.
-        在指定的坐标上添加指定材质的方块
+    """
+    eps = 1e-6
+    solid = BLOCKS.solid
+    lo, hi = list(lo), list(hi)
+    moved = [0.0, 0.0, 0.0]
+    hit = [0, 0, 0]
+    floor, ceil = math.floor, math.ceil
+    for axis in (1, 0, 2):
+        d = motion[axis]
+        if not d:
+            continue
+        u, v = [i for i in (0, 1, 2) if i != axis]
+        # Cells overlapped on the other axes, cell c spans [c - .5, c + .5).
+        us = xrange(floor(lo[u] - 0.5 + eps) + 1, ceil(hi[u] + 0.5 - eps))
+        vs = xrange(floor(lo[v] - 0.5 + eps) + 1, ceil(hi[v] + 0.5 - eps))
+        if d > 0:
+            layers = xrange(ceil(hi[axis] + 0.5 - eps),
+                            floor(hi[axis] + d + 0.5) + 1)
+        else:
+            layers = xrange(floor(lo[axis] - 0.5 + eps),
+                            ceil(lo[axis] + d - 0.5) - 1, -1)
+        cell = [0, 0, 0]
+        for c in layers:
+            cell[axis] = c
+            blocked = False
+            for a in us:
+                cell[u] = a
+                for b in vs:
+                    cell[v] = b
+                    key = tuple(cell)
+                    if key in world and solid[world[key]]:
+                        blocked = True
+                        break
+                if blocked:
+                    break
+            if blocked:
+                if d > 0:
+                    d = max(min(d, c - 0.5 - hi[axis]), 0.0)
+                else:
+                    d = min(max(d, c + 0.5 - lo[axis]), 0.0)
+                hit[axis] = 1 if motion[axis] > 0 else -1
+                break
+        lo[axis] += d
+        hi[axis] += d
+        moved[axis] = d
+    return tuple(moved), tuple(hit)
+
+
+def frustum_planes(position, rotation, fov, aspect, near, far):
+    """ Return the six planes bounding what the camera set up by
+    `Window.set_3d()` sees, as `(nx, ny, nz, d)` tuples whose normals point
+    inwards: a point p is on the visible side when n . p + d >= 0.
+    计算视锥体的六个平面
 
-        Parameters
-        ----------
-        position : tuple of len 3
-            The (x, y, z) position of the block to add.
-            添加方块的坐标
-        block_id : list of len 3
-            The coordinates of the texture squares. Use `tex_coords()` to
-            generate.
-            贴图在材质(TEXTURE_PATH)上的坐标(由tex_coords()生成)
-            The Block ID to add to world, index of BLOCKS
-            方块ID, 为BLOCKS的索引
-        immediate : bool
-            Whether or not to draw the block immediately.
-            是否立即绘制方块
+    Parameters
+    ----------
+    position : tuple of len 3
+        The (x, y, z) position of the camera.
+    rotation : tuple of len 2
+        The (horizontal, vertical) rotation of the camera in degrees, as
+        `Player.rotation`.
+    fov : float
+        The vertical field of view in degrees.
+    aspect : float
+        Width over height of the viewport.
+    near, far : float
+        Distances to the near and far clipping planes.
 
-        """
-        if position in self.world:
-            self.remove_block(position, immediate)
-        # Check position
-        # 检查坐标
-        if (position[1] < 0) or (position[0] > WORLD_WIDTH) or (position[2] > WORLD_WIDTH) or (position[0] < -WORLD_WIDTH) or (position[2] < -WORLD_WIDTH):
-            return
-        self.world[position] = block_id
-        self.sectors.setdefault(sectorize(position), []).append(position)
-        if immediate:
-            if self.exposed(position):
-                self.show_block(position)
-            self.check_neighbors(position)
+    Returns
+    -------
+    planes : tuple of 6 tuples of len 4
 
-    def remove_block(self, position, immediate=True):
-        """ Remove the block at the given `position`.
-        移除在指定目标上的方块
+    """
+    x, y = rotation
+    m = math.cos(math.radians(y))
+    forward = (math.cos(math.radians(x - 90)) * m, math.sin(math.radians(y)),
+               math.sin(math.radians(x - 90)) * m)
+    right = (math.cos(math.radians(x)), 0.0, math.sin(math.radians(x)))
+    up = (right[1] * forward[2] - right[2] * forward[1],
+          right[2] * forward[0] - right[0] * forward[2],
+          right[0] * forward[1] - right[1] * forward[0])
+    tan_y = math.tan(math.radians(fov) / 2)
+    tan_x = tan_y * aspect
+    normals = (
+        forward,
+        tuple(-f for f in forward),
+        tuple(tan_x * f - r for f, r in zip(forward, right)),
+        tuple(tan_x * f + r for f, r in zip(forward, right)),
+        tuple(tan_y * f - u for f, u in zip(forward, up)),
+        tuple(tan_y * f + u for f, u in zip(forward, up)),
+    )
+    offsets = (-near, far, 0.0, 0.0, 0.0, 0.0)
+    planes = []
+    for (nx, ny, nz), offset in zip(normals, offsets):
+        d = -(nx * position[0] + ny * position[1] + nz * position[2])
+        planes.append((nx, ny, nz, d + offset))
+    return tuple(planes)
+
+
+def box_in_frustum(planes, lo, hi):
+    """ Return False if the axis aligned box from `lo` to `hi` is entirely
+    outside one of `planes`, as returned by `frustum_planes()`, and True
+    otherwise. Boxes near a corner of the frustum may pass without being
+    visible, but no visible box is ever rejected.
+    判断包围盒是否可能在视锥体内
 
-        Parameters
-        ----------
-        position : tuple of len 3
-            The (x, y, z) position of the block to remove.
-            要删除的方块的坐标
-        immediate : bool
-            Whether or not to immediately remove block from canvas.
-            是否立即移除
+    """
+    for nx, ny, nz, d in planes:
+        # The corner of the box farthest along the plane's normal.
+        px = hi[0] if nx >= 0 else lo[0]
+        py = hi[1] if ny >= 0 else lo[1]
+        pz = hi[2] if nz >= 0 else lo[2]
+        if nx * px + ny * py + nz * pz + d < 0:
+            return False
+    return True
 
-        """
-        del self.world[position]
-        self.sectors[sectorize(position)].remove(position)
-        if immediate:
-            if position in self.shown:
-                self.hide_block(position)
-            self.check_neighbors(position)
 
-    def check_neighbors(self, position):
-        """ Check all blocks surrounding `position` and ensure their visual
-        state is current. This means hiding blocks that are not exposed and
-        ensuring that all exposed blocks are shown. Usually used after a block
-        is added or removed.
-        检查方块是否被遮挡, 如果被完全遮挡就不再渲染这个方块(hide_block()), 否则渲染
-        这个方块(show_block()), 一般用于添加或删除方块之后
+def _see_through(blocks):
+    """ Return where the faces behind `blocks` show, as a bool array the
+    shape of `blocks`, and whether any of them is a transparent block. The
+    faces between two blocks of the same transparent type are still hidden.
 
-        """
-        x, y, z = position
-        for dx, dy, dz in FACES:
-            key = (x + dx, y + dy, z + dz)
-            if key not in self.world:
+    """
+    if BLOCKS.opaque[1:].all():
+        return blocks == AIR, False
+    return ~BLOCKS.opaque[blocks], True
+
+
+def build_chunk_mesh(blocks, origin):
+    """ Build the mesh of one chunk, emitting only the faces whose
+    neighbour in FACES is air or a different transparent block. This is a
+    pure function so it can run without a GL context.
+    生成区块网格, 只输出与空气(或透明方块)相邻的面
+
+    Parameters
+    ----------
+    blocks : numpy array
+        The chunk's block array padded by one cell on every side with the
+        neighbouring cells, as returned by `ChunkedWorld.padded()`.
+    origin : tuple of len 3
+        World position of the first unpadded cell.
+
+    Returns
+    -------
+    vertices : numpy float32 array
+        Flat `GL_QUADS` vertex positions, 12 floats per face.
+    tex_coords : numpy float32 array
+        Flat texture coordinates, 8 floats per face.
+
+    """
+    uvs = BLOCKS.uvs
+    clear, transparent = _see_through(blocks)
+    inner = blocks[1:-1, 1:-1, 1:-1]
+    filled = inner != AIR
+    nx, ny, nz = inner.shape
+    ox, oy, oz = origin
+    vertices, tex_coords = [], []
+    for face, (dx, dy, dz) in enumerate(FACES):
+        window = (slice(1 + dx, 1 + dx + nx), slice(1 + dy, 1 + dy + ny),
+                  slice(1 + dz, 1 + dz + nz))
+        shown = filled & clear[window]
+        if transparent:
+            shown &= blocks[window] != inner
+        xs, ys, zs = numpy.nonzero(shown)
+        if not len(xs):
+            continue
+        centres = numpy.stack((xs + ox, ys + oy, zs + oz), axis=1)
+        corners = centres[:, None, :] + FACE_VERTICES[face]
+        vertices.append(corners.astype(numpy.float32).reshape(-1))
+        tex_coords.append(uvs[inner[xs, ys, zs], face].reshape(-1))
+    if not vertices:
+        empty = numpy.zeros(0, dtype=numpy.float32)
+        return empty, empty
+    return numpy.concatenate(vertices), numpy.concatenate(tex_coords)
+
+
+def _greedy_rectangles(keys):
+    """ Cover the non-zero cells of the 2d list `keys` with rectangles of
+    equal keys, greedily growing each one along the row and then down.
+    Yields `(i, j, height, width, key)`.
+
+    """
+    rows, cols = len(keys), len(keys[0])
+    done = [[False] * cols for _ in xrange(rows)]
+    for i in xrange(rows):
+        row = keys[i]
+        for j in xrange(cols):
+            key = row[j]
+            if not key or done[i][j]:
                 continue
-            if self.exposed(key):
-                if key not in self.shown:
-                    self.show_block(key)
-            else:
-                if key in self.shown:
-                    self.hide_block(key)
+            w = 1
+            while j + w < cols and row[j + w] == key and not done[i][j + w]:
+                w += 1
+            h = 1
+            while i + h < rows and all(
+                    keys[i + h][b] == key and not done[i + h][b]
+                    for b in xrange(j, j + w)):
+                h += 1
+            for a in xrange(i, i + h):
+                done[a][j:j + w] = [True] * w
+            yield i, j, h, w, key
+
+
+def _face_axes(face):
+    """ Return `(s, t)`, the axes along which the texture's s and t
+    coordinates run on `face`, taken from the corner order of FACE_VERTICES.
 
-    def show_block(self, position, immediate=True):
-        """ Show the block at the given `position`. This method assumes the
-        block has already been added with add_block()
-        展示给定位置的方块(已使用add_block方法添加的)
+    """
+    corners = FACE_VERTICES[face]
+    s = int(numpy.flatnonzero(corners[1] != corners[0])[0])
+    t = int(numpy.flatnonzero(corners[2] != corners[1])[0])
+    return s, t
 
-        Parameters
-        ----------
-        position : tuple of len 3
-            The (x, y, z) position of the block to show.
-        immediate : bool
-            Whether or not to show the block immediately.
 
-        """
-        # print(position)
-        # print(self.world[position])
-        texture = BLOCKS[self.world[position]]
-        self.shown[position] = texture
-        # print(texture)
-        if immediate:
-            self._show_block(position, texture)
-        else:
-            self._enqueue(self._show_block, position, texture)
+# Tile-local texture coordinates of the 4 corners of a face, see tex_coord().
+_CORNER_ST = numpy.array([(0, 0), (1, 0), (1, 1), (0, 1)], dtype=numpy.float32)
 
-    def _show_block(self, position, texture):
-        """ Private implementation of the `show_block()` method.
-        show_block()方法的私有实现
 
-        Parameters
-        ----------
-        position : tuple of len 3
-            The (x, y, z) position of the block to show.
-            需要展示的方块的坐标(x, y, z)
-        texture : list of len 3
-            The coordinates of the texture squares. Use `tex_coords()` to
-            generate.
-            材质坐标数组(使用tex_coords()生成)
+def build_greedy_mesh(blocks, origin):
+    """ Build the mesh of one chunk like `build_chunk_mesh()`, additionally
+    merging adjacent coplanar faces with the same texture square into larger
+    quads. The texture coordinates of a merged quad run from 0 to its size in
+    blocks, so it has to be drawn with a repeating texture of that square.
+    This is a pure function so it can run without a GL context.
+    贪心合并同材质共面的面, 生成区块网格
+
+    Parameters
+    ----------
+    blocks : numpy array
+        The chunk's padded block array, see `build_chunk_mesh()`.
+    origin : tuple of len 3
+        World position of the first unpadded cell.
+
+    Returns
+    -------
+    meshes : dict
+        Mapping from index into `BLOCKS.tiles` to `(vertices, tex_coords)`
+        flat numpy float32 arrays for `GL_QUADS`.
+
+    """
+    face_tiles = BLOCKS.face_tiles
+    clear, transparent = _see_through(blocks)
+    inner = blocks[1:-1, 1:-1, 1:-1]
+    filled = inner != AIR
+    shape = inner.shape
+    quads = {}
+    for face, direction in enumerate(FACES):
+        dx, dy, dz = direction
+        window = (slice(1 + dx, 1 + dx + shape[0]),
+                  slice(1 + dy, 1 + dy + shape[1]),
+                  slice(1 + dz, 1 + dz + shape[2]))
+        shown = filled & clear[window]
+        if transparent:
+            shown &= blocks[window] != inner
+        keys = numpy.where(shown, face_tiles[inner, face] + 1, 0)
+        normal = [i for i in xrange(3) if direction[i]][0]
+        u, v = [i for i in xrange(3) if i != normal]
+        s, t = _face_axes(face)
+        corners = FACE_VERTICES[face]
+        for d in numpy.flatnonzero(keys.any(axis=(u, v))):
+            plane = keys.take(d, axis=normal)
+            # Only walk the bounding box of the faces in this plane.
+            rows = numpy.flatnonzero(plane.any(axis=1))
+            cols = numpy.flatnonzero(plane.any(axis=0))
+            i0, j0 = rows[0], cols[0]
+            plane = plane[i0:rows[-1] + 1, j0:cols[-1] + 1].tolist()
+            for i, j, h, w, value in _greedy_rectangles(plane):
+                lo, hi = [0, 0, 0], [0, 0, 0]
+                lo[normal] = hi[normal] = d + origin[normal]
+                lo[u], hi[u] = i0 + i + origin[u], i0 + i + h - 1 + origin[u]
+                lo[v], hi[v] = j0 + j + origin[v], j0 + j + w - 1 + origin[v]
+                quads.setdefault(value - 1, []).append(
+                    (lo, hi, hi[s] - lo[s] + 1, hi[t] - lo[t] + 1, corners))
+    meshes = {}
+    for tile, items in quads.items():
+        lo = numpy.array([item[0] for item in items], dtype=numpy.float32)
+        hi = numpy.array([item[1] for item in items], dtype=numpy.float32)
+        size = numpy.array([item[2:4] for item in items], dtype=numpy.float32)
+        corners = numpy.array([item[4] for item in items])
+        vertices = numpy.where(corners < 0, lo[:, None, :] - 0.5,
+                               hi[:, None, :] + 0.5)
+        tex_coords = _CORNER_ST[None, :, :] * size[:, None, :]
+        meshes[tile] = (vertices.astype(numpy.float32).reshape(-1),
+                        tex_coords.astype(numpy.float32).reshape(-1))
+    return meshes
+
+
+def build_sector_mesh(blocks, origin, greedy=False):
+    """ Build the mesh of one sector with `build_greedy_mesh()` or
+    `build_chunk_mesh()`. Runs on the mesh worker pool.
+
+    Returns
+    -------
+    meshes : dict
+        Mapping from index into `BLOCKS.tiles`, or None for the whole
+        texture atlas, to `(vertices, tex_coords)`.
+
+    """
+    if greedy:
+        return build_greedy_mesh(blocks, origin)
+    return {None: build_chunk_mesh(blocks, origin)}
+
+
+# Every face of a section connected to every other one, see
+# section_connectivity().
+OPEN_SECTION = (0b111111,) * len(FACES)
+
+# Number of SECTOR_SIZE tall sections stacked in a chunk.
+SECTIONS = WORLD_HEIGHT // SECTOR_SIZE
+
+
+def section_connectivity(blocks):
+    """ For each SECTOR_SIZE tall section of a chunk's `blocks`, find which
+    of its faces are connected to each other through air.
+    计算区块各分段的面之间是否通过空气连通(洞穴剔除)
+
+    Parameters
+    ----------
+    blocks : numpy array
+        The SECTOR_SIZE x WORLD_HEIGHT x SECTOR_SIZE blocks of a chunk.
+
+    Returns
+    -------
+    sections : list of tuples of len 6
+        For each section from the bottom up, and each face in FACES order, a
+        bit mask of the faces (bit i for FACES[i]) reachable through the air
+        of the section from that face.
+
+    """
+    n = SECTOR_SIZE
+    sections = blocks.reshape(n, SECTIONS, n, n).transpose(1, 0, 2, 3)
+    air = ~BLOCKS.opaque[sections]
+    filled = air.reshape(SECTIONS, -1).sum(axis=1)
+    result = [OPEN_SECTION if count == n ** 3 else (0,) * len(FACES)
+              for count in filled.tolist()]
+    mixed = [i for i, count in enumerate(filled.tolist()) if 0 < count < n ** 3]
+    if not mixed:
+        return result
+    # Label the air components of the mixed sections by spreading the
+    # smallest cell index through the air until nothing changes.
+    air = air[mixed]
+    none = n ** 3
+    labels = numpy.where(air, numpy.arange(n ** 3).reshape(1, n, n, n), none)
+    while True:
+        spread = labels.copy()
+        for axis in (1, 2, 3):
+            a = [slice(None)] * 4
+            b = [slice(None)] * 4
+            a[axis], b[axis] = slice(1, None), slice(None, -1)
+            a, b = tuple(a), tuple(b)
+            numpy.minimum(spread[a], labels[b], out=spread[a])
+            numpy.minimum(spread[b], labels[a], out=spread[b])
+        spread[~air] = none
+        # Each label is the index of a cell of the same component, take that
+        # cell's label too to shortcut long chains.
+        flat = spread.reshape(len(mixed), -1)
+        jumped = numpy.take_along_axis(flat, numpy.minimum(flat, none - 1),
+                                       axis=1)
+        spread = numpy.where(air, jumped.reshape(spread.shape), none)
+        if (spread == labels).all():
+            break
+        labels = spread
+    # The cells of each face of a section, in FACES order.
+    faces = (
+        (slice(None), -1, slice(None)), (slice(None), 0, slice(None)),
+        (0, slice(None), slice(None)), (-1, slice(None), slice(None)),
+        (slice(None), slice(None), -1), (slice(None), slice(None), 0),
+    )
+    for k, i in enumerate(mixed):
+        # Mapping from air component to the faces it touches.
+        touched = {}
+        for f, face in enumerate(faces):
+            for label in numpy.unique(labels[k][face]).tolist():
+                if label != none:
+                    touched[label] = touched.get(label, 0) | 1 << f
+        connected = [0] * len(FACES)
+        for mask in touched.values():
+            for f in xrange(len(FACES)):
+                if mask >> f & 1:
+                    connected[f] |= mask
+        result[i] = tuple(connected)
+    return result
+
+
+def layer_profile(layers):
+    """ Return the value stored at each depth below the surface of a column
+    made of `layers`, `(thickness, block_id)` pairs from the surface down. A
+    thickness of None reaches down to y = 0, cells below the last layer are
+    air.
+
+    """
+    profile = numpy.full(WORLD_HEIGHT, AIR, dtype=numpy.uint8)
+    depth = 0
+    for thickness, block_id in layers:
+        end = WORLD_HEIGHT if thickness is None else depth + thickness
+        profile[depth:end] = block_id + 1
+        depth = end
+    return profile
+
+
+def column_table(profiles):
+    """ Return every column `column_blocks()` can build from `profiles`,
+    the `layer_profile()` of each biome, as a uint8 array indexed by
+    [biome, WORLD_HEIGHT - 1 - top y, y]. A column is a window of its
+    profile reversed and followed by air, so they are all precomputed.
+
+    """
+    n = WORLD_HEIGHT
+    reversed_profiles = numpy.zeros((len(profiles), 2 * n), dtype=numpy.uint8)
+    reversed_profiles[:, :n] = numpy.asarray(profiles)[:, ::-1]
+    windows = numpy.lib.stride_tricks.sliding_window_view(
+        reversed_profiles, n, axis=1)
+    return numpy.ascontiguousarray(windows[:, :n + 1])
+
+
+def column_blocks(heights, biomes, table):
+    """ Build whole columns of blocks from a heightmap.
+    根据高度图生成方块列
+
+    Parameters
+    ----------
+    heights : 2d array of int
+        `heights[i, j]` is the y of the top block of column (i, j). Negative
+        heights leave the column empty, columns reaching above the world
+        are cut off.
+    biomes : 2d array of int
+        The biome each column is made of.
+    table : numpy uint8 array
+        `column_table()` of the biomes' profiles.
+
+    Returns
+    -------
+    blocks : numpy uint8 array
+        The columns as an (nx, WORLD_HEIGHT, nz) array for `Chunk`.
+
+    """
+    top = numpy.clip(heights, -1, WORLD_HEIGHT - 1)
+    columns = table[biomes, WORLD_HEIGHT - 1 - top]
+    return numpy.ascontiguousarray(columns.transpose(0, 2, 1))
+
+
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+
+
+def _lattice(ix, iz, seed):
+    """ Hash integer lattice points to floats in [0, 1). Integer arithmetic
+    wraps around, so the result only depends on the point and `seed`.
+
+    """
+    h = (ix.astype(numpy.uint64) * numpy.uint64(0x9E3779B97F4A7C15) ^
+         iz.astype(numpy.uint64) * numpy.uint64(0xC2B2AE3D27D4EB4F) ^
+         numpy.uint64(seed & _MASK64))
+    # splitmix64 finalizer.
+    h ^= h >> numpy.uint64(30)
+    h *= numpy.uint64(0xBF58476D1CE4E5B9)
+    h ^= h >> numpy.uint64(27)
+    h *= numpy.uint64(0x94D049BB133111EB)
+    h ^= h >> numpy.uint64(31)
+    return (h >> numpy.uint64(11)).astype(numpy.float64) * 2.0 ** -53
+
+
+def value_noise(x, z, seed):
+    """ Smoothly interpolated random values in [0, 1) on the integer
+    lattice, at the points of the float arrays `x` and `z` (broadcast
+    against each other).
+    值噪声
+
+    """
+    x0, z0 = numpy.floor(x), numpy.floor(z)
+    u, v = x - x0, z - z0
+    u, v = u * u * (3 - 2 * u), v * v * (3 - 2 * v)
+    ix, iz = x0.astype(numpy.int64), z0.astype(numpy.int64)
+    # Hash the lattice points around the area once, rather than four per
+    # sample.
+    lx, lz = ix.min(), iz.min()
+    lattice = _lattice(numpy.arange(lx, ix.max() + 2)[:, None],
+                       numpy.arange(lz, iz.max() + 2)[None, :], seed)
+    i, k = ix - lx, iz - lz
+    a = lattice[i, k]
+    b = lattice[i + 1, k]
+    c = lattice[i, k + 1]
+    d = lattice[i + 1, k + 1]
+    near = a + (b - a) * u
+    far = c + (d - c) * u
+    return near + (far - near) * v
+
+
+def fractal_noise(x, z, seed, octaves=4, persistence=0.5):
+    """ Sum `octaves` of `value_noise()`, each at twice the frequency and
+    `persistence` times the amplitude of the one before, scaled back to
+    [0, 1).
+    分形噪声
+
+    """
+    total = 0.0
+    amplitude = 1.0
+    norm = 0.0
+    for octave in xrange(octaves):
+        total = total + amplitude * value_noise(x, z, seed + octave)
+        norm += amplitude
+        amplitude *= persistence
+        x, z = x * 2.0, z * 2.0
+    return total / norm
+
+
+class TerrainGenerator(object):
+    """ Builds the blocks of chunks nobody has saved. Subclasses decide the
+    height and biome of every column from the column's world position and
+    `seed` alone, so a chunk comes out the same whatever order chunks are
+    visited in, and can be generated again instead of being saved.
+    地形生成器基类
+
+    """
+
+    # Key of the generator in GENERATORS, saved with the world.
+    name = None
+
+    # Half the side of the square of terrain around the origin, None for
+    # endless terrain. Blocks are only placed inside it, see Model.add_block.
+    width = None
+
+    # The `(thickness, block_id)` layers of each biome, see layer_profile().
+    layers = [[(1, GRASS), (None, STONE)]]
+
+    def __init__(self, seed=None):
+        # A new random seed unless one is given.
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.table = column_table([layer_profile(layers)
+                                   for layers in self.layers])
+
+    def columns(self, x, z):
+        """ Return the `(heights, biomes)` of the columns at world x and z,
+        as for `column_blocks()`. `x` has shape (nx, 1) and `z` (1, nz).
+
         """
-        x, y, z = position
-        vertex_data = cube_vertices(x, y, z, 0.5)
-        texture_data = list(texture)
-        # create vertex list
-        # FIXME Maybe `add_indexed()` should be used instead
-        self._shown[position] = self.batch.add(24, GL_QUADS, self.group,
-                                               ('v3f/static', vertex_data),
-                                               ('t2f/static', texture_data))
-
-    def hide_block(self, position, immediate=True):
-        """ Hide the block at the given `position`. Hiding does not remove the
-        block from the world.
-        不渲染指定坐标的方块, 并不会从世界删除这个方块
+        raise NotImplementedError
 
-        Parameters
-        ----------
-        position : tuple of len 3
-            The (x, y, z) position of the block to hide.
-        immediate : bool
-            Whether or not to immediately remove the block from the canvas.
+    def generate(self, sector):
+        """ Return the blocks of `sector` as an array for `Chunk`, or None if
+        it is empty.
+        生成区块
 
         """
-        self.shown.pop(position)
-        if immediate:
-            self._hide_block(position)
+        sx, _, sz = sector
+        x = numpy.arange(sx * SECTOR_SIZE, (sx + 1) * SECTOR_SIZE)[:, None]
+        z = numpy.arange(sz * SECTOR_SIZE, (sz + 1) * SECTOR_SIZE)[None, :]
+        heights, biomes = self.columns(x, z)
+        if heights.max() < 0:
+            return None
+        return column_blocks(heights, biomes, self.table)
+
+
+class FlatGenerator(TerrainGenerator):
+    """ Stone from y = 0 to 63 under a single layer of grass at y = 64, out
+    to `width` (WORLD_WIDTH) from the origin. The seed is not used.
+    平坦地形
+
+    """
+
+    name = 'flat'
+    width = WORLD_WIDTH
+
+    def columns(self, x, z):
+        inside = (abs(x) <= self.width) & (abs(z) <= self.width)
+        heights = numpy.where(inside, 64, -1)
+        return heights, numpy.zeros_like(heights)
+
+
+class NoiseGenerator(TerrainGenerator):
+    """ Endless rolling terrain from `fractal_noise()`. A second, coarser
+    noise sets the climate of each column, which blends between the
+    biomes: how high and rough the ground is, and what it is made of.
+    噪声地形, 带有生物群系
+
+    """
+
+    name = 'noise'
+
+    # (name, climate, base height, height range) of each biome, by rising
+    # climate. Heights are interpolated between neighbouring biomes so
+    # their borders stay smooth.
+    BIOMES = [
+        ('plains', 0.4, 58, 14),
+        ('hills', 0.55, 50, 40),
+        ('mountains', 0.7, 30, 110),
+    ]
+    layers = [
+        [(1, GRASS), (None, STONE)],
+        [(1, GRASS), (None, STONE)],
+        [(None, STONE)],
+    ]
+
+    # Horizontal size, in blocks, of the features of the ground and of the
+    # climate.
+    SCALE = 96.0
+    CLIMATE_SCALE = 384.0
+
+    def columns(self, x, z):
+        climates = [biome[1] for biome in self.BIOMES]
+        climate = fractal_noise(x / self.CLIMATE_SCALE, z / self.CLIMATE_SCALE,
+                                self.seed ^ 0x5EED, octaves=2)
+        ground = fractal_noise(x / self.SCALE, z / self.SCALE, self.seed,
+                               octaves=5)
+        base = numpy.interp(climate, climates,
+                            [biome[2] for biome in self.BIOMES])
+        spread = numpy.interp(climate, climates,
+                              [biome[3] for biome in self.BIOMES])
+        heights = (base + spread * ground).astype(numpy.int64)
+        midpoints = [(a + b) / 2.0 for a, b in zip(climates, climates[1:])]
+        return heights, numpy.digitize(climate, midpoints)
+
+
+# Terrain generators by name, see TerrainGenerator.
+# 地形生成器
+GENERATORS = {
+    FlatGenerator.name: FlatGenerator,
+    NoiseGenerator.name: NoiseGenerator,
+}
+
+
+def world_generator(store, generator=None):
+    """ Return the `TerrainGenerator` of the world saved in `store` (None
+    for a world that is never saved). A saved world keeps the generator it
+    was created with, worlds saved before there were generators are flat. A
+    new world gets `generator`, by default WORLD_GENERATOR with WORLD_SEED,
+    which is saved with it.
+
+    """
+    level = {} if store is None else store.level()
+    if level:
+        return GENERATORS[level['generator']](int(level['seed']))
+    if generator is None:
+        if store is not None and store.exists():
+            generator = FlatGenerator(0)
         else:
-            self._enqueue(self._hide_block, position)
+            generator = GENERATORS[WORLD_GENERATOR](WORLD_SEED)
+    if store is not None:
+        store.save_level({'generator': generator.name,
+                          'seed': str(generator.seed)})
+    return generator
+
+
+# The generator and shared memory slots of a generation worker process, see
+# `_start_generation_worker()`.
+_worker = {}
+
 
-    def _hide_block(self, position):
-        """ Private implementation of the 'hide_block()` method.
-        hide_block()的内部实现
+def _start_generation_worker(generator, name, slots):
+    """ Set up a generation worker process: keep `generator` and map the
+    shared memory block `name` of the pool as `slots` chunk arrays.
+
+    """
+    # Spawned workers share the resource tracker of the pool's process, so
+    # attaching does not take over the block: the pool still unlinks it.
+    memory = shared_memory.SharedMemory(name=name)
+    # A worker would wait for work forever if the pool's process is killed.
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        threading.Thread(target=_exit_with, args=(parent,), daemon=True,
+                         name='parent watch').start()
+    _worker['memory'] = memory
+    _worker['generator'] = generator
+    _worker['slots'] = numpy.ndarray(
+        (slots, SECTOR_SIZE, WORLD_HEIGHT, SECTOR_SIZE), dtype=numpy.uint8,
+        buffer=memory.buf)
+
+
+def _exit_with(parent):
+    """ Exit the worker process as soon as `parent` has.
+
+    """
+    parent.join()
+    os._exit(1)
+
+
+def _generate_chunk(sector, slot):
+    """ Generate `sector` into shared memory slot `slot`, in a generation
+    worker. Returns whether the chunk holds anything.
+
+    """
+    blocks = _worker['generator'].generate(sector)
+    if blocks is None:
+        return False
+    _worker['slots'][slot] = blocks
+    return True
+
+
+class GenerationPool(object):
+    """ Generates chunks with a `TerrainGenerator` on a pool of worker
+    processes. Requests are deduplicated and kept in a priority queue, at
+    most two per worker are in flight so that nearer chunks requested
+    later do not wait for the rest. Workers write the blocks into slots of a
+    shared memory block, so only the sector and a flag are pickled.
+    多进程地形生成
+
+    """
+
+    def __init__(self, generator, workers=GENERATION_WORKERS, done=None):
+        self.workers = workers
+        # Called with each finished `Future` from a pool thread. Its result
+        # is read with `collect()`.
+        self.done = done
+        slots = 2 * workers
+        size = SECTOR_SIZE * WORLD_HEIGHT * SECTOR_SIZE
+        self.memory = shared_memory.SharedMemory(create=True,
+                                                 size=slots * size)
+        self.slots = numpy.ndarray(
+            (slots, SECTOR_SIZE, WORLD_HEIGHT, SECTOR_SIZE),
+            dtype=numpy.uint8, buffer=self.memory.buf)
+        self.free = list(xrange(slots))
+        # Heap of `(priority, order, sector)` requests not submitted yet, and
+        # every sector requested and not collected yet.
+        self.queue = []
+        self._order = 0
+        self.requested = set()
+        # Mapping from in-flight `Future` to its `(sector, slot)`.
+        self.running = {}
+        # Workers are started from scratch: the parent holds GL state and
+        # threads that do not belong in a fork.
+        self.executor = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_start_generation_worker,
+            initargs=(generator, self.memory.name, slots))
+
+    def request(self, sector, priority=0.0):
+        """ Queue the generation of `sector`, lower `priority` first. Does
+        nothing if it is already requested.
 
         """
-        self._shown.pop(position).delete()
+        if sector not in self.requested:
+            self.requested.add(sector)
+            heapq.heappush(self.queue, (priority, self._order, sector))
+            self._order += 1
 
-    def show_sector(self, sector):
-        """ Ensure all blocks in the given sector that should be shown are
-        drawn to the canvas.
+    def reprioritize(self, priority):
+        """ Recompute the priority of the queued requests with the function
+        `priority(sector)`, dropping those it returns None for.
+
+        """
+        queue = []
+        for _, order, sector in self.queue:
+            value = priority(sector)
+            if value is None:
+                self.requested.discard(sector)
+            else:
+                queue.append((value, order, sector))
+        heapq.heapify(queue)
+        self.queue = queue
+
+    def submit(self):
+        """ Hand queued requests to the workers while there are free slots.
+
+        """
+        while self.queue and self.free:
+            _, _, sector = heapq.heappop(self.queue)
+            slot = self.free.pop()
+            future = self.executor.submit(_generate_chunk, sector, slot)
+            self.running[future] = (sector, slot)
+            if self.done is not None:
+                future.add_done_callback(self.done)
+
+    def collect(self, future):
+        """ Return `(sector, blocks)` of a finished request, blocks None if
+        the chunk is empty, and free its slot.
+
+        """
+        sector, slot = self.running.pop(future)
+        self.requested.discard(sector)
+        blocks = self.slots[slot].copy() if future.result() else None
+        self.free.append(slot)
+        return sector, blocks
+
+    def close(self):
+        """ Stop the workers, dropping requests that have not started, and
+        free the shared memory.
+
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.queue = []
+        self.requested.clear()
+        self.running.clear()
+        del self.slots
+        self.memory.close()
+        self.memory.unlink()
+
+
+class Chunk(object):
+    """ Dense block storage for a single sector. Blocks are kept in a
+    SECTOR_SIZE x WORLD_HEIGHT x SECTOR_SIZE uint8 array indexed by local
+    (x, y, z), holding `block_id + 1` or AIR.
+    单个区块的方块存储, 使用uint8数组代替字典
+
+    """
+
+    __slots__ = ('sector', 'blocks', 'count', 'revision', 'loaded')
+
+    def __init__(self, sector, blocks=None):
+        self.sector = sector
+        if blocks is None:
+            blocks = numpy.zeros((SECTOR_SIZE, WORLD_HEIGHT, SECTOR_SIZE),
+                                 dtype=numpy.uint8)
+        self.blocks = blocks
+        # Number of non-air cells, kept up to date by ChunkedWorld.
+        self.count = int(numpy.count_nonzero(blocks))
+        # The world revision of the last change to the chunk's blocks.
+        self.revision = 0
+        # The revision the chunk was loaded or generated at, None for one
+        # created by an edit. While `revision` is still `loaded`, unloading
+        # the chunk loses nothing.
+        self.loaded = None
+
+    @property
+    def origin(self):
+        """ World position of the chunk's local (0, 0, 0) cell.
+
+        """
+        x, _, z = self.sector
+        return (x * SECTOR_SIZE, 0, z * SECTOR_SIZE)
+
+    def positions(self):
+        """ Iterate the world positions of all blocks in the chunk.
+        遍历区块内所有方块的世界坐标
+
+        """
+        ox, _, oz = self.origin
+        xs, ys, zs = numpy.nonzero(self.blocks)
+        return zip((xs + ox).tolist(), ys.tolist(), (zs + oz).tolist())
+
+
+class ChunkedWorld(MutableMapping):
+    """ Dict-like facade mapping block position to block id, backed by one
+    `Chunk` per sector. It stands in for the `{(x, y, z): block_id}` dict
+    `Model.world` used to be, at a fraction of the memory.
+    类字典的世界存储, 按区块保存方块数组
+
+    """
+
+    def __init__(self):
+        # Mapping from sector to the `Chunk` holding its blocks.
+        self.chunks = {}
+        # Total number of blocks over all loaded chunks.
+        self._count = 0
+        # `RegionStore` that chunks not loaded yet are read from, if any.
+        self.store = None
+        # `TerrainGenerator` building the chunks that were never saved, if
+        # any.
+        self.generator = None
+        # Bumped by every change to the blocks, including loading chunks.
+        # 世界修改计数
+        self.revision = 0
+        # Mapping from unloaded sector to the revision of its chunk. Loaded
+        # back, the chunk holds the same blocks and gets the same revision,
+        # so meshes built before still match `stamp()`.
+        self._unloaded = {}
+
+    def load(self, sector, generate=True):
+        """ Make sure the chunk of `sector` is loaded from `store`, or
+        generated by `generator` if it was never saved (unless `generate` is
+        False), and return it (None if there is nothing there). Lookups never
+        load chunks by themselves, callers load the sectors they are about
+        to use.
+        从存档中加载(或生成)区块
+
+        """
+        chunk = self.chunks.get(sector)
+        if chunk is None:
+            blocks = None
+            if self.store is not None:
+                blocks = self.store.load(sector)
+            if blocks is None and generate and self.generator is not None:
+                blocks = self.generator.generate(sector)
+            if blocks is not None:
+                chunk = self.add_chunk(sector, blocks)
+        return chunk
+
+    def add_chunk(self, sector, blocks):
+        """ Add the chunk of `sector`, not loaded yet, holding the array
+        `blocks` (see `Chunk`), and return it.
+
+        """
+        chunk = self.chunks[sector] = Chunk(sector, blocks)
+        self._count += chunk.count
+        self.revision += 1
+        chunk.revision = chunk.loaded = self._unloaded.pop(sector,
+                                                           self.revision)
+        return chunk
+
+    def unload(self, sector):
+        """ Drop the chunk of `sector` from memory, to be loaded again from
+        `store` or `generator`. The caller saves it first if it was edited,
+        so that it comes back as it was.
+        卸载区块
+
+        """
+        chunk = self.chunks.pop(sector)
+        self._count -= chunk.count
+        self.revision += 1
+        self._unloaded[sector] = chunk.revision
+
+    def chunk(self, sector, create=False):
+        """ Return the chunk for `sector`, loading it from `store` if needed,
+        or None if it holds nothing yet. With `create` a missing chunk is
+        allocated.
+
+        """
+        chunk = self.chunks.get(sector)
+        if chunk is None:
+            chunk = self.load(sector)
+        if chunk is None and create:
+            chunk = self.chunks[sector] = Chunk(sector)
+        return chunk
+
+    def _recount(self, chunk):
+        """ Recount the blocks of `chunk` after a bulk write.
+
+        """
+        count = int(numpy.count_nonzero(chunk.blocks))
+        self._count += count - chunk.count
+        chunk.count = count
+        self.revision += 1
+        chunk.revision = self.revision
+
+    def _slabs(self, x0, z0, x1, z1, create):
+        """ Yield `(chunk, local x slice, local z slice)` for every chunk
+        overlapping the columns x0..x1, z0..z1 (inclusive).
+
+        """
+        for sx in xrange(x0 // SECTOR_SIZE, x1 // SECTOR_SIZE + 1):
+            for sz in xrange(z0 // SECTOR_SIZE, z1 // SECTOR_SIZE + 1):
+                chunk = self.chunk((sx, 0, sz), create)
+                if chunk is None:
+                    continue
+                ox, oz = sx * SECTOR_SIZE, sz * SECTOR_SIZE
+                xs = slice(max(x0 - ox, 0), min(x1 - ox, SECTOR_SIZE - 1) + 1)
+                zs = slice(max(z0 - oz, 0), min(z1 - oz, SECTOR_SIZE - 1) + 1)
+                yield chunk, xs, zs
+
+    def fill(self, x0, y0, z0, x1, y1, z1, block_id):
+        """ Set every cell of the box x0..x1, y0..y1, z0..z1 (inclusive) to
+        `block_id`, or clear it if `block_id` is None. Written as one slab
+        per chunk.
+        批量填充区域
+
+        """
+        value = AIR if block_id is None else block_id + 1
+        y0, y1 = max(y0, 0), min(y1, WORLD_HEIGHT - 1)
+        if x0 > x1 or y0 > y1 or z0 > z1:
+            return
+        for chunk, xs, zs in self._slabs(x0, z0, x1, z1, value != AIR):
+            chunk.blocks[xs, y0:y1 + 1, zs] = value
+            self._recount(chunk)
+
+    def replace(self, x0, y0, z0, x1, y1, z1, old_id, new_id):
+        """ Replace `old_id` with `new_id` in the box x0..x1, y0..y1, z0..z1
+        (inclusive), None standing for air either way. Returns the number
+        of cells replaced. Done as one slab per chunk.
+        批量替换区域内的方块
+
+        """
+        old = AIR if old_id is None else old_id + 1
+        new = AIR if new_id is None else new_id + 1
+        y0, y1 = max(y0, 0), min(y1, WORLD_HEIGHT - 1)
+        if x0 > x1 or y0 > y1 or z0 > z1 or old == new:
+            return 0
+        replaced = 0
+        for chunk, xs, zs in self._slabs(x0, z0, x1, z1, old == AIR):
+            slab = chunk.blocks[xs, y0:y1 + 1, zs]
+            cells = slab == old
+            count = int(numpy.count_nonzero(cells))
+            if count:
+                slab[cells] = new
+                self._recount(chunk)
+                replaced += count
+        return replaced
+
+    def read(self, x0, y0, z0, x1, y1, z1):
+        """ Return the stored values (block id + 1, AIR for air) of the box
+        x0..x1, y0..y1, z0..z1 (inclusive) as an array indexed
+        `[x - x0, y - y0, z - z0]`, read a slab per chunk. Chunks are loaded
+        as needed, cells outside the world height are air.
+        读取区域内的方块数组
+
+        """
+        blocks = numpy.zeros((x1 - x0 + 1, y1 - y0 + 1, z1 - z0 + 1),
+                             dtype=numpy.uint8)
+        ys = slice(max(y0, 0), min(y1, WORLD_HEIGHT - 1) + 1)
+        if ys.start >= ys.stop:
+            return blocks
+        for chunk, xs, zs in self._slabs(x0, z0, x1, z1, False):
+            cx, _, cz = chunk.origin
+            blocks[cx + xs.start - x0:cx + xs.stop - x0,
+                   ys.start - y0:ys.stop - y0,
+                   cz + zs.start - z0:cz + zs.stop - z0] = \
+                chunk.blocks[xs, ys, zs]
+        return blocks
+
+    def write(self, x0, y0, z0, blocks, air=True):
+        """ Write the stored values `blocks`, as returned by `read()`, to the
+        box whose lowest corner is (x0, y0, z0), a slab per chunk. Without
+        `air` the air cells of `blocks` leave the world as it was. Cells
+        outside the world height are dropped.
+        将方块数组写入区域
+
+        """
+        nx, ny, nz = blocks.shape
+        ys = slice(max(y0, 0), min(y0 + ny, WORLD_HEIGHT))
+        if not nx or not nz or ys.start >= ys.stop:
+            return
+        for chunk, xs, zs in self._slabs(x0, z0, x0 + nx - 1, z0 + nz - 1,
+                                         True):
+            cx, _, cz = chunk.origin
+            source = blocks[cx + xs.start - x0:cx + xs.stop - x0,
+                            ys.start - y0:ys.stop - y0,
+                            cz + zs.start - z0:cz + zs.stop - z0]
+            if air:
+                chunk.blocks[xs, ys, zs] = source
+            else:
+                numpy.copyto(chunk.blocks[xs, ys, zs], source,
+                             where=source != AIR)
+            self._recount(chunk)
+
+    def set_columns(self, heights, layers, origin=(0, 0)):
+        """ Rebuild whole columns from a heightmap. `heights[i, j]` is the y
+        of the top block of column (origin x + i, origin z + j); negative
+        heights leave the column empty. `layers` lists `(thickness,
+        block_id)` from the surface down, a thickness of None reaching down
+        to y = 0. Cells above the surface or below the last layer are air.
+        根据高度图批量生成地形列
+
+        """
+        heights = numpy.asarray(heights, dtype=numpy.int64)
+        table = column_table([layer_profile(layers)])
+        ox, oz = origin
+        nx, nz = heights.shape
+        for chunk, xs, zs in self._slabs(ox, oz, ox + nx - 1, oz + nz - 1,
+                                         True):
+            cx, _, cz = chunk.origin
+            h = heights[cx + xs.start - ox:cx + xs.stop - ox,
+                        cz + zs.start - oz:cz + zs.stop - oz]
+            chunk.blocks[xs, :, zs] = column_blocks(
+                h, numpy.zeros_like(h), table)
+            self._recount(chunk)
+
+    def __contains__(self, position):
+        x, y, z = position
+        if not 0 <= y < WORLD_HEIGHT:
+            return False
+        chunk = self.chunks.get((x // SECTOR_SIZE, 0, z // SECTOR_SIZE))
+        return chunk is not None and \
+            chunk.blocks[x % SECTOR_SIZE, y, z % SECTOR_SIZE] != AIR
+
+    def __getitem__(self, position):
+        x, y, z = position
+        if 0 <= y < WORLD_HEIGHT:
+            chunk = self.chunks.get((x // SECTOR_SIZE, 0, z // SECTOR_SIZE))
+            if chunk is not None:
+                value = chunk.blocks[x % SECTOR_SIZE, y, z % SECTOR_SIZE]
+                if value != AIR:
+                    return int(value) - 1
+        raise KeyError(position)
+
+    def get(self, position, default=None):
+        try:
+            return self[position]
+        except KeyError:
+            return default
+
+    def __setitem__(self, position, block_id):
+        x, y, z = position
+        if not 0 <= y < WORLD_HEIGHT:
+            raise KeyError(position)
+        chunk = self.chunk((x // SECTOR_SIZE, 0, z // SECTOR_SIZE), True)
+        index = (x % SECTOR_SIZE, y, z % SECTOR_SIZE)
+        if chunk.blocks[index] == AIR:
+            chunk.count += 1
+            self._count += 1
+        chunk.blocks[index] = block_id + 1
+        self.revision += 1
+        chunk.revision = self.revision
+
+    def __delitem__(self, position):
+        x, y, z = position
+        chunk = None
+        if 0 <= y < WORLD_HEIGHT:
+            chunk = self.chunks.get((x // SECTOR_SIZE, 0, z // SECTOR_SIZE))
+        index = (x % SECTOR_SIZE, y, z % SECTOR_SIZE)
+        if chunk is None or chunk.blocks[index] == AIR:
+            raise KeyError(position)
+        chunk.blocks[index] = AIR
+        chunk.count -= 1
+        self._count -= 1
+        self.revision += 1
+        chunk.revision = self.revision
+
+    def __iter__(self):
+        for chunk in list(self.chunks.values()):
+            for position in chunk.positions():
+                yield position
+
+    def __len__(self):
+        return self._count
+
+    def __repr__(self):
+        return '<%s: %d blocks in %d chunks>' % (
+            type(self).__name__, self._count, len(self.chunks))
+
+    def padded(self, sector):
+        """ Return a copy of the blocks of `sector` padded by one cell on
+        every side with the facing cells of the neighbouring chunks. Cells
+        below y = 0 and above the world are air.
+        返回带有相邻区块边界的方块数组副本
+
+        """
+        n = SECTOR_SIZE
+        blocks = numpy.zeros((n + 2, WORLD_HEIGHT + 2, n + 2),
+                             dtype=numpy.uint8)
+        x, _, z = sector
+        chunk = self.chunks.get(sector)
+        if chunk is not None:
+            blocks[1:-1, 1:-1, 1:-1] = chunk.blocks
+        for (dx, dz), target, source in (
+                ((-1, 0), (0, slice(1, -1), slice(1, -1)), n - 1),
+                ((1, 0), (n + 1, slice(1, -1), slice(1, -1)), 0),
+                ((0, -1), (slice(1, -1), slice(1, -1), 0), n - 1),
+                ((0, 1), (slice(1, -1), slice(1, -1), n + 1), 0)):
+            neighbour = self.chunks.get((x + dx, 0, z + dz))
+            if neighbour is None:
+                continue
+            if dx:
+                blocks[target] = neighbour.blocks[source, :, :]
+            else:
+                blocks[target] = neighbour.blocks[:, :, source]
+        return blocks
+
+    def stamp(self, sector):
+        """ Return the revisions of the chunks `padded(sector)` reads from.
+        The stamp changes whenever the mesh of `sector` may have.
+        返回区块及相邻区块的修改计数, 用于判断网格是否过期
+
+        """
+        x, y, z = sector
+        stamp = []
+        for neighbour in (sector, (x - 1, y, z), (x + 1, y, z),
+                          (x, y, z - 1), (x, y, z + 1)):
+            chunk = self.chunks.get(neighbour)
+            stamp.append(0 if chunk is None else chunk.revision)
+        return tuple(stamp)
+
+    def exposed(self, position):
+        """ Returns False if the block at `position` is surrounded on all 6
+        sides by blocks, True otherwise.
+
+        """
+        x, y, z = position
+        chunk = self.chunks.get((x // SECTOR_SIZE, 0, z // SECTOR_SIZE))
+        lx, lz = x % SECTOR_SIZE, z % SECTOR_SIZE
+        if chunk is None or not (0 < lx < SECTOR_SIZE - 1 and
+                                 0 < lz < SECTOR_SIZE - 1 and
+                                 0 < y < WORLD_HEIGHT - 1):
+            # On a chunk border, let the neighbouring chunks answer.
+            for dx, dy, dz in FACES:
+                if (x + dx, y + dy, z + dz) not in self:
+                    return True
+            return False
+        blocks = chunk.blocks
+        return bool(blocks[lx, y + 1, lz] == AIR or
+                    blocks[lx, y - 1, lz] == AIR or
+                    blocks[lx - 1, y, lz] == AIR or
+                    blocks[lx + 1, y, lz] == AIR or
+                    blocks[lx, y, lz + 1] == AIR or
+                    blocks[lx, y, lz - 1] == AIR)
+
+
+class RegionFile(object):
+    """ A file holding up to REGION_SIZE x REGION_SIZE zlib compressed chunk
+    records. A fixed table after the header stores the offset and length of
+    every chunk's record. A rewritten chunk is appended to the file and its
+    table entry is updated in place, so a crash never leaves a torn record
+    behind. The records it supersedes are dead space until `compact()`.
+    Records are read through a read-only memory map and are only
+    decompressed when asked for.
+    区域文件: 保存多个zlib压缩的区块
+
+    """
+
+    MAGIC = b'PYMCRGN1'
+    # magic, SECTOR_SIZE, WORLD_HEIGHT
+    HEADER = struct.Struct('<8sHH')
+    # offset, length of a chunk record
+    ENTRY = struct.Struct('<QI')
+
+    def __init__(self, path):
+        self.path = path
+        count = REGION_SIZE * REGION_SIZE
+        self.data_start = self.HEADER.size + count * self.ENTRY.size
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, SECTOR_SIZE, WORLD_HEIGHT))
+                f.write(bytes(count * self.ENTRY.size))
+        self.file = open(path, 'r+b')
+        magic, size, height = self.HEADER.unpack(
+            self.file.read(self.HEADER.size))
+        if (magic, size, height) != (self.MAGIC, SECTOR_SIZE, WORLD_HEIGHT):
+            self.file.close()
+            raise ValueError('%s is not a region file for %dx%d chunks'
+                             % (path, SECTOR_SIZE, WORLD_HEIGHT))
+        self.table = list(self.ENTRY.iter_unpack(
+            self.file.read(count * self.ENTRY.size)))
+        self._map = None
+        # Bytes of records no table entry points to any more.
+        self.dead = (os.path.getsize(path) - self.data_start -
+                     sum(length for _, length in self.table))
+
+    @staticmethod
+    def index(sector):
+        """ Index of `sector` in the table of its region.
+
+        """
+        x, _, z = sector
+        return (x % REGION_SIZE) * REGION_SIZE + z % REGION_SIZE
+
+    def sectors(self, region):
+        """ Return the sectors stored in this file, which holds `region`.
+
+        """
+        rx, rz = region
+        return [(rx * REGION_SIZE + i // REGION_SIZE, 0,
+                 rz * REGION_SIZE + i % REGION_SIZE)
+                for i, (_, length) in enumerate(self.table) if length]
+
+    def read(self, sector):
+        """ Return the compressed record of `sector`, or None.
+
+        """
+        offset, length = self.table[self.index(sector)]
+        if not length:
+            return None
+        if self._map is None or len(self._map) < offset + length:
+            # (Re)map the file, it has grown since it was last mapped.
+            if self._map is not None:
+                self._map.close()
+            self.file.flush()
+            self._map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def write(self, sector, record):
+        """ Store the compressed `record` of `sector`. Returns the number of
+        bytes written.
+
+        """
+        self.file.seek(0, os.SEEK_END)
+        offset = self.file.tell()
+        self.file.write(record)
+        index = self.index(sector)
+        entry = (offset, len(record))
+        self.file.seek(self.HEADER.size + index * self.ENTRY.size)
+        self.file.write(self.ENTRY.pack(*entry))
+        self.dead += self.table[index][1]
+        self.table[index] = entry
+        return len(record) + self.ENTRY.size
+
+    def live(self):
+        """ Bytes of the records the table points to.
+
+        """
+        return sum(length for _, length in self.table)
+
+    def compact(self):
+        """ Rewrite the file without its dead space. The records are copied
+        to a new file that replaces this one once synced, so a crash leaves
+        either file whole. Returns the number of bytes reclaimed.
+        压缩区域文件, 回收被覆盖记录的空间
+
+        """
+        dead = self.dead
+        if not dead:
+            return 0
+        table = []
+        offset = self.data_start
+        temporary = self.path + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, SECTOR_SIZE, WORLD_HEIGHT))
+            f.write(bytes(len(self.table) * self.ENTRY.size))
+            for old, length in self.table:
+                if not length:
+                    table.append((0, 0))
+                    continue
+                self.file.seek(old)
+                f.write(self.file.read(length))
+                table.append((offset, length))
+                offset += length
+            f.seek(self.HEADER.size)
+            f.write(b''.join(self.ENTRY.pack(*entry) for entry in table))
+            f.flush()
+            os.fsync(f.fileno())
+        self.close()
+        os.replace(temporary, self.path)
+        self.file = open(self.path, 'r+b')
+        self.table = table
+        self.dead = 0
+        return dead
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        if self.dead > self.live():
+            # Rewritten chunks keep the file under twice the live records.
+            self.compact()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self.file.close()
+
+
+class RegionStore(object):
+    """ A saved world: a directory of `RegionFile`s, each covering
+    REGION_SIZE x REGION_SIZE sectors. It is safe to use from the autosave
+    thread and the main thread at once, (de)compression happens outside the
+    lock.
+    存档目录
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Mapping from region to its open `RegionFile`, or None when the file
+        # does not exist.
+        self.regions = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def region(sector):
+        """ Return the region holding `sector`.
+
+        """
+        x, _, z = sector
+        return (x // REGION_SIZE, z // REGION_SIZE)
+
+    def _file(self, region, create=False):
+        region_file = self.regions.get(region)
+        if region_file is None:
+            path = os.path.join(self.path, 'r.%d.%d.rgn' % region)
+            if create or os.path.exists(path):
+                if not os.path.exists(self.path):
+                    os.makedirs(self.path)
+                region_file = self.regions[region] = RegionFile(path)
+        return region_file
+
+    def saved(self, sector):
+        """ Whether `sector` has been saved here.
+
+        """
+        with self.lock:
+            region_file = self._file(self.region(sector))
+            return region_file is not None and \
+                region_file.table[region_file.index(sector)][1] > 0
+
+    def release(self, region):
+        """ Flush, compact and close the file of `region`, e.g. once done
+        writing it. It is opened again when needed.
+
+        """
+        with self.lock:
+            region_file = self.regions.pop(region, None)
+            if region_file is not None:
+                region_file.flush()
+                region_file.compact()
+                region_file.close()
+
+    def exists(self):
+        """ Whether anything has been saved here yet.
+
+        """
+        return bool(self._region_names())
+
+    def level(self):
+        """ Return the settings saved with the world, such as its terrain
+        generator and seed, as a dict of strings (empty for a new world).
+
+        """
+        level = configparser.ConfigParser()
+        level.read(os.path.join(self.path, 'level'))
+        return dict(level['DEFAULT'])
+
+    def save_level(self, settings):
+        """ Save the dict `settings` with the world, see `level()`.
+
+        """
+        level = configparser.ConfigParser()
+        level['DEFAULT'] = settings
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, 'level'), 'w') as f:
+            level.write(f)
+
+    def _region_names(self):
+        if not os.path.isdir(self.path):
+            return []
+        return [name for name in os.listdir(self.path)
+                if name.startswith('r.') and name.endswith('.rgn')]
+
+    def sectors(self):
+        """ Return every saved sector.
+
+        """
+        sectors = []
+        with self.lock:
+            for name in self._region_names():
+                region = tuple(int(i) for i in name.split('.')[1:3])
+                sectors.extend(self._file(region).sectors(region))
+        return sectors
+
+    def load(self, sector):
+        """ Return the saved blocks of `sector` as an array for `Chunk`, or
+        None if it was never saved.
+
+        """
+        with self.lock:
+            region_file = self._file(self.region(sector))
+            record = region_file and region_file.read(sector)
+        if record is None:
+            return None
+        return numpy.frombuffer(zlib.decompress(record), dtype=numpy.uint8
+                                ).reshape(SECTOR_SIZE, WORLD_HEIGHT,
+                                          SECTOR_SIZE).copy()
+
+    def save(self, sector, blocks):
+        """ Save the block array of `sector`. Returns the bytes written.
+
+        """
+        record = zlib.compress(blocks.tobytes())
+        with self.lock:
+            return self._file(self.region(sector), True).write(sector, record)
+
+    def flush(self):
+        with self.lock:
+            for region_file in self.regions.values():
+                if region_file is not None:
+                    region_file.flush()
+
+    def close(self):
+        with self.lock:
+            for region_file in self.regions.values():
+                if region_file is not None:
+                    region_file.compact()
+                    region_file.close()
+            self.regions.clear()
+
+
+def pack_varints(values):
+    """ Encode the unsigned integers `values` as LEB128 varints: 7 bits per
+    byte, lowest first, the high bit set on every byte but the last.
+    将整数数组编码为变长整数
+
+    """
+    values = numpy.asarray(values, dtype=numpy.uint64)
+    lengths = numpy.ones(len(values), dtype=numpy.intp)
+    for k in xrange(1, 10):
+        longer = values >= numpy.uint64(1 << (7 * k))
+        if not longer.any():
+            break
+        lengths += longer
+    offsets = numpy.cumsum(lengths) - lengths
+    data = numpy.empty(int(lengths.sum()), dtype=numpy.uint8)
+    for k in xrange(int(lengths.max()) if len(values) else 0):
+        more = lengths > k
+        byte = (values[more] >> numpy.uint64(7 * k)) & numpy.uint64(0x7f)
+        byte |= numpy.where(lengths[more] > k + 1, 0x80, 0).astype(
+            numpy.uint64)
+        data[offsets[more] + k] = byte
+    return data.tobytes()
+
+
+def unpack_varints(data):
+    """ Decode the LEB128 varints of `data` into an array of uint64, see
+    `pack_varints()`.
+    解码变长整数
+
+    """
+    data = numpy.frombuffer(data, dtype=numpy.uint8)
+    ends = numpy.flatnonzero(data < 0x80)
+    if len(data) and (not len(ends) or ends[-1] != len(data) - 1):
+        raise ValueError('truncated varint')
+    starts = numpy.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+    values = numpy.zeros(len(ends), dtype=numpy.uint64)
+    for k in xrange(int(lengths.max()) if len(ends) else 0):
+        more = lengths > k
+        values[more] |= (data[starts[more] + k] & 0x7f).astype(
+            numpy.uint64) << numpy.uint64(7 * k)
+    return values
+
+
+def encode_runs(values):
+    """ Run-length encode the array `values`, in C order, as varint
+    `(run length, value)` pairs.
+    游程编码
+
+    """
+    values = numpy.ravel(values)
+    if not len(values):
+        return b''
+    starts = numpy.concatenate(
+        ([0], numpy.flatnonzero(values[1:] != values[:-1]) + 1))
+    pairs = numpy.empty(2 * len(starts), dtype=numpy.uint64)
+    pairs[0::2] = numpy.diff(numpy.append(starts, len(values)))
+    pairs[1::2] = values[starts]
+    return pack_varints(pairs)
+
+
+def decode_runs(data, count):
+    """ Decode the `count` values run-length encoded in `data` by
+    `encode_runs()`.
+    游程解码
+
+    """
+    pairs = unpack_varints(data)
+    lengths, values = pairs[0::2], pairs[1::2]
+    if len(pairs) % 2 or int(lengths.sum()) != count:
+        raise ValueError('runs do not cover %d values' % count)
+    return numpy.repeat(values, lengths.astype(numpy.intp))
+
+
+class Schematic(object):
+    """ The binary schematic format moving a box of blocks in and out of
+    worlds, see `Model.export_schematic()` and `Model.import_schematic()`.
+
+    A header gives the size of the box and the palette: the names of the
+    block types, palette index 0 being air. The box follows as tiles of
+    up to SECTOR_SIZE x SECTOR_SIZE columns, x-major. Each tile is a varint
+    byte length and the palette indices of its cells, [x, y, z] order, run
+    length encoded by `encode_runs()` and zlib compressed if the header
+    says so. Tiles are read and written one at a time, so a schematic
+    streams in and out of a world a chunk's worth at a time.
+    结构文件格式: 调色板 + 游程编码的方块, 可选zlib压缩
+
+    """
+
+    MAGIC = b'PYMCSCHM'
+    VERSION = 1
+    # magic, version, flags, size x, y, z, palette length
+    HEADER = struct.Struct('<8sBBHHHH')
+    # Flag of a schematic whose tiles are zlib compressed.
+    ZLIB = 1
+
+    @staticmethod
+    def tiles(size):
+        """ Yield `(x, z, nx, nz)`, the corner and extent of every tile of a
+        box of `size`, in file order.
+
+        """
+        sx, _, sz = size
+        for x in xrange(0, sx, SECTOR_SIZE):
+            for z in xrange(0, sz, SECTOR_SIZE):
+                yield x, z, min(SECTOR_SIZE, sx - x), min(SECTOR_SIZE, sz - z)
+
+    @classmethod
+    def write(cls, file, size, read, compress=True):
+        """ Write a schematic of a box of `size` to the binary `file`.
+        `read(x, z, nx, nz)` returns the stored values (block id + 1, AIR
+        for air) of a tile, see `ChunkedWorld.read()`. The palette lists
+        every registered block type, so stored values are palette indices.
+        Returns the number of bytes written.
+
+        """
+        names = [material.name.encode('utf-8') for material in BLOCKS]
+        written = file.write(cls.HEADER.pack(
+            cls.MAGIC, cls.VERSION, cls.ZLIB if compress else 0,
+            size[0], size[1], size[2], len(names)))
+        for name in names:
+            written += file.write(struct.pack('<B', len(name)) + name)
+        for x, z, nx, nz in cls.tiles(size):
+            data = encode_runs(read(x, z, nx, nz))
+            if compress:
+                data = zlib.compress(data)
+            written += file.write(pack_varints([len(data)]) + data)
+        return written
+
+    @classmethod
+    def read(cls, file):
+        """ Read the header of the schematic in the binary `file` and return
+        `(size, tiles)`. `tiles` yields `(x, z, blocks)` for every tile as
+        it is read, `blocks` holding the stored values of the block types
+        registered now. Raises ValueError if the file is not a schematic
+        this version reads or names unknown block types.
+
+        """
+        header = file.read(cls.HEADER.size)
+        if len(header) < cls.HEADER.size:
+            raise ValueError('not a schematic')
+        magic, version, flags, sx, sy, sz, count = cls.HEADER.unpack(header)
+        if magic != cls.MAGIC:
+            raise ValueError('not a schematic')
+        if version > cls.VERSION:
+            raise ValueError('schematic version %d is newer than %d'
+                             % (version, cls.VERSION))
+        # Stored value of every palette index.
+        palette = numpy.zeros(count + 1, dtype=numpy.uint8)
+        for index in xrange(1, count + 1):
+            length, = file.read(1)
+            name = file.read(length).decode('utf-8')
+            if name not in BLOCKS:
+                raise ValueError('unknown block type %r' % name)
+            palette[index] = BLOCKS.names[name] + 1
+        size = (sx, sy, sz)
+
+        def tiles():
+            for x, z, nx, nz in cls.tiles(size):
+                length = 0
+                for shift in xrange(0, 64, 7):
+                    byte = file.read(1)
+                    if not byte:
+                        raise ValueError('truncated schematic')
+                    length |= (byte[0] & 0x7f) << shift
+                    if byte[0] < 0x80:
+                        break
+                data = file.read(length)
+                if len(data) < length:
+                    raise ValueError('truncated schematic')
+                if flags & cls.ZLIB:
+                    data = zlib.decompress(data)
+                indices = decode_runs(data, nx * sy * nz)
+                if len(indices) and indices.max() > count:
+                    raise ValueError('palette index out of range')
+                yield x, z, palette[indices].reshape(nx, sy, nz)
+
+        return size, tiles()
+
+
+class Autosaver(object):
+    """ Saves a world incrementally in the background.
+
+    Edits are recorded as they happen: the sectors they touch are marked
+    dirty and a record is added to an edit journal. Every `journal_interval`
+    seconds a writer thread appends the new records to the journal file and
+    syncs it. Every `interval` seconds it also writes only the dirty chunks
+    to the region files and truncates the journal. A crash loses at most
+    the edits of the last journal interval, and journal records whose chunks
+    were not saved yet are replayed on the next start.
+    后台增量保存: 只写入修改过的区块, 并通过编辑日志防止崩溃丢失数据
+
+    """
+
+    # x0, y0, z0, x1, y1, z1 of a box and the value stored in its cells.
+    RECORD = struct.Struct('<6iB')
+
+    def __init__(self, world, store, interval=AUTOSAVE_INTERVAL,
+                 journal_interval=JOURNAL_INTERVAL):
+        self.world = world
+        self.store = store
+        self.interval = interval
+        self.journal_interval = journal_interval
+        # Sectors edited since the last flush, and their journal records.
+        self.dirty = set()
+        self.edits = []
+        self.lock = threading.Lock()
+        # Held for a whole flush, so that save() and the writer thread never
+        # interleave.
+        self._flush_lock = threading.Lock()
+        self.journal_path = os.path.join(store.path, 'journal')
+
+        # Metrics of the last flush and running totals.
+        # 保存耗时与写入量统计
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.last_flush_bytes = 0
+        self.bytes_written = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='autosave',
+                                        daemon=True)
+        self._thread.start()
+
+    def record(self, x0, y0, z0, x1, y1, z1, block_id):
+        """ Record that the box x0..x1, y0..y1, z0..z1 (inclusive) was set
+        to `block_id` (None for air).
+
+        """
+        value = AIR if block_id is None else block_id + 1
+        sectors = region_sectors(x0, z0, x1, z1)
+        with self.lock:
+            self.dirty.update(sectors)
+            self.edits.append(self.RECORD.pack(x0, y0, z0, x1, y1, z1, value))
+
+    def mark_dirty(self, sectors):
+        """ Mark `sectors` for saving without journaling the change, for
+        bulk generation that can be redone.
+
+        """
+        with self.lock:
+            self.dirty.update(sectors)
+
+    def replay(self):
+        """ Apply the journal left behind by a session that did not get to
+        save its chunks. Returns the number of records replayed.
+        重放编辑日志
+
+        """
+        if not os.path.exists(self.journal_path):
+            return 0
+        with open(self.journal_path, 'rb') as journal:
+            data = journal.read()
+        # A partly written record at the end is dropped.
+        data = data[:len(data) - len(data) % self.RECORD.size]
+        count = 0
+        for x0, y0, z0, x1, y1, z1, value in self.RECORD.iter_unpack(data):
+            block_id = None if value == AIR else value - 1
+            self.world.fill(x0, y0, z0, x1, y1, z1, block_id)
+            with self.lock:
+                self.dirty.update(region_sectors(x0, z0, x1, z1))
+                self.edits.append(self.RECORD.pack(x0, y0, z0, x1, y1, z1,
+                                                   value))
+            count += 1
+        return count
+
+    def journal(self):
+        """ Append the pending edit records to the journal file and sync
+        it. Returns the number of bytes written.
+        写入编辑日志
+
+        """
+        with self._flush_lock:
+            written = self._journal()
+            self.bytes_written += written
+            return written
+
+    def _journal(self):
+        """ Implementation of `journal()`, the flush lock held. Records
+        that could not be written are put back in front of the newer ones.
+
+        """
+        with self.lock:
+            edits, self.edits = self.edits, []
+        if not edits:
+            return 0
+        try:
+            # A new world has no directory until its first save.
+            os.makedirs(self.store.path, exist_ok=True)
+            with open(self.journal_path, 'ab') as journal:
+                written = journal.write(b''.join(edits))
+                journal.flush()
+                os.fsync(journal.fileno())
+        except BaseException:
+            # Replaying a record twice is harmless, losing one is not.
+            with self.lock:
+                self.edits[:0] = edits
+            raise
+        return written
+
+    def flush(self):
+        """ Journal the pending edits, then write the dirty chunks and
+        truncate the journal. Returns the number of bytes written. If
+        writing fails the chunks stay dirty and the journal is kept.
+
+        """
+        with self._flush_lock:
+            start = time.perf_counter()
+            written = self._journal()
+            with self.lock:
+                dirty, self.dirty = self.dirty, set()
+                chunks = [self.world.chunks.get(sector) for sector in dirty]
+                snapshots = [(chunk.sector, chunk.blocks.copy())
+                             for chunk in chunks if chunk is not None]
+            if not snapshots:
+                self.bytes_written += written
+                return written
+            try:
+                for sector, blocks in snapshots:
+                    written += self.store.save(sector, blocks)
+                self.store.flush()
+            except BaseException:
+                with self.lock:
+                    self.dirty |= dirty
+                raise
+            # Every journaled edit is in the region files now.
+            if os.path.exists(self.journal_path):
+                open(self.journal_path, 'wb').close()
+            self.flushes += 1
+            self.last_flush_seconds = time.perf_counter() - start
+            self.last_flush_bytes = written
+            self.bytes_written += written
+            return written
+
+    def save(self, sectors):
+        """ Write the chunks of `sectors` now if they have edits not saved
+        yet, e.g. before they are unloaded. The journal is appended first and
+        kept until the next flush: replaying it over chunks that already hold
+        every edit in it changes nothing. Returns the number of bytes
+        written.
+        立即保存指定区块
+
+        """
+        with self.lock:
+            if self.dirty.isdisjoint(sectors) and \
+                    not self._flush_lock.locked():
+                return 0
+        # Waits for a flush that may be writing them.
+        with self._flush_lock:
+            written = self._journal()
+            with self.lock:
+                dirty = self.dirty.intersection(sectors)
+                self.dirty -= dirty
+                chunks = [self.world.chunks.get(sector) for sector in dirty]
+                snapshots = [(chunk.sector, chunk.blocks.copy())
+                             for chunk in chunks if chunk is not None]
+            try:
+                for sector, blocks in snapshots:
+                    written += self.store.save(sector, blocks)
+                self.store.flush()
+            except BaseException:
+                with self.lock:
+                    self.dirty |= dirty
+                raise
+            self.bytes_written += written
+            return written
+
+    def metrics(self):
+        """ Return the autosave metrics as a dict.
+
+        """
+        return {
+            'flushes': self.flushes,
+            'last_flush_seconds': self.last_flush_seconds,
+            'last_flush_bytes': self.last_flush_bytes,
+            'bytes_written': self.bytes_written,
+            'dirty_sectors': len(self.dirty),
+            'pending_edits': len(self.edits),
+        }
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(min(self.journal_interval, self.interval)):
+            try:
+                if time.perf_counter() - last >= self.interval:
+                    last = time.perf_counter()
+                    self.flush()
+                else:
+                    self.journal()
+            except Exception:
+                traceback.print_exc()
+
+    def close(self):
+        """ Stop the writer thread and save what is left.
+
+        """
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+
+class Clipboard(object):
+    """ A box of blocks copied out of the world by `Model.copy_region()`,
+    to be pasted elsewhere with `Model.paste()`.
+    剪贴板: 复制出的一块区域
+
+    """
+
+    def __init__(self, blocks):
+        # Stored values (block id + 1, AIR for air) of the box, indexed
+        # [x, y, z] from its lowest corner, see `ChunkedWorld.read()`.
+        self.blocks = blocks
+
+    def __len__(self):
+        return int(numpy.count_nonzero(self.blocks))
+
+    def __repr__(self):
+        return '<%s: %d blocks in %dx%dx%d>' % (
+            (type(self).__name__, len(self)) + self.size)
+
+    @property
+    def size(self):
+        """ The (x, y, z) extent of the box.
+
+        """
+        return self.blocks.shape
+
+    def rotated(self, turns=1):
+        """ Return a copy turned by `turns` quarter turns about the y axis,
+        each one from the +x axis towards the +z axis.
+        绕y轴旋转
+
+        """
+        return Clipboard(numpy.ascontiguousarray(
+            numpy.rot90(self.blocks, turns, axes=(0, 2))))
+
+
+class EditBatch(object):
+    """ The block edits made to a `Model` inside one `Model.batch_edit()`.
+
+    Edits go to the world as they are made, but the meshes of the sectors
+    they touch are only rebuilt when the batch commits, once per sector,
+    and only where the final blocks differ from those the batch started
+    from. The batch remembers what each edited position held before, and
+    what the boxes written by region operations held, so the whole
+    transaction can be undone.
+    批量编辑: 提交时每个区块只重建一次网格, 并且可以整体撤销
+
+    """
+
+    def __init__(self, model, immediate=True):
+        self.model = model
+        self.immediate = immediate
+        # Mapping from position to the block id (None for air) it held
+        # before the batch first edited it.
+        self.before = {}
+        # The edits in the order they were made: positions, keys of
+        # `before`, and `(box, blocks)` pairs for region operations, `blocks`
+        # holding what the box x0, y0, z0, x1, y1, z1 held before, as read
+        # by `ChunkedWorld.read()`.
+        self.log = []
+
+    def __len__(self):
+        return len(self.log)
+
+    def record(self, position):
+        """ Remember the block at `position` before its first edit.
+
+        """
+        if position not in self.before:
+            self.before[position] = self.model.world.get(position)
+            self.log.append(position)
+
+    def record_region(self, box):
+        """ Remember the blocks of `box`, x0, y0, z0, x1, y1, z1 (inclusive),
+        before a region operation writes to it.
+
+        """
+        self.log.append((box, self.model.world.read(*box)))
+
+    def changes(self):
+        """ Return the `{position: block_id}` of the positions edited one at
+        a time whose block differs from before the batch, None for air.
+
+        """
+        world = self.model.world
+        changes = {}
+        for position, block_id in self.before.items():
+            now = world.get(position)
+            if now != block_id:
+                changes[position] = now
+        return changes
+
+    def sectors(self):
+        """ Return the sectors whose mesh the changes of the batch affect:
+        the sectors of the changed positions, and the neighbouring sectors
+        of those on a sector border.
+
+        """
+        sectors = set()
+        for x, y, z in self.changes():
+            for dx, dy, dz in FACES:
+                sectors.add(sectorize((x + dx, y, z + dz)))
+        world = self.model.world
+        for entry in self.log:
+            if len(entry) == 3:
+                continue
+            (x0, _, z0, x1, _, z1), blocks = entry
+            xs, zs = numpy.nonzero((world.read(*entry[0]) != blocks).any(1))
+            # Mark the sectors of the changed columns and of their faces in
+            # a grid of the sectors around the box.
+            sx0, sz0 = (x0 - 1) // SECTOR_SIZE, (z0 - 1) // SECTOR_SIZE
+            grid = numpy.zeros(((x1 + 1) // SECTOR_SIZE - sx0 + 1,
+                                (z1 + 1) // SECTOR_SIZE - sz0 + 1),
+                               dtype=bool)
+            for dx, dz in ((0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)):
+                grid[(xs + x0 + dx) // SECTOR_SIZE - sx0,
+                     (zs + z0 + dz) // SECTOR_SIZE - sz0] = True
+            sectors.update((sx0 + i, 0, sz0 + j)
+                           for i, j in numpy.argwhere(grid).tolist())
+        return sectors
+
+    def undo(self, immediate=None):
+        """ Put back every block the batch changed, as a batch of its own.
+        Returns that batch, whose `undo()` redoes the edits.
+        撤销整个批量编辑
+
+        """
+        if immediate is None:
+            immediate = self.immediate
+        model = self.model
+        with model.batch_edit(immediate) as batch:
+            # Newest first, so that each cell ends up as the oldest record
+            # of it has it: as it was before the batch.
+            for entry in reversed(self.log):
+                if len(entry) == 2:
+                    box, blocks = entry
+                    model.paste(Clipboard(blocks), box[:3])
+                    continue
+                block_id = self.before[entry]
+                if block_id is not None:
+                    if model.world.get(entry) != block_id:
+                        model.add_block(entry, block_id)
+                elif entry in model.world:
+                    model.remove_block(entry)
+        return batch
+
+
+class QuadIndexBuffer(object):
+    """ Element buffer shared by every SectorMesh. Quad i of a mesh is its
+    vertices 4i to 4i + 3, drawn as the triangles (4i, 4i + 1, 4i + 2) and
+    (4i, 4i + 2, 4i + 3), so one buffer of those indices serves every mesh
+    with at most `quads` quads. Grown as needed.
+    所有区块共用的四边形索引缓冲
+
+    """
+
+    def __init__(self):
+        self.id = None
+        self.quads = 0
+
+    def reserve(self, quads):
+        """ Make sure the buffer indexes at least `quads` quads.
+
+        """
+        if quads <= self.quads:
+            return
+        quads = max(quads, 2 * self.quads, 4096)
+        corners = numpy.array([0, 1, 2, 0, 2, 3], dtype=numpy.uint32)
+        indices = (numpy.arange(quads, dtype=numpy.uint32)[:, None] * 4 +
+                   corners).ravel()
+        if self.id is None:
+            self.id = GLuint()
+            glGenBuffers(1, ctypes.byref(self.id))
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.id)
+        glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes,
+                     indices.ctypes.data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        self.quads = quads
+
+    def delete(self):
+        if self.id is not None:
+            glDeleteBuffers(1, ctypes.byref(self.id))
+            self.id = None
+            self.quads = 0
+
+
+class Profiler(object):
+    """ Rolling timings of named scopes of the game loop, shown on the F3
+    screen and written out by `dump()`.
+
+    Every scope keeps its latest `samples` durations in a ring, so its
+    percentiles follow what the game does now rather than since it started.
+    `frame()` records the time between two frames the same way, as the
+    'frame' scope.
+    性能分析器: 记录各阶段耗时的滚动百分位数
+
+    """
+
+    def __init__(self, samples=PROFILE_SAMPLES):
+        self.samples = samples
+        # Mapping from name to `Scope`.
+        self.scopes = {}
+        self._frame = None
+
+    def scope(self, name):
+        """ Return the `Scope` called `name`, a context manager recording
+        the time spent inside it, see also `profiled()`.
+
+        """
+        scope = self.scopes.get(name)
+        if scope is None:
+            scope = self.scopes[name] = Scope(self.samples)
+        return scope
+
+    def record(self, name, seconds):
+        """ Add a duration of `seconds` to scope `name`.
+
+        """
+        self.scope(name).record(seconds)
+
+    def frame(self):
+        """ Record the time since the last call as a 'frame'.
+
+        """
+        now = time.perf_counter()
+        if self._frame is not None:
+            self.record('frame', now - self._frame)
+        self._frame = now
+
+    def history(self, name):
+        """ Return the durations kept for scope `name`, oldest first.
+
+        """
+        scope = self.scopes.get(name)
+        return [] if scope is None else scope.history()
+
+    def reset(self):
+        """ Forget every duration recorded so far.
+
+        """
+        for scope in self.scopes.values():
+            scope.count = 0
+        self._frame = None
+
+    def stats(self):
+        """ Return `{name: {'count', 'mean', 'p50', 'p95', 'p99', 'max'}}`
+        for every scope, durations in seconds over the kept samples and
+        `count` over all of them.
+
+        """
+        stats = {}
+        for name, scope in sorted(self.scopes.items()):
+            if not scope.count:
+                continue
+            samples = numpy.array(scope.ring[:scope.count])
+            p50, p95, p99 = numpy.percentile(samples, (50, 95, 99)).tolist()
+            stats[name] = {'count': scope.count,
+                           'mean': float(samples.mean()),
+                           'p50': p50, 'p95': p95, 'p99': p99,
+                           'max': float(samples.max())}
+        return stats
+
+    def dump(self, path, counters=None):
+        """ Write the stats of every scope, in milliseconds, and the
+        `counters` given (e.g. `Model.counters()`) to `path`: JSON, with
+        the kept frame times, if it ends in .json, else CSV.
+        导出性能数据(CSV或JSON)
+
+        """
+        counters = counters or {}
+        rows = {name: dict([('count', stat['count'])] +
+                           [(key + '_ms', stat[key] * 1e3)
+                            for key in ('mean', 'p50', 'p95', 'p99', 'max')])
+                for name, stat in self.stats().items()}
+        with open(path, 'w', newline='') as f:
+            if str(path).endswith('.json'):
+                json.dump({'scopes': rows, 'counters': counters,
+                           'frames_ms': [seconds * 1e3 for seconds in
+                                         self.history('frame')]},
+                          f, indent=1)
+                return
+            writer = csv.writer(f)
+            writer.writerow(['name', 'count', 'mean_ms', 'p50_ms', 'p95_ms',
+                             'p99_ms', 'max_ms', 'value'])
+            for name, row in rows.items():
+                writer.writerow([name] + list(row.values()) + [''])
+            for name, value in counters.items():
+                writer.writerow([name] + [''] * 6 + [value])
+
+
+class Scope(object):
+    """ One timed scope of a `Profiler`: a ring of its latest `samples`
+    durations. Used as a context manager it records the time spent inside.
+
+    """
+
+    __slots__ = ('ring', 'count', 'start')
+
+    def __init__(self, samples):
+        self.ring = [0.0] * samples
+        # Number of durations recorded, the latest at (count - 1) % samples.
+        self.count = 0
+        self.start = 0.0
+
+    def record(self, seconds):
+        self.ring[self.count % len(self.ring)] = seconds
+        self.count += 1
+
+    def history(self):
+        """ Return the durations kept, oldest first.
+
+        """
+        if self.count <= len(self.ring):
+            return self.ring[:self.count]
+        start = self.count % len(self.ring)
+        return self.ring[start:] + self.ring[:start]
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.record(time.perf_counter() - self.start)
+
+
+# The profiler of the game loop, see the F3 screen.
+# 游戏循环的性能分析器
+PROFILER = Profiler()
+
+
+def profiled(name):
+    """ Decorator timing every call of the function as scope `name` of
+    PROFILER, unless PROFILING is off when it is applied.
+
+    """
+    def decorate(func):
+        if not PROFILING:
+            return func
+        scope = PROFILER.scope(name)
+        perf_counter = time.perf_counter
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                scope.record(perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+class SectorMesh(object):
+    """ The mesh of one sector in a single vertex buffer. Positions are
+    stored as shorts relative to the sector, the block corners at x - 0.5
+    and x + 0.5 becoming the integers x and x + 1, followed by the float
+    texture coordinates. Drawn with the shared QuadIndexBuffer.
+    单个区块的顶点缓冲(坐标以相对区块的短整数存储)
+
+    Parameters
+    ----------
+    origin : tuple of len 3
+        World position of the sector's local (0, 0, 0) block.
+    parts : list
+        `(group, vertices, tex_coords)` for each texture group, as built by
+        `build_sector_mesh()`.
+
+    """
+
+    # Bytes per vertex: three shorts padded to four, and two floats.
+    VERTEX_SIZE = 16
+
+    def __init__(self, origin, parts):
+        # Added back by the modelview matrix when drawing.
+        self.offset = tuple(float(c) - 0.5 for c in origin)
+        self.ranges = []
+        positions, tex_coords = [], []
+        quads = 0
+        for group, vertex_data, texture_data in parts:
+            count = len(vertex_data) // 12
+            self.ranges.append((group, quads, count))
+            quads += count
+            local = numpy.zeros((count * 4, 4), dtype=numpy.int16)
+            local[:, :3] = numpy.rint(vertex_data.reshape(-1, 3) -
+                                      self.offset)
+            positions.append(local)
+            tex_coords.append(texture_data.astype(numpy.float32))
+        self.quads = quads
+        positions = numpy.concatenate(positions).tobytes()
+        data = positions + numpy.concatenate(tex_coords).tobytes()
+        self.tex_offset = len(positions)
+        self.id = GLuint()
+        glGenBuffers(1, ctypes.byref(self.id))
+        glBindBuffer(GL_ARRAY_BUFFER, self.id)
+        glBufferData(GL_ARRAY_BUFFER, len(data), data, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self):
+        """ Draw the mesh. The vertex and texture coordinate arrays must be
+        enabled and the QuadIndexBuffer bound, see `Model.draw()`.
+
+        """
+        glPushMatrix()
+        glTranslatef(*self.offset)
+        glBindBuffer(GL_ARRAY_BUFFER, self.id)
+        glVertexPointer(3, GL_SHORT, 8, 0)
+        glTexCoordPointer(2, GL_FLOAT, 0, self.tex_offset)
+        for group, first, count in self.ranges:
+            group.set_state()
+            # 4 bytes per index, 6 indices per quad.
+            glDrawElements(GL_TRIANGLES, count * 6, GL_UNSIGNED_INT,
+                           first * 24)
+            group.unset_state()
+        glPopMatrix()
+
+    def delete(self):
+        glDeleteBuffers(1, ctypes.byref(self.id))
+
+
+class Model(object):
+
+    def __init__(self, headless=False, path=None, generator=None):
+
+        # Without a GL context (benchmarks, tools) the world is kept but
+        # nothing is uploaded for drawing.
+        # 无窗口模式, 不创建任何OpenGL资源
+        self.headless = headless
+
+        # Mapping from sector to the Batch drawing its mesh. A Batch is a
+        # collection of vertex lists for batched rendering. Each sector has
+        # its own so that sectors out of view are not drawn at all.
+        # 每个区块一个Batch, 以便视锥体剔除
+        self.batches = {}
+
+        # Mapping from sector to the (lo, hi) corners of the box around its
+        # mesh, and the number of shown sectors drawn and culled by the last
+        # `draw()`.
+        self.bounds = {}
+        self.drawn = 0
+        self.culled = 0
+
+        # Cave culling, see `update_occlusion()`: the `(revision, sections)`
+        # of `section_connectivity()` for each chunk, the shown sectors seen
+        # through air from the camera (None draws all of them), the number
+        # of shown sectors that are not, and the shown sectors whose mesh is
+        # not built until they are.
+        # 洞穴剔除
+        self.visgraph = {}
+        self.reached = None
+        self.pruned = 0
+        self.deferred = set()
+        self._occlusion_key = None
+
+        # A TextureGroup manages an OpenGL texture.
+        # 定义材质表
+        self.atlas = None if headless else image.load(TEXTURE_PATH)
+        self.group = None if headless else \
+            TextureGroup(self.atlas.get_texture())
+
+        # Whether sector meshes merge coplanar faces, see GREEDY_MESHING.
+        # Greedy meshes are drawn with one repeating texture per tile, kept in
+        # `tile_groups` by index into `BLOCKS.tiles`.
+        self.greedy = GREEDY_MESHING
+        self.tile_groups = {}
+
+        # Whether sector meshes are drawn as SectorMesh buffers, kept in
+        # `buffers`, instead of Batches, see INDEXED_MESHES.
+        self.indexed = INDEXED_MESHES
+        self.buffers = {}
+        self.indices = None if headless else QuadIndexBuffer()
+
+        # A mapping from position to the block id at that position, backed by
+        # per-sector chunk arrays. This defines all the blocks that are
+        # currently in the world.
+        # 存档数据
+        self.world = ChunkedWorld()
+
+        # The sectors that are currently shown.
+        # 方块渲染优化: 可视的区块
+        self.shown = set()
+
+        # Mapping from sector to the list of pyglet `VertexList`s holding its
+        # mesh.
+        self._shown = {}
+
+        # Mapping from sector to the `Chunk` holding the blocks inside that
+        # sector. Shared with `world`.
+        self.sectors = self.world.chunks
+
+        # Priority queue of `(priority, order, func, args)` calls, see
+        # `_enqueue()`. The queue is populated with _upload_finished(),
+        # _hide_sector(), _submit_shown() and _submit_stale() calls. Mesh
+        # workers push to it from their own threads under `_queue_lock`, it
+        # is only consumed on the main thread.
+        # 优先队列
+        self.queue = []
+        self._queue_lock = threading.Lock()
+        self._queue_order = 0
+
+        # Radius of the circle of shown sectors, see RENDER_DISTANCE, and
+        # the sector it is centered on.
+        # 渲染距离与当前中心区块
+        self.render_distance = RENDER_DISTANCE
+        self.center = None
+
+        # The (x, z) direction the player looks in. Sectors ahead of the
+        # player are meshed before those behind.
+        self.direction = (0.0, 0.0)
+
+        # Mapping from sector to the number of vertices uploaded for it, and
+        # their total, kept under MAX_RESIDENT_VERTICES.
+        # 已上传的顶点数
+        self.resident = {}
+        self.resident_vertices = 0
+
+        # Pool building sector meshes off the main thread, and the latest
+        # in-flight build `Future` of each sector.
+        # 后台生成区块网格的线程池
+        self.mesher = ThreadPoolExecutor(MESH_WORKERS)
+        self._pending = {}
+
+        # The shown sectors edited with `immediate=False` since their queued
+        # `_submit_stale()` call. Any number of edits to a sector between two
+        # frames cost one mesh build.
+        # 等待重建网格的区块
+        self._stale = set()
+
+        # The open `EditBatch`es, innermost last, see batch_edit().
+        # 进行中的批量编辑
+        self._batches = []
+
+        # Whether a region operation inside the open batches changed chunks
+        # the journal does not describe, see _mark_region().
+        self._unjournaled = False
+
+        # Mapping from sector to the `(stamp, meshes)` of its last build, see
+        # `ChunkedWorld.stamp()`. Showing a sector again reuses the meshes
+        # while the stamp matches, so buried blocks are never rescanned.
+        # Least recently used first, at most MESH_CACHE_SIZE entries.
+        # 区块网格缓存
+        self.meshes = {}
+
+        # Where the world is saved. A saved world is loaded lazily, a chunk
+        # at a time as its sector is first shown.
+        # 存档, 区块在首次显示时才从存档中加载
+        self.store = None if path is None else RegionStore(path)
+        self.world.store = self.store
+
+        # Background writer saving edited chunks, see Autosaver.
+        # 自动保存
+        self.autosave = None
+        if self.store is not None:
+            self.autosave = Autosaver(self.world, self.store)
+
+        # The `TerrainGenerator` building the chunks that were never saved,
+        # as they are first shown, see world_generator().
+        # 地形生成器, 区块在首次显示时才生成
+        generator = world_generator(self.store, generator)
+        self.generator = self.world.generator = generator
+
+        # Worker processes generating the chunks of shown sectors, see
+        # GENERATION_WORKERS. The main thread only generates the chunk the
+        # player is in, when the workers are late.
+        # 地形生成进程池
+        self.generation = None
+        if GENERATION_WORKERS:
+            self.generation = GenerationPool(
+                generator, GENERATION_WORKERS,
+                lambda future: self._enqueue(self._generated, future,
+                                             priority=(0, 0.0)))
+
+        if self.autosave is not None:
+            self.autosave.replay()
+
+    def fill_region(self, x0, y0, z0, x1, y1, z1, block_id,
+                    immediate=False):
+        """ Fill the box from (x0, y0, z0) to (x1, y1, z1), bounds inclusive,
+        with `block_id` (None clears it). The box is clipped to the world and
+        written a chunk slab at a time. Like `add_block(..., immediate=False)`
+        the shown sectors it changes are rebuilt on the mesh worker pool,
+        unless `immediate`.
+        批量填充区域
+
+        Parameters
+        ----------
+        x0, y0, z0, x1, y1, z1 : int
+            Opposite corners of the box.
+        block_id : int or None
+            The Block ID to fill with, index of BLOCKS.
+        immediate : bool
+            Whether or not to rebuild the shown sectors now.
+
+        """
+        box = self._clip(x0, y0, z0, x1, y1, z1)
+        if box is None:
+            return
+        self._before_region(box)
+        self.world.fill(*(box + (block_id,)))
+        if self.autosave is not None:
+            self.autosave.record(*(box + (block_id,)))
+        self._after_region(box, immediate)
+
+    def replace_region(self, x0, y0, z0, x1, y1, z1, old_id, new_id,
+                       immediate=False):
+        """ Replace the blocks `old_id` with `new_id` inside the box from
+        (x0, y0, z0) to (x1, y1, z1), bounds inclusive, None standing for
+        air. Returns the number of blocks replaced. Like `fill_region()`.
+        批量替换区域内的方块
+
+        """
+        box = self._clip(x0, y0, z0, x1, y1, z1)
+        if box is None:
+            return 0
+        self._before_region(box)
+        replaced = self.world.replace(*(box + (old_id, new_id)))
+        self._mark_region(box)
+        self._after_region(box, immediate)
+        return replaced
+
+    def copy_region(self, x0, y0, z0, x1, y1, z1):
+        """ Return a `Clipboard` holding the blocks of the box from
+        (x0, y0, z0) to (x1, y1, z1), bounds inclusive, clipped to the
+        world. Chunks are read a slab at a time.
+        复制区域到剪贴板
+
+        """
+        box = self._clip(x0, y0, z0, x1, y1, z1)
+        if box is None:
+            return Clipboard(numpy.zeros((0, 0, 0), dtype=numpy.uint8))
+        return Clipboard(self.world.read(*box))
+
+    def paste(self, clipboard, position, air=True, immediate=False):
+        """ Write the blocks of `clipboard` with its lowest corner at
+        `position`. Without `air` the air of the clipboard leaves the world
+        as it was. What falls outside the world is dropped. Like
+        `fill_region()`.
+        粘贴剪贴板
+
+        """
+        x, y, z = position
+        nx, ny, nz = clipboard.size
+        box = self._clip(x, y, z, x + nx - 1, y + ny - 1, z + nz - 1)
+        if box is None or 0 in clipboard.size:
+            return
+        self._before_region(box)
+        self._write_blocks(clipboard.blocks, position, air)
+        self._mark_region(box)
+        self._after_region(box, immediate)
+
+    def clone_region(self, x0, y0, z0, x1, y1, z1, position, turns=0,
+                     air=True, immediate=False):
+        """ Copy the box from (x0, y0, z0) to (x1, y1, z1), bounds
+        inclusive, to `position`, turned by `turns` quarter turns about the
+        y axis, see `Clipboard.rotated()`. Like `paste()`.
+        克隆区域
+
+        """
+        clipboard = self.copy_region(x0, y0, z0, x1, y1, z1)
+        if turns % 4:
+            clipboard = clipboard.rotated(turns)
+        self.paste(clipboard, position, air, immediate)
+
+    def export_schematic(self, file, x0, y0, z0, x1, y1, z1, compress=True):
+        """ Save the box from (x0, y0, z0) to (x1, y1, z1), bounds inclusive,
+        clipped to the world, as a `Schematic` to `file`, a path or a binary
+        file. The box is read a tile at a time. Returns the number of bytes
+        written.
+        导出结构文件
+
+        """
+        box = self._clip(x0, y0, z0, x1, y1, z1)
+        if box is None:
+            raise ValueError('the box is outside the world')
+        x0, y0, z0, x1, y1, z1 = box
+        size = (x1 - x0 + 1, y1 - y0 + 1, z1 - z0 + 1)
+
+        def read(x, z, nx, nz):
+            return self.world.read(x0 + x, y0, z0 + z,
+                                   x0 + x + nx - 1, y1, z0 + z + nz - 1)
+
+        if not hasattr(file, 'write'):
+            with open(file, 'wb') as f:
+                return Schematic.write(f, size, read, compress)
+        return Schematic.write(file, size, read, compress)
+
+    def import_schematic(self, file, position, air=True, immediate=False):
+        """ Load the `Schematic` in `file`, a path or a binary file, with
+        the lowest corner of its box at `position`, streaming it into the
+        world a tile at a time. Otherwise like `paste()`. Returns the size
+        of the box. Raises ValueError, leaving the world as it was, for a
+        file that is not a schematic this version can read.
+        导入结构文件
+
+        """
+        if not hasattr(file, 'read'):
+            with open(file, 'rb') as f:
+                return self.import_schematic(f, position, air, immediate)
+        size, tiles = Schematic.read(file)
+        x, y, z = position
+        nx, ny, nz = size
+        box = self._clip(x, y, z, x + nx - 1, y + ny - 1, z + nz - 1)
+        if box is None or 0 in size:
+            return size
+        # A schematic found corrupt part way is undone with the batch.
+        with self.batch_edit(immediate):
+            self._before_region(box)
+            for tx, tz, blocks in tiles:
+                self._write_blocks(blocks, (x + tx, y, z + tz), air)
+            self._mark_region(box)
+        return size
+
+    def _write_blocks(self, blocks, position, air=True):
+        """ Write the stored values `blocks` with their lowest corner at
+        `position`, dropping what falls outside the world, see
+        `ChunkedWorld.write()`.
+
+        """
+        x, y, z = position
+        nx, ny, nz = blocks.shape
+        box = self._clip(x, y, z, x + nx - 1, y + ny - 1, z + nz - 1)
+        if box is None:
+            return
+        x0, y0, z0, x1, y1, z1 = box
+        self.world.write(x0, y0, z0, blocks[x0 - x:x1 - x + 1,
+                                            y0 - y:y1 - y + 1,
+                                            z0 - z:z1 - z + 1], air)
+
+    def _clip(self, x0, y0, z0, x1, y1, z1):
+        """ Return the box with opposite corners (x0, y0, z0) and
+        (x1, y1, z1) as x0, y0, z0, x1, y1, z1 clipped to the world (its
+        height, and the `width` of a bounded generator), lowest corner
+        first, or None if nothing is left.
+
+        """
+        x0, x1 = min(x0, x1), max(x0, x1)
+        z0, z1 = min(z0, z1), max(z0, z1)
+        width = self.generator.width
+        if width is not None:
+            x0, x1 = max(x0, -width), min(x1, width)
+            z0, z1 = max(z0, -width), min(z1, width)
+        y0, y1 = max(min(y0, y1), 0), min(max(y0, y1), WORLD_HEIGHT - 1)
+        if x0 > x1 or y0 > y1 or z0 > z1:
+            return None
+        return (x0, y0, z0, x1, y1, z1)
+
+    def _before_region(self, box):
+        """ Let the open batches record `box` before a region operation
+        writes to it.
+
+        """
+        for batch in self._batches:
+            batch.record_region(box)
+
+    def _mark_region(self, box):
+        """ Save the chunks under `box` after a region operation the edit
+        journal cannot describe. Waiting for the next autosave would risk
+        more than a journal interval of edits, so they are saved now, or
+        once the outermost open batch ends.
+
+        """
+        if self.autosave is not None:
+            x0, _, z0, x1, _, z1 = box
+            self.autosave.mark_dirty(region_sectors(x0, z0, x1, z1))
+            self._unjournaled = True
+            if not self._batches:
+                self._save_unjournaled()
+
+    def _save_unjournaled(self):
+        """ Save after the region operations `_mark_region()` left to the
+        end of a batch, if any.
+
+        """
+        if not self._unjournaled:
+            return
+        self._unjournaled = False
+        try:
+            # A whole flush, which truncates the journal: replaying edits
+            # older than the operation over its chunks would undo part of it.
+            self.autosave.flush()
+        except Exception:
+            # The chunks stay dirty for the next autosave.
+            traceback.print_exc()
+
+    def _after_region(self, box, immediate):
+        """ Rebuild the shown sectors a region operation on `box` changed,
+        with the neighbouring sectors of its faces on a sector border,
+        unless a batch is open.
+
+        """
+        if not self._batches:
+            x0, _, z0, x1, _, z1 = box
+            self.refresh(set(region_sectors(x0 - 1, z0, x1 + 1, z1)) |
+                         set(region_sectors(x0, z0 - 1, x1, z1 + 1)),
+                         immediate)
+
+    def set_column_heights(self, heightmap, layers, origin=None):
+        """ Rebuild every column covered by `heightmap` in one batched write
+        per chunk. Unlike `fill_region()` nothing is redrawn, it is meant for
+        building a world before it is shown.
+        根据高度图生成地形
+
+        Parameters
+        ----------
+        heightmap : 2d array of int
+            `heightmap[i][j]` is the y of the top block of the column at
+            (origin x + i, origin z + j). Negative heights clear the column.
+        layers : list of (int or None, int)
+            `(thickness, block_id)` pairs from the surface down. A thickness
+            of None extends the layer down to y = 0.
+        origin : tuple of len 2
+            World (x, z) of `heightmap[0][0]`. Defaults to the corner of the
+            flat world.
+
+        """
+        heights = numpy.asarray(heightmap)
+        x0, z0 = origin or (-WORLD_WIDTH, -WORLD_WIDTH)
+        i0, j0 = 0, 0
+        i1, j1 = heights.shape
+        width = self.generator.width
+        if width is not None:
+            # Crop to the world bounds.
+            i0, j0 = max(-width - x0, 0), max(-width - z0, 0)
+            i1, j1 = min(width - x0 + 1, i1), min(width - z0 + 1, j1)
+        if i0 >= i1 or j0 >= j1:
+            return
+        x0, z0 = x0 + i0, z0 + j0
+        self.world.set_columns(heights[i0:i1, j0:j1], layers, (x0, z0))
+        if self.autosave is not None:
+            x1, z1 = x0 + i1 - i0 - 1, z0 + j1 - j0 - 1
+            self.autosave.mark_dirty(region_sectors(x0, z0, x1, z1))
+
+    def spawn_position(self):
+        """ Return where a new player starts: a few blocks above the ground
+        at the world origin.
+        返回出生点
+
+        """
+        chunk = self.world.chunk((0, 0, 0))
+        ys = [] if chunk is None else numpy.flatnonzero(chunk.blocks[0, :, 0])
+        top = int(ys[-1]) if len(ys) else 64
+        return (0, top + 6, 0)
+
+    def hit_test(self, position, vector, max_distance=8):
+        """ Line of sight search from current position. If a block is
+        intersected it is returned, along with the block previously in the line
+        of sight and the face of the block that was hit. If no block is found,
+        return None, None, None.
+        测试能都触碰到方块
+        通过连线, 最远8格
+
+        The ray is walked one cell at a time with the Amanatides & Woo voxel
+        traversal, so every cell it crosses is visited exactly once.
+        逐格遍历视线穿过的方块(Amanatides & Woo算法)
+
+        Parameters
+        ----------
+        position : tuple of len 3
+            The (x, y, z) position to check visibility from.
+        vector : tuple of len 3
+            The line of sight vector, of unit length.
+        max_distance : int
+            How many blocks away to search for a hit.
+
+        Returns
+        -------
+        block : tuple of len 3 or None
+            The position of the block that was hit.
+        previous : tuple of len 3 or None
+            The cell the line of sight passed through before `block`, None
+            when `position` is inside `block`.
+        face : tuple of len 3 or None
+            The entry of FACES pointing from `block` to `previous`.
+
+        """
+        world = self.world
+        # Blocks are centred on integer positions, shift so that the cell
+        # containing p spans [floor(p), floor(p) + 1).
+        x, y, z = position[0] + 0.5, position[1] + 0.5, position[2] + 0.5
+        dx, dy, dz = vector
+        cx, cy, cz = int(math.floor(x)), int(math.floor(y)), int(math.floor(z))
+        # Per axis: the direction of the step, the distance along the ray to
+        # the next cell boundary and the distance between two boundaries.
+        inf = float('inf')
+        if dx > 0:
+            sx, tx, ddx = 1, (cx + 1 - x) / dx, 1 / dx
+        elif dx < 0:
+            sx, tx, ddx = -1, (cx - x) / dx, -1 / dx
+        else:
+            sx, tx, ddx = 0, inf, inf
+        if dy > 0:
+            sy, ty, ddy = 1, (cy + 1 - y) / dy, 1 / dy
+        elif dy < 0:
+            sy, ty, ddy = -1, (cy - y) / dy, -1 / dy
+        else:
+            sy, ty, ddy = 0, inf, inf
+        if dz > 0:
+            sz, tz, ddz = 1, (cz + 1 - z) / dz, 1 / dz
+        elif dz < 0:
+            sz, tz, ddz = -1, (cz - z) / dz, -1 / dz
+        else:
+            sz, tz, ddz = 0, inf, inf
+        key = (cx, cy, cz)
+        previous = face = None
+        while True:
+            if key in world:
+                return key, previous, face
+            previous = key
+            if tx <= ty and tx <= tz:
+                if tx > max_distance:
+                    break
+                cx += sx
+                tx += ddx
+                face = (-sx, 0, 0)
+            elif ty <= tz:
+                if ty > max_distance:
+                    break
+                cy += sy
+                ty += ddy
+                face = (0, -sy, 0)
+            else:
+                if tz > max_distance:
+                    break
+                cz += sz
+                tz += ddz
+                face = (0, 0, -sz)
+            key = (cx, cy, cz)
+        return None, None, None
+
+    @property
+    def revision(self):
+        """ Counter bumped by every change to the world's blocks. Results
+        computed from the world can be cached against it.
+        世界修改计数, 可用于缓存
+
+        """
+        return self.world.revision
+
+    def exposed(self, position):
+        """ Returns False is given `position` is surrounded on all 6 sides by
+        blocks, True otherwise.
+        检查方块是否被完全遮蔽
+
+        """
+        return self.world.exposed(position)
+
+    def add_block(self, position, block_id, immediate=True):
+        """ Add a block with the given `texture` and `position` to the world.
+        在指定的坐标上添加指定材质的方块
+
+        Parameters
+        ----------
+        position : tuple of len 3
+            The (x, y, z) position of the block to add.
+            添加方块的坐标
+        block_id : list of len 3
+            The coordinates of the texture squares. Use `tex_coords()` to
+            generate.
+            贴图在材质(TEXTURE_PATH)上的坐标(由tex_coords()生成)
+            The Block ID to add to world, index of BLOCKS
+            方块ID, 为BLOCKS的索引
+        immediate : bool
+            Whether or not to draw the block immediately.
+            是否立即绘制方块
+
+        """
+        # Check position
+        # 检查坐标
+        width = self.generator.width
+        if (position[1] < 0) or (position[1] >= WORLD_HEIGHT) or (width is not None and max(abs(position[0]), abs(position[2])) > width):
+            return
+        for batch in self._batches:
+            batch.record(position)
+        self.world[position] = block_id
+        if self.autosave is not None:
+            self.autosave.record(*(position + position), block_id)
+        if not self._batches:
+            self.check_neighbors(position, immediate)
+
+    def remove_block(self, position, immediate=True):
+        """ Remove the block at the given `position`.
+        移除在指定目标上的方块
+
+        Parameters
+        ----------
+        position : tuple of len 3
+            The (x, y, z) position of the block to remove.
+            要删除的方块的坐标
+        immediate : bool
+            Whether or not to immediately remove block from canvas.
+            是否立即移除
+
+        """
+        for batch in self._batches:
+            batch.record(position)
+        del self.world[position]
+        if self.autosave is not None:
+            self.autosave.record(*(position + position), None)
+        if not self._batches:
+            self.check_neighbors(position, immediate)
+
+    @contextmanager
+    def batch_edit(self, immediate=True):
+        """ Context manager grouping the `add_block()` and `remove_block()`
+        calls made inside it into one `EditBatch`, which it yields. Meshes
+        are not rebuilt edit by edit: on leaving the block each sector whose
+        blocks ended up changed is rebuilt once, now or, without
+        `immediate`, on the mesh worker pool. An exception raised inside the
+        block undoes its edits. A batch opened inside another one leaves the
+        rebuilding to the outer batch.
+        批量编辑, 提交时每个区块只重建一次网格
+
+            with model.batch_edit() as batch:
+                for position in positions:
+                    model.remove_block(position)
+            batch.undo()
+
+        """
+        batch = EditBatch(self, immediate)
+        self._batches.append(batch)
+        try:
+            yield batch
+        except BaseException:
+            self._batches.remove(batch)
+            batch.undo()
+            if not self._batches:
+                self._save_unjournaled()
+            raise
+        self._batches.remove(batch)
+        if not self._batches:
+            self.refresh(batch.sectors(), immediate)
+            self._save_unjournaled()
+
+    def check_neighbors(self, position, immediate=True):
+        """ Ensure the visual state of the blocks surrounding `position` is
+        current by rebuilding the mesh of its sector, and of the neighbouring
+        sector when `position` lies on the sector border. Only shown sectors
+        are rebuilt. Usually used after a block is added or removed.
+        重建方块所在区块的网格(方块在区块边界时同时重建相邻区块), 一般用于添加或删除方块之后
+
+        """
+        x, y, z = position
+        self.refresh({sectorize((x + dx, y, z + dz)) for dx, dy, dz in FACES},
+                     immediate)
+
+    def refresh(self, sectors, immediate=True):
+        """ Rebuild the meshes of the shown `sectors` after their blocks
+        changed, now or, without `immediate`, on the mesh worker pool.
+        重建区块网格
+
+        """
+        for sector in sectors:
+            if sector not in self.shown or sector in self.deferred:
+                continue
+            if immediate:
+                self._stale.discard(sector)
+                self._show_sector(sector)
+            elif sector not in self._stale:
+                self._stale.add(sector)
+                self._enqueue(self._submit_stale, sector,
+                              priority=(0, self.priority(sector)))
+
+    def _submit_stale(self, sector):
+        """ Rebuild the mesh of `sector` on the mesh worker pool after the
+        edits made to it with `immediate=False`, if it is still waiting for
+        it and still shown.
+
+        """
+        if sector in self._stale:
+            self._stale.discard(sector)
+            if sector in self.shown and sector not in self.deferred:
+                self._submit(sector)
+
+    def show_sector(self, sector, immediate=False):
+        """ Ensure all blocks in the given sector that should be shown are
+        drawn to the canvas.
         展示区块中所有应该展示的方块
 
+        Parameters
+        ----------
+        sector : tuple of len 3
+            The sector to show.
+        immediate : bool
+            Whether or not to build the sector's mesh immediately, instead of
+            on the mesh worker pool.
+
+        """
+        x, y, z = sector
+        for neighbour in (sector, (x - 1, y, z), (x + 1, y, z),
+                          (x, y, z - 1), (x, y, z + 1)):
+            # The mesh needs the sector and the borders of its neighbours.
+            if self.generation is None:
+                self.world.load(neighbour)
+            elif self.world.load(neighbour, generate=False) is None:
+                self.generation.request(neighbour, self.priority(neighbour))
+        self.shown.add(sector)
+        meshes = self._cached_mesh(sector, self.world.stamp(sector))
+        if meshes is not None:
+            future = self._pending.pop(sector, None)
+            if future is not None:
+                future.cancel()
+            self._upload(sector, meshes)
+        elif immediate:
+            self._show_sector(sector)
+        else:
+            self._enqueue(self._submit_shown, sector,
+                          priority=(2, self.priority(sector)))
+
+    def priority(self, sector):
+        """ Return the priority of loading `sector`, lower first: its
+        distance in sectors from `center`, up to doubled for sectors behind
+        the direction the player looks in.
+        返回加载区块的优先级(距离越近, 越靠近视线方向越优先)
+
+        """
+        if self.center is None:
+            return 0.0
+        dx = sector[0] - self.center[0]
+        dz = sector[2] - self.center[2]
+        distance = math.hypot(dx, dz)
+        vx, vz = self.direction
+        length = math.hypot(vx, vz)
+        if distance and length:
+            cos = (dx * vx + dz * vz) / (distance * length)
+            distance *= 1.5 - 0.5 * cos
+        return distance
+
+    def _submit_shown(self, sector):
+        """ Submit the mesh build of `sector` if it is still shown and not
+        already being built.
+
+        """
+        if sector in self.shown and sector not in self._pending:
+            if self.generating(sector):
+                # Submitted again once its chunks are generated.
+                return
+            if self.reached is not None and sector not in self.reached:
+                # Hidden behind solid ground, see update_occlusion().
+                self.deferred.add(sector)
+                return
+            meshes = self._cached_mesh(sector, self.world.stamp(sector))
+            if meshes is not None:
+                self._upload(sector, meshes)
+            else:
+                self._submit(sector)
+
+    def generating(self, sector):
+        """ Whether the chunk of `sector` or of a neighbour its mesh reads
+        from is still being generated.
+
+        """
+        if self.generation is None or not self.generation.requested:
+            return False
+        x, y, z = sector
+        requested = self.generation.requested
+        return (sector in requested or (x - 1, y, z) in requested or
+                (x + 1, y, z) in requested or (x, y, z - 1) in requested or
+                (x, y, z + 1) in requested)
+
+    def _generated(self, future):
+        """ Add a chunk generated by the worker processes to the world, and
+        build the meshes of the shown sectors that were waiting for it.
+
+        """
+        if future.cancelled() or future not in self.generation.running:
+            return
+        sector, blocks = self.generation.collect(future)
+        self.generation.submit()
+        if blocks is not None and sector not in self.world.chunks and \
+                not self._far(sector):
+            # Not empty, nor loaded meanwhile by an edit or by
+            # change_sectors(), nor left behind by the player.
+            self.world.add_chunk(sector, blocks)
+        # The shown sectors that skipped their build while this chunk was
+        # generating wait for it either way.
+        x, y, z = sector
+        for neighbour in (sector, (x - 1, y, z), (x + 1, y, z),
+                          (x, y, z - 1), (x, y, z + 1)):
+            if neighbour in self.shown:
+                self._enqueue(self._submit_shown, neighbour,
+                              priority=(2, self.priority(neighbour)))
+
+    def _wanted(self, sector):
+        """ Return the generation priority of `sector`, or None once neither
+        it nor a neighbour is shown.
+
+        """
+        x, y, z = sector
+        for neighbour in (sector, (x - 1, y, z), (x + 1, y, z),
+                          (x, y, z - 1), (x, y, z + 1)):
+            if neighbour in self.shown:
+                return self.priority(sector)
+        return None
+
+    def _show_sector(self, sector):
+        """ Private implementation of the `show_sector()` method. Builds the
+        mesh of the sector on the calling thread and uploads it.
+        show_sector()方法的私有实现, 生成区块网格
+
+        """
+        future = self._pending.pop(sector, None)
+        if future is not None:
+            future.cancel()
+        x, _, z = sector
+        origin = (x * SECTOR_SIZE, 0, z * SECTOR_SIZE)
+        meshes = build_sector_mesh(self.world.padded(sector), origin,
+                                   self.greedy)
+        self._cache_mesh(sector, self.world.stamp(sector), meshes)
+        self._upload(sector, meshes)
+
+    def _cached_mesh(self, sector, stamp):
+        """ Return the cached meshes of `sector` if they were built for
+        `stamp`, else None.
+        返回仍然有效的缓存网格
+
+        """
+        entry = self.meshes.pop(sector, None)
+        if entry is None or entry[0] != stamp:
+            return None
+        # Reinsert as the most recently used.
+        self.meshes[sector] = entry
+        return entry[1]
+
+    def _cache_mesh(self, sector, stamp, meshes):
+        """ Remember the `meshes` built for `sector` at `stamp`, dropping
+        the least recently used entries beyond MESH_CACHE_SIZE.
+
+        """
+        self.meshes.pop(sector, None)
+        self.meshes[sector] = (stamp, meshes)
+        while len(self.meshes) > MESH_CACHE_SIZE:
+            del self.meshes[next(iter(self.meshes))]
+
+    def _submit(self, sector):
+        """ Build the mesh of `sector` on the mesh worker pool from a snapshot
+        of its blocks. When done, `_upload_finished()` is queued to hand the
+        result back to the main thread. A newer build of the same sector
+        supersedes this one.
+        将区块网格的生成提交到后台线程池
+
+        """
+        previous = self._pending.get(sector)
+        if previous is not None:
+            previous.cancel()
+        x, _, z = sector
+        origin = (x * SECTOR_SIZE, 0, z * SECTOR_SIZE)
+        future = self.mesher.submit(build_sector_mesh, self.world.padded(sector),
+                                    origin, self.greedy)
+        self._pending[sector] = future
+        stamp = self.world.stamp(sector)
+        # The callback runs on the worker thread.
+        future.add_done_callback(lambda future: self._enqueue(
+            self._upload_finished, sector, future, stamp,
+            priority=(0, self.priority(sector))))
+
+    def _upload_finished(self, sector, future, stamp):
+        """ Upload the result of a worker mesh build, built for the world at
+        `stamp`, unless the sector was hidden, edited or rebuilt since it was
+        submitted.
+
+        """
+        if self._pending.get(sector) is not future or future.cancelled():
+            return
+        del self._pending[sector]
+        meshes = future.result()
+        self._cache_mesh(sector, stamp, meshes)
+        if sector in self.shown:
+            self._upload(sector, meshes)
+
+    def _upload(self, sector, meshes):
+        """ Replace the vertex lists of `sector` with `meshes`, as returned by
+        `build_sector_mesh()`. Must run on the main thread.
+        上传区块网格(仅限主线程)
+
+        """
+        self._release(sector)
+        count = sum(len(vertex_data) // 3
+                    for vertex_data, _ in meshes.values())
+        if count:
+            vertices = numpy.concatenate(
+                [vertex_data for vertex_data, _ in meshes.values()])
+            vertices = vertices.reshape(-1, 3)
+            self.bounds[sector] = (tuple(vertices.min(axis=0).tolist()),
+                                   tuple(vertices.max(axis=0).tolist()))
+        self.resident[sector] = count
+        self.resident_vertices += count
+        self._evict()
+        if self.headless or sector not in self.shown:
+            return
+        if self.indexed:
+            parts = [(self.group if tile is None else self._tile_group(tile),
+                      vertex_data, texture_data)
+                     for tile, (vertex_data, texture_data) in meshes.items()
+                     if len(vertex_data)]
+            if parts:
+                x, _, z = sector
+                mesh = SectorMesh((x * SECTOR_SIZE, 0, z * SECTOR_SIZE), parts)
+                self.indices.reserve(mesh.quads)
+                self.buffers[sector] = mesh
+            return
+        batch = self.batches[sector] = pyglet.graphics.Batch()
+        vertex_lists = []
+        for tile, (vertex_data, texture_data) in meshes.items():
+            count = len(vertex_data) // 3
+            if not count:
+                continue
+            group = self.group if tile is None else self._tile_group(tile)
+            vertex_lists.append(batch.add(
+                count, GL_QUADS, group,
+                ('v3f/static', vertex_data.tolist()),
+                ('t2f/static', texture_data.tolist())))
+        self._shown[sector] = vertex_lists
+
+    def _release(self, sector):
+        """ Delete the vertex lists of `sector`.
+
+        """
+        for vertex_list in self._shown.pop(sector, ()):
+            vertex_list.delete()
+        self.batches.pop(sector, None)
+        mesh = self.buffers.pop(sector, None)
+        if mesh is not None:
+            mesh.delete()
+        self.bounds.pop(sector, None)
+        self.resident_vertices -= self.resident.pop(sector, 0)
+
+    def _evict(self):
+        """ Hide the shown sectors farthest from the player until the
+        uploaded vertices fit in MAX_RESIDENT_VERTICES.
+        超出顶点上限时隐藏最远的区块
+
+        """
+        while self.resident_vertices > MAX_RESIDENT_VERTICES:
+            sector = max(self.resident, key=self.priority)
+            self.hide_sector(sector, immediate=True)
+
+    def counters(self):
+        """ Return the numbers the F3 screen shows about the model: the
+        length of `queue`, the blocks in shown sectors and in all loaded
+        chunks, the shown sectors and the vertices uploaded for drawing.
+        返回调试屏幕显示的统计数据
+
+        """
+        sectors = self.world.chunks
+        return {'queue': len(self.queue),
+                'shown_blocks': sum(sectors[sector].count
+                                    for sector in self.shown
+                                    if sector in sectors),
+                'blocks': len(self.world),
+                'shown_sectors': len(self.shown),
+                'resident_vertices': self.resident_vertices}
+
+    def visible(self, planes):
+        """ Return the shown sectors whose mesh may be inside the frustum
+        bounded by `planes`, see `frustum_planes()`, and count the sectors
+        drawn and culled.
+        返回视锥体内的区块
+
+        """
+        reached = self.reached
+        candidates = [(sector, box) for sector, box in self.bounds.items()
+                      if reached is None or sector in reached]
+        sectors = [sector for sector, (lo, hi) in candidates
+                   if box_in_frustum(planes, lo, hi)]
+        self.drawn = len(sectors)
+        self.culled = len(candidates) - self.drawn
+        return sectors
+
+    def connectivity(self, sector):
+        """ Return `section_connectivity()` of the chunk of `sector`,
+        recomputed only when the chunk changed.
+
+        """
+        chunk = self.world.chunks.get(sector)
+        if chunk is None:
+            return (OPEN_SECTION,) * SECTIONS
+        entry = self.visgraph.get(sector)
+        if entry is None or entry[0] != chunk.revision:
+            entry = self.visgraph[sector] = (
+                chunk.revision, section_connectivity(chunk.blocks))
+        return entry[1]
+
+    def update_occlusion(self, position):
+        """ Find the shown sectors the camera at `position` may see through
+        air. Walks the SECTOR_SIZE cubed sections from the camera's one,
+        leaving a section only through a face connected to the face it came
+        in by, and never turning back along an axis: a line of sight does
+        neither. Sectors not reached are neither drawn nor meshed until they
+        are. Only redone when the camera changes section or the world
+        changes.
+        从摄像机所在分段出发, 广度优先搜索通过空气可见的区块
+
+        """
+        x, y, z = normalize(position)
+        start = (x // SECTOR_SIZE, y // SECTOR_SIZE, z // SECTOR_SIZE)
+        key = (start, self.world.revision, self.center, len(self.shown))
+        if key == self._occlusion_key:
+            return
+        self._occlusion_key = key
+        if not 0 <= start[1] < SECTIONS:
+            # Above or below the world everything is in the open.
+            self.reached = None
+            self.pruned = 0
+        else:
+            reached = {(start[0], 0, start[2])}
+            visited = {start}
+            queue = deque([(start, None, 0)])
+            while queue:
+                (sx, sy, sz), entered, turned = queue.popleft()
+                sections = self.connectivity((sx, 0, sz))
+                exits = 0b111111 if entered is None else \
+                    sections[sy][entered]
+                for face, (dx, dy, dz) in enumerate(FACES):
+                    # Bit face ^ 1 is the opposite face.
+                    if not exits >> face & 1 or turned >> (face ^ 1) & 1:
+                        continue
+                    section = (sx + dx, sy + dy, sz + dz)
+                    if section in visited or not 0 <= section[1] < SECTIONS \
+                            or (section[0], 0, section[2]) not in self.shown:
+                        continue
+                    visited.add(section)
+                    reached.add((section[0], 0, section[2]))
+                    queue.append((section, face ^ 1, turned | 1 << face))
+            self.reached = reached
+            self.pruned = len(self.shown - reached)
+        for sector in list(self.deferred):
+            if self.reached is None or sector in self.reached:
+                self.deferred.discard(sector)
+                self._enqueue(self._submit_shown, sector,
+                              priority=(2, self.priority(sector)))
+
+    @profiled('draw')
+    def draw(self, planes):
+        """ Draw the shown sectors inside the frustum bounded by `planes`.
+        绘制视锥体内的区块
+
+        """
+        sectors = self.visible(planes)
+        if self.indexed:
+            if self.indices.id is None:
+                # Nothing uploaded yet: the first frame may come before the
+                # first `update()`.
+                # 尚未上传任何区块
+                return
+            glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+            glEnableClientState(GL_VERTEX_ARRAY)
+            glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.indices.id)
+            for sector in sectors:
+                mesh = self.buffers.get(sector)
+                if mesh is not None:
+                    mesh.draw()
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+            glPopClientAttrib()
+            return
+        for sector in sectors:
+            batch = self.batches.get(sector)
+            if batch is not None:
+                batch.draw()
+
+    def load_atlas(self, path, size):
+        """ Draw the blocks from the texture atlas at `path`, `size` squares
+        per side, e.g. a larger one holding the squares of block types
+        registered since. The squares of the blocks registered so far must
+        be at the same columns and rows as in the current atlas. Every shown
+        sector is meshed again.
+        加载新的(更大的)材质表
+
+        """
+        BLOCKS.resize(size)
+        self.meshes.clear()
+        if not self.headless:
+            self.atlas = image.load(path)
+            self.group = TextureGroup(self.atlas.get_texture())
+            self.tile_groups.clear()
+        for sector in self.shown - self.deferred:
+            self._submit(sector)
+
+    def _tile_group(self, tile):
+        """ Return the TextureGroup drawing texture square `tile` (an index
+        into `BLOCKS.tiles`) as a repeating texture, for greedy meshes.
+        返回可平铺的单个材质块
+
+        """
+        group = self.tile_groups.get(tile)
+        if group is None and not self.headless:
+            size = self.atlas.width // BLOCKS.size
+            column, row = BLOCKS.tiles[tile]
+            texture = self.atlas.get_region(
+                column * size, row * size, size, size
+            ).get_image_data().get_texture()
+            glBindTexture(texture.target, texture.id)
+            glTexParameteri(texture.target, GL_TEXTURE_WRAP_S, GL_REPEAT)
+            glTexParameteri(texture.target, GL_TEXTURE_WRAP_T, GL_REPEAT)
+            glTexParameteri(texture.target, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(texture.target, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            group = self.tile_groups[tile] = TextureGroup(texture)
+        return group
+
+    def hide_sector(self, sector, immediate=False):
+        """ Ensure all blocks in the given sector that should be hidden are
+        removed from the canvas. Hiding does not remove the blocks from the
+        world.
+        隐藏区块中所有应该隐藏的方块, 并不会从世界删除这些方块
+
+        Parameters
+        ----------
+        sector : tuple of len 3
+            The sector to hide.
+        immediate : bool
+            Whether or not to remove the sector from the canvas immediately.
+
+        """
+        self.shown.discard(sector)
+        self.deferred.discard(sector)
+        self._stale.discard(sector)
+        future = self._pending.pop(sector, None)
+        if future is not None:
+            future.cancel()
+        if immediate:
+            self._hide_sector(sector)
+        else:
+            self._enqueue(self._hide_sector, sector, priority=(1, 0.0))
+
+    def _hide_sector(self, sector):
+        """ Private implementation of the `hide_sector()` method.
+        hide_sector()的内部实现
+
+        """
+        if sector in self.shown:
+            # Shown again before the queue got to it.
+            return
+        self._release(sector)
+
+    @profiled('change_sectors')
+    def change_sectors(self, before, after):
+        """ Move from sector `before` to sector `after`. A sector is a
+        contiguous x, y sub-region of world. Sectors are used to speed up
+        world rendering.
+
         """
-        for position in self.sectors.get(sector, []):
-            if position not in self.shown and self.exposed(position):
-                self.show_block(position, False)
+        pad = self.render_distance
+        if before and after:
+            move = (after[0] - before[0], 0, after[2] - before[2])
+            show, hide = sector_deltas(pad, move)
+        else:
+            show = hide = sector_offsets(pad)
+        self.center = after
+        if after:
+            # The player stands in this one, it can not wait for a worker.
+            self.world.load(after)
+            x, y, z = after
+            for dx, dy, dz in show:
+                self.show_sector((x + dx, y + dy, z + dz))
+        if before:
+            x, y, z = before
+            for dx, dy, dz in hide:
+                self.hide_sector((x + dx, y + dy, z + dz))
+            self.unload_far()
+        if self.generation is not None:
+            self.generation.reprioritize(self._wanted)
+            self.generation.submit()
+
+    def _far(self, sector):
+        """ Return whether the chunk of `sector` is farther than one sector
+        past the circle of shown sectors, where `unload_far()` drops it.
 
-    def hide_sector(self, sector):
-        """ Ensure all blocks in the given sector that should be hidden are
-        removed from the canvas.
-        隐藏区块中所有应该隐藏的方块
+        """
+        if self.center is None:
+            return False
+        x, y, z = self.center
+        offset = (sector[0] - x, 0, sector[2] - z)
+        return offset not in sector_offsets(self.render_distance + 1)
+
+    def unload_far(self):
+        """ Unload the chunks `_far()` from the player, so that memory does
+        not grow with the distance walked. Edited chunks are saved first. In
+        a world that is not saved they stay loaded, as there is nowhere to
+        load them back from.
+        卸载远处的区块
 
         """
-        for position in self.sectors.get(sector, []):
-            if position in self.shown:
-                self.hide_block(position, False)
+        far = [sector for sector in self.world.chunks if self._far(sector)]
+        if not far:
+            return
+        if self.autosave is not None:
+            try:
+                self.autosave.save(far)
+            except Exception:
+                # Kept until a later save succeeds.
+                traceback.print_exc()
+                return
+        for sector in far:
+            chunk = self.world.chunks[sector]
+            if self.autosave is None and chunk.revision != chunk.loaded:
+                continue
+            self.world.unload(sector)
+            self.visgraph.pop(sector, None)
 
-    def change_sectors(self, before, after):
-        """ Move from sector `before` to sector `after`. A sector is a
-        contiguous x, y sub-region of world. Sectors are used to speed up
-        world rendering.
+    def set_render_distance(self, distance):
+        """ Change the radius of the circle of shown sectors, showing or
+        hiding the sectors in between.
+        修改渲染距离
 
         """
-        before_set = set()
-        after_set = set()
-        pad = 4
-        for dx in xrange(-pad, pad + 1):
-            for dy in [0]:  # xrange(-pad, pad + 1):
-                for dz in xrange(-pad, pad + 1):
-                    if dx ** 2 + dy ** 2 + dz ** 2 > (pad + 1) ** 2:
-                        continue
-                    if before:
-                        x, y, z = before
-                        before_set.add((x + dx, y + dy, z + dz))
-                    if after:
-                        x, y, z = after
-                        after_set.add((x + dx, y + dy, z + dz))
-        show = after_set - before_set
-        hide = before_set - after_set
-        for sector in show:
-            self.show_sector(sector)
-        for sector in hide:
-            self.hide_sector(sector)
-
-    def _enqueue(self, func, *args):
-        """ Add `func` to the internal queue.
-        将函数加入队列
-
-        """
-        self.queue.append((func, args))
+        before, self.render_distance = self.render_distance, distance
+        if self.center is None:
+            return
+        x, y, z = self.center
+        old, new = sector_offsets(before), sector_offsets(distance)
+        for dx, dy, dz in new - old:
+            self.show_sector((x + dx, y + dy, z + dz))
+        for dx, dy, dz in old - new:
+            self.hide_sector((x + dx, y + dy, z + dz))
+        self.unload_far()
+
+    def _enqueue(self, func, *args, priority=(0, 0.0)):
+        """ Add `func` to the internal queue. Calls are made lowest
+        `priority` first, and in the order they were added for equal
+        priorities. Safe to call from any thread.
+        将函数加入优先队列
+
+        """
+        with self._queue_lock:
+            self._queue_order += 1
+            heapq.heappush(self.queue,
+                           (priority, self._queue_order, func, args))
 
     def _dequeue(self):
         """ Pop the top function from the internal queue and call it.
         从内部队列弹出函数并调用
 
         """
-        func, args = self.queue.popleft()
+        with self._queue_lock:
+            _, _, func, args = heapq.heappop(self.queue)
         # print(func, args)
         func(*args)
 
+    @profiled('process_queue')
     def process_queue(self):
         """ Process the entire queue while taking periodic breaks. This allows
         the game loop to run smoothly. The queue contains calls to
-        _show_block() and _hide_block() so this method should be called if
-        add_block() or remove_block() was called with immediate=False
+        _upload_finished() and _hide_sector() so this method should be called
+        if add_block() or remove_block() was called with immediate=False
         处理队列, 这让游戏循环流畅运行
 
         """
+        if self.generation is not None:
+            self.generation.submit()
         start = time.perf_counter()
         while self.queue and time.perf_counter() - start < 1.0 / TICKS_PER_SEC:
+            if self.queue[0][2] == self._submit_shown and \
+                    len(self._pending) >= 2 * MESH_WORKERS:
+                # Keep the rest queued by priority rather than piled up in
+                # the worker pool, where a nearer sector shown later would
+                # wait for them all.
+                break
             self._dequeue()
 
     def process_entire_queue(self):
-        """ Process the entire queue with no breaks.
+        """ Process the entire queue with no breaks, waiting for every chunk
+        generation and mesh build it starts.
 
         """
-        while self.queue:
-            self._dequeue()
+        generation = self.generation
+        while self.queue or self._pending or \
+                (generation is not None and generation.requested):
+            if generation is not None:
+                generation.submit()
+                wait(list(generation.running))
+            wait(list(self._pending.values()))
+            while self.queue:
+                self._dequeue()
+
+    def save(self):
+        """ Write the chunks edited since the last save now, instead of
+        waiting for the autosave.
+        保存世界
 
+        """
+        if self.autosave is not None:
+            self.autosave.flush()
 
-class Window(pyglet.window.Window):
+    def close(self):
+        """ Stop the mesh worker pool and the generation workers, dropping
+        work that has not started, save what is left and close the save.
 
-    def __init__(self, *args, **kwargs):
-        super(Window, self).__init__(*args, **kwargs)
+        """
+        self.mesher.shutdown(wait=False, cancel_futures=True)
+        if self.generation is not None:
+            self.generation.close()
+        if self.autosave is not None:
+            self.autosave.close()
+        if self.store is not None:
+            self.store.close()
 
-        # Whether or not the window exclusively captures the mouse.
-        # 标志-获取焦点
-        self.exclusive = False
+
+class Player(object):
+    """ Position, view direction, motion input and physics of the player.
+    Knows nothing about windows or OpenGL, so it runs headless.
+    玩家: 坐标, 视角, 移动输入与物理(不依赖窗口)
+
+    """
+
+    def __init__(self, position=(0, 70, 0)):
+        # Where `respawn()` puts the player back.
+        # 重生点
+        self.spawn = position
 
         # When flying gravity has no effect and speed is increased.
         # 标志-飞行状态
@@ -572,7 +4136,7 @@ class Window(pyglet.window.Window):
         # Current (x, y, z) position in the world, specified with floats. Note
         # that, perhaps unlike in math class, the y-axis is the vertical axis.
         # 当前坐标, y坐标为垂直坐标
-        self.position = (0, 70, 0)
+        self.position = position
 
         # First element is rotation of the player in the x-z plane (ground
         # plane) measured from the z-axis down. The second is the rotation
@@ -585,77 +4149,49 @@ class Window(pyglet.window.Window):
         # 第二项为垂直角度(-90-90), -90为竖直向下
         self.rotation = (0, 0)
 
-        # Which sector the player is currently in.
-        # 玩家当前所在区块
-        self.sector = None
-
-        # The crosshairs at the center of the screen.
-        # 准星
-        self.reticle = None
-
         # Velocity in the y (upward) direction.
         # 数值速度(?)
         self.dy = 0
 
-        # Full Screen
-        # 全屏
-        self.full_screen = False
-
-        # A list of blocks the player can place. Hit num keys to cycle.
-        # 方块列表(使用数字键盘切换)
-        self.inventory = [_ for _ in range(len(BLOCKS))]
-
         # The current block the user can place. Hit num keys to cycle.
         # 当前手持
         self.block = self.inventory[0]
 
-        # Convenience list of num keys.
-        # 数字键盘的便捷列表
-        self.num_keys = [
-            key._1, key._2, key._3, key._4, key._5,
-            key._6, key._7, key._8, key._9, key._0]
-
-        # Instance of the model that handles the world.
-        # 处理世界的实例
-        self.model = Model()
+    @property
+    def inventory(self):
+        """ A list of blocks the player can place. Hit num keys to cycle.
+        Read from BLOCKS every time, so block types registered while playing
+        can be picked too.
+        方块列表(使用数字键盘切换)
 
-        self.enable_debugScreen = False
+        """
+        return list(xrange(len(BLOCKS)))
 
-        # The label that is displayed in the top left of the canvas.
-        # 在画布左上的文本
-        '''
-        self.label = pyglet.text.Label('', font_name='Arial', font_size=18,
-                                       x=10, y=self.height - 10, anchor_x='left', anchor_y='top',
-                                       color=(0, 0, 0, 255))
-        '''
+    def respawn(self):
+        """ Put the player back at the spawn point.
+        重生
 
-        # self.looking_at_label = pyglet.text.Label('Looking At:', font)
-        # TODO
-        # TEST LABEL for DEBUG
-        self.debugScreen = pyglet.text.Label('', font_name='Minecraft', font_size=12,
-                                             x=10, y=self.height-10, anchor_x='left', anchor_y='top',
-                                             width=self.width*0.6, multiline=True,
-                                             color=(221, 221, 221, 255))
+        """
+        self.position = self.spawn
 
-        # This call schedules the `update()` method to be called
-        # TICKS_PER_SEC. This is the main game event loop.
-        # 使用pyglet.schedule_interval实现的定期更新
-        pyglet.clock.schedule_interval(self.update, 1.0 / TICKS_PER_SEC)
+    def jump(self):
+        """ Jump, if standing on something.
+        跳跃
 
-        # Check if screenshot exists
-        if os.path.exists('screenshots'):
-            pass
-        else:
-            os.mkdir('screenshots')
+        """
+        if self.dy == 0:
+            self.dy = JUMP_SPEED
 
-    def set_exclusive_mouse(self, exclusive):
-        """ If `exclusive` is True, the game will capture the mouse, if False
-        the game will ignore the mouse.
-        如果exclusive_mouse标志为True, 游戏将捕获鼠标, 否则忽略输入
+    def look(self, dx, dy):
+        """ Turn the view by a mouse movement of (`dx`, `dy`).
+        转动视角
 
         """
-        super(Window, self).set_exclusive_mouse(exclusive)
-        self.exclusive = exclusive
+        m = 0.15
+        x, y = self.rotation
+        x, y = x + dx * m, y + dy * m
+        y = max(-90, min(90, y))
+        self.rotation = (x, y)
 
     def get_sight_vector(self):
         """ Returns the current line of sight vector indicating the direction
@@ -715,41 +4251,18 @@ class Window(pyglet.window.Window):
             dz = 0.0
         return (dx, dy, dz)
 
-    def update(self, dt):
-        """ This method is scheduled to be called repeatedly by the pyglet
-        clock.
-        该方法被定期调用以更新游戏
-
-        Parameters
-        ----------
-        dt : float
-            The change in time since the last call.
-            时间变化量
-
-        """
-        # 处理队列
-        self.model.process_queue()
-        # 检测玩家是否改变区块坐标
-        sector = sectorize(self.position)
-        if sector != self.sector:
-            self.model.change_sectors(self.sector, sector)
-            if self.sector is None:
-                self.model.process_entire_queue()
-            self.sector = sector
-        m = 8
-        dt = min(dt, 0.2)
-        for _ in xrange(m):
-            self._update(dt / m)
-
-    def _update(self, dt):
-        """ Private implementation of the `update()` method. This is where most
+    @profiled('player')
+    def update(self, dt, world):
+        """ Move the player by one step of `dt` seconds. This is where most
         of the motion logic lives, along with gravity and collision detection.
-        update()方法的内部实现, 这里是大部分移动逻辑的实现(包括重力和碰撞检测)
+        移动逻辑的实现(包括重力和碰撞检测)
 
         Parameters
         ----------
         dt : float
             The change in time since the last call.
+        world : ChunkedWorld
+            The blocks to collide with.
 
         """
         # walking
@@ -767,20 +4280,25 @@ class Window(pyglet.window.Window):
             self.dy = max(self.dy, -TERMINAL_VELOCITY)
             dy += self.dy * dt
         # collisions
-        x, y, z = self.position
-        x, y, z = self.collide((x + dx, y + dy, z + dz), PLAYER_HEIGHT)
-        self.position = (x, y, z)
+        self.position = self.collide(world, self.position, (dx, dy, dz),
+                                     PLAYER_HEIGHT)
 
-    def collide(self, position, height):
-        """ Checks to see if the player at the given `position` and `height`
-        is colliding with any blocks in the world.
-        检测玩家所在坐标和玩家高度是否和其他方块碰撞
+    @profiled('collide')
+    def collide(self, world, position, motion, height):
+        """ Move the player at the given `position` and `height` by `motion`,
+        stopping against any blocks in the way.
+        将玩家按motion移动, 遇到方块时停下(扫掠碰撞检测)
 
         Parameters
         ----------
+        world : ChunkedWorld
+            The blocks to collide with.
         position : tuple of len 3
-            The (x, y, z) position to check for collisions at.
+            The (x, y, z) position to move from.
             坐标
+        motion : tuple of len 3
+            The (dx, dy, dz) to move by.
+            位移
         height : int or float
             The height of the player.
             玩家高度
@@ -791,34 +4309,225 @@ class Window(pyglet.window.Window):
             The new position of the player taking into account collisions.
 
         """
-        # How much overlap with a dimension of a surrounding block you need to
-        # have to count as a collision. If 0, touching terrain at all counts as
-        # a collision. If .49, you sink into the ground, as if walking through
-        # tall grass. If >= .5, you'll fall through the ground.
+        # How much of each side of a cell the player's box leaves free. If 0,
+        # the player is exactly as wide as a block. The box spans `height`
+        # cells stacked down from the one containing `position`, shrunk by
+        # `pad` on every side.
         pad = 0.25
-        p = list(position)
-        np = normalize(position)
-        for face in FACES:  # check all surrounding blocks
-            for i in xrange(3):  # check each dimension independently
-                if not face[i]:
-                    continue
-                # How much overlap you have with this dimension.
-                d = (p[i] - np[i]) * face[i]
-                if d < pad:
-                    continue
-                for dy in xrange(int(height)):  # check each height
-                    op = list(np)
-                    op[1] -= dy
-                    op[i] += face[i]
-                    if tuple(op) not in self.model.world:
-                        continue
-                    p[i] -= (d - pad) * face[i]
-                    if face == (0, -1, 0) or face == (0, 1, 0):
-                        # You are colliding with the ground or ceiling, so stop
-                        # falling / rising.
-                        self.dy = 0
-                    break
-        return tuple(p)
+        x, y, z = position
+        lo = (x - 0.5 + pad, y - int(height) + 0.5 + pad, z - 0.5 + pad)
+        hi = (x + 0.5 - pad, y + 0.5 - pad, z + 0.5 - pad)
+        (dx, dy, dz), hit = sweep_box(world, lo, hi, motion)
+        if hit[1]:
+            # You are colliding with the ground or ceiling, so stop
+            # falling / rising.
+            self.dy = 0
+        return (x + dx, y + dy, z + dz)
+
+
+class Simulation(object):
+    """ The game without its window: a `Model` and a `Player` advanced in
+    fixed ticks of 1 / TICKS_PER_SEC seconds, however often `update()` is
+    called. `Window` only draws it and feeds it input, so it runs just as
+    well headless.
+    游戏逻辑(不依赖窗口), 以固定时间步长推进
+
+    """
+
+    def __init__(self, model, player=None):
+        # Instance of the model that handles the world.
+        # 处理世界的实例
+        self.model = model
+
+        self.player = Player(model.spawn_position()) if player is None \
+            else player
+
+        # Which sector the player is currently in.
+        # 玩家当前所在区块
+        self.sector = None
+
+        # Time passed to `update()` that has not been simulated yet.
+        # 尚未模拟的时间
+        self.accumulator = 0.0
+
+        # Number of ticks simulated so far.
+        self.ticks = 0
+
+        # Seconds spent in each subsystem since the start.
+        # 各子系统累计耗时
+        self.timings = {'queue': 0.0, 'sectors': 0.0, 'physics': 0.0,
+                        'occlusion': 0.0}
+
+    @profiled('update')
+    def update(self, dt):
+        """ Advance the game by `dt` seconds of real time: process the mesh
+        queue once, then run as many whole ticks as fit in the time not
+        simulated yet.
+        推进游戏dt秒
+
+        Parameters
+        ----------
+        dt : float
+            The change in time since the last call.
+            时间变化量
+
+        Returns
+        -------
+        ticks : int
+            The number of ticks run.
+
+        """
+        start = time.perf_counter()
+        # 处理队列
+        self.model.process_queue()
+        self.timings['queue'] += time.perf_counter() - start
+        # Never try to catch up more than 0.2 seconds, or a slow frame
+        # leads to more ticks and an even slower frame.
+        self.accumulator = min(self.accumulator + dt, 0.2)
+        step = 1.0 / TICKS_PER_SEC
+        ticks = 0
+        while self.accumulator >= step:
+            self.accumulator -= step
+            self.tick()
+            ticks += 1
+        return ticks
+
+    @profiled('tick')
+    def tick(self):
+        """ Run one fixed tick: follow the player with the shown sectors and
+        move the player.
+        运行一个固定时间步
+
+        """
+        start = time.perf_counter()
+        # 检测玩家是否改变区块坐标
+        sector = sectorize(self.player.position)
+        if sector != self.sector:
+            dx, _, dz = self.player.get_sight_vector()
+            self.model.direction = (dx, dz)
+            self.model.change_sectors(self.sector, sector)
+            if self.sector is None:
+                self.model.process_entire_queue()
+            self.sector = sector
+        middle = time.perf_counter()
+        self.player.update(1.0 / TICKS_PER_SEC, self.model.world)
+        physics = time.perf_counter()
+        self.model.update_occlusion(self.player.position)
+        end = time.perf_counter()
+        self.timings['sectors'] += middle - start
+        self.timings['physics'] += physics - middle
+        self.timings['occlusion'] += end - physics
+        self.ticks += 1
+
+    def hit_test(self):
+        """ Cast the player's line of sight into the world, see
+        `Model.hit_test`.
+
+        """
+        vector = self.player.get_sight_vector()
+        return self.model.hit_test(self.player.position, vector)
+
+
+class Window(pyglet.window.Window):
+
+    def __init__(self, *args, **kwargs):
+        super(Window, self).__init__(*args, **kwargs)
+
+        # Whether or not the window exclusively captures the mouse.
+        # 标志-获取焦点
+        self.exclusive = False
+
+        # The game this window shows, and the world and player in it.
+        # 窗口显示的游戏
+        self.simulation = Simulation(Model(path=WORLD_PATH))
+        self.model = self.simulation.model
+        self.player = self.simulation.player
+
+        # The crosshairs at the center of the screen.
+        # 准星
+        self.reticle = None
+
+        # The block under the crosshairs and the (position, rotation, world
+        # revision) it was found for, see get_focused_block().
+        # 准星指向的方块(缓存)
+        self.focused = None
+        self._focus_key = None
+
+        # Reusable vertex list outlining the focused block, and the block it
+        # currently outlines.
+        self._outline = None
+        self._outlined = None
+
+        # Full Screen
+        # 全屏
+        self.full_screen = False
+
+        # Convenience list of num keys.
+        # 数字键盘的便捷列表
+        self.num_keys = [
+            key._1, key._2, key._3, key._4, key._5,
+            key._6, key._7, key._8, key._9, key._0]
+
+        self.enable_debugScreen = False
+
+        # The label that is displayed in the top left of the canvas.
+        # 在画布左上的文本
+        '''
+        self.label = pyglet.text.Label('', font_name='Arial', font_size=18,
+                                       x=10, y=self.height - 10, anchor_x='left', anchor_y='top',
+                                       color=(0, 0, 0, 255))
+        '''
+
+        # self.looking_at_label = pyglet.text.Label('Looking At:', font)
+        # TODO
+        # TEST LABEL for DEBUG
+        self.debugScreen = pyglet.text.Label('', font_name='Minecraft', font_size=12,
+                                             x=10, y=self.height-10, anchor_x='left', anchor_y='top',
+                                             width=self.width*0.6, multiline=True,
+                                             color=(221, 221, 221, 255))
+
+        # The profiler percentiles shown by the debug screen and when they
+        # were last formatted, and the vertex lists of the frame time graph
+        # and of its 30 and 60 fps marks.
+        # 调试屏幕的性能数据与帧时间图
+        self._profile_text = ''
+        self._profile_time = 0.0
+        self._graph = None
+        self._graph_marks = None
+
+        # This call schedules the `update()` method to be called
+        # TICKS_PER_SEC. This is the main game event loop.
+        # 使用pyglet.schedule_interval实现的定期更新
+        pyglet.clock.schedule_interval(self.update, 1.0 / TICKS_PER_SEC)
+
+        # Check if screenshot exists
+        if os.path.exists('screenshots'):
+            pass
+        else:
+            os.mkdir('screenshots')
+
+    def set_exclusive_mouse(self, exclusive):
+        """ If `exclusive` is True, the game will capture the mouse, if False
+        the game will ignore the mouse.
+        如果exclusive_mouse标志为True, 游戏将捕获鼠标, 否则忽略输入
+
+        """
+        super(Window, self).set_exclusive_mouse(exclusive)
+        self.exclusive = exclusive
+
+    def update(self, dt):
+        """ This method is scheduled to be called repeatedly by the pyglet
+        clock.
+        该方法被定期调用以更新游戏
+
+        Parameters
+        ----------
+        dt : float
+            The change in time since the last call.
+            时间变化量
+
+        """
+        self.simulation.update(dt)
 
     def on_mouse_press(self, x, y, button, modifiers):
         """ Called when a mouse button is pressed. See pyglet docs for button
@@ -842,14 +4551,13 @@ class Window(pyglet.window.Window):
 
         """
         if self.exclusive:
-            vector = self.get_sight_vector()
-            block, previous = self.model.hit_test(self.position, vector)
+            block, previous, _ = self.simulation.hit_test()
             # print('hit_test', block, previous)
             if (button == mouse.RIGHT) or \
                     ((button == mouse.LEFT) and (modifiers & key.MOD_CTRL)):
                 # ON OSX, control + left click = right click.
                 if previous:
-                    self.model.add_block(previous, self.block)
+                    self.model.add_block(previous, self.player.block)
             elif button == pyglet.window.mouse.LEFT and block:
                 # print(block)
                 # print(self.model.world[block])
@@ -876,11 +4584,7 @@ class Window(pyglet.window.Window):
 
         """
         if self.exclusive:
-            m = 0.15
-            x, y = self.rotation
-            x, y = x + dx * m, y + dy * m
-            y = max(-90, min(90, y))
-            self.rotation = (x, y)
+            self.player.look(dx, dy)
 
     def on_key_press(self, symbol, modifiers):
         """ Called when the player presses a key. See pyglet docs for key
@@ -899,24 +4603,23 @@ class Window(pyglet.window.Window):
         """
         if symbol == key.W:
             # 前进
-            self.strafe[0] -= 1
+            self.player.strafe[0] -= 1
         elif symbol == key.S:
             # 后退
-            self.strafe[0] += 1
+            self.player.strafe[0] += 1
         elif symbol == key.A:
             # 向左
-            self.strafe[1] -= 1
+            self.player.strafe[1] -= 1
         elif symbol == key.D:
             # 向右
-            self.strafe[1] += 1
+            self.player.strafe[1] += 1
         elif symbol == key.R:
             # Respawn
             # 重生
-            self.position = (0, 70, 0)
+            self.player.respawn()
         elif symbol == key.SPACE:
             # 跳跃
-            if self.dy == 0:
-                self.dy = JUMP_SPEED
+            self.player.jump()
         elif symbol == key.F1:
             # 退出
             self.close()
@@ -929,9 +4632,20 @@ class Window(pyglet.window.Window):
             self.enable_debugScreen = not self.enable_debugScreen
         elif symbol == key.F4:
             # 调试-打印旋转角度
-            print(self.rotation)
+            print(self.player.rotation)
         elif symbol == key.F5:
-            print(self.model.world)
+            # 保存世界
+            self.model.save()
+            print(f'World saved to {WORLD_PATH}')
+        elif symbol == key.F6:
+            # 导出性能数据
+            if not os.path.exists(PROFILE_PATH):
+                os.mkdir(PROFILE_PATH)
+            path = os.path.join(PROFILE_PATH,
+                                time.strftime('%Y-%m-%d_%H.%M.%S'))
+            for extension in ('.csv', '.json'):
+                PROFILER.dump(path + extension, self.model.counters())
+            print(f'Profile saved to {path}.csv and {path}.json')
         elif symbol == key.F11:
             self.full_screen = not self.full_screen
             self.set_fullscreen(self.full_screen)
@@ -940,11 +4654,12 @@ class Window(pyglet.window.Window):
             self.set_exclusive_mouse(False)
         elif symbol == key.TAB:
             # 切换飞行模式
-            self.flying = not self.flying
+            self.player.flying = not self.player.flying
         elif symbol in self.num_keys:
             # 切换物品栏
-            index = (symbol - self.num_keys[0]) % len(self.inventory)
-            self.block = self.inventory[index]
+            inventory = self.player.inventory
+            index = (symbol - self.num_keys[0]) % len(inventory)
+            self.player.block = inventory[index]
 
     def on_key_release(self, symbol, modifiers):
         """ Called when the player releases a key. See pyglet docs for key
@@ -959,13 +4674,21 @@ class Window(pyglet.window.Window):
 
         """
         if symbol == key.W:
-            self.strafe[0] += 1
+            self.player.strafe[0] += 1
         elif symbol == key.S:
-            self.strafe[0] -= 1
+            self.player.strafe[0] -= 1
         elif symbol == key.A:
-            self.strafe[1] += 1
+            self.player.strafe[1] += 1
         elif symbol == key.D:
-            self.strafe[1] -= 1
+            self.player.strafe[1] -= 1
+
+    def on_close(self):
+        """ Called when the window is closed, saves and shuts down the
+        model.
+
+        """
+        self.model.close()
+        super(Window, self).on_close()
 
     def on_resize(self, width, height):
         """ Called when the window is resized to a new `width` and `height`.
@@ -1011,41 +4734,69 @@ class Window(pyglet.window.Window):
         glViewport(0, 0, max(1, viewport[0]), max(1, viewport[1]))
         glMatrixMode(GL_PROJECTION)
         glLoadIdentity()
-        gluPerspective(65.0, width / float(height), 0.1, 60.0)
+        far = far_plane(self.model.render_distance)
+        gluPerspective(FIELD_OF_VIEW, width / float(height), NEAR_PLANE, far)
         glMatrixMode(GL_MODELVIEW)
         glLoadIdentity()
-        x, y = self.rotation
+        x, y = self.player.rotation
         glRotatef(x, 0, 1, 0)
         glRotatef(-y, math.cos(math.radians(x)), 0, math.sin(math.radians(x)))
-        x, y, z = self.position
+        x, y, z = self.player.position
         glTranslatef(-x, -y, -z)
 
     def on_draw(self):
         """ Called by pyglet to draw the canvas.
 
         """
+        PROFILER.frame()
         self.clear()
         self.set_3d()
         glColor3d(1, 1, 1)
-        self.model.batch.draw()
+        width, height = self.get_size()
+        self.model.draw(frustum_planes(
+            self.player.position, self.player.rotation, FIELD_OF_VIEW,
+            width / float(max(1, height)), NEAR_PLANE,
+            far_plane(self.model.render_distance)))
         self.draw_focused_block()
         self.set_2d()
         self.draw_label()
         self.draw_reticle()
 
+    def get_focused_block(self):
+        """ Return the block that is currently under the crosshairs, or
+        None. The ray cast is only redone when the position, the rotation or
+        the world changed since the last call.
+        返回准星指向的方块(结果缓存至位置/视角/世界改变)
+
+        """
+        player = self.player
+        focus_key = (player.position, player.rotation, self.model.revision)
+        if focus_key != self._focus_key:
+            self._focus_key = focus_key
+            self.focused = self.simulation.hit_test()[0]
+        return self.focused
+
+    @profiled('draw_focused_block')
     def draw_focused_block(self):
         """ Draw black edges around the block that is currently under the
         crosshairs.
 
         """
-        vector = self.get_sight_vector()
-        block = self.model.hit_test(self.position, vector)[0]
+        block = self.get_focused_block()
         if block:
-            x, y, z = block
-            vertex_data = cube_vertices(x, y, z, 0.51)
+            if block != self._outlined:
+                # Move the outline only when the focus moved to another block.
+                x, y, z = block
+                vertex_data = cube_vertices(x, y, z, 0.51)
+                if self._outline is None:
+                    self._outline = pyglet.graphics.vertex_list(
+                        24, ('v3f/dynamic', vertex_data))
+                else:
+                    self._outline.vertices[:] = vertex_data
+                self._outlined = block
             glColor3d(0, 0, 0)
             glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
-            pyglet.graphics.draw(24, GL_QUADS, ('v3f/static', vertex_data))
+            self._outline.draw(GL_QUADS)
             glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
 
     def draw_label(self):
@@ -1058,20 +4809,80 @@ class Window(pyglet.window.Window):
             pyglet.clock.get_fps(), x, y, z,
             len(self.model._shown), len(self.model.world))
         '''
-        x, y, z = normalize(self.position, ndigits=3)
-        x_r, y_r, z_r = normalize(self.position)
+        x, y, z = normalize(self.player.position, ndigits=3)
+        x_r, y_r, z_r = normalize(self.player.position)
         if self.enable_debugScreen:
             self.debugScreen.text = f'Minecraft {version["STAGE"]}-{version["VERSION"]}-{revision_hash}\n' \
                                     f'{round(pyglet.clock.get_fps())} fps\n' \
                                      '\n' \
                                     f'XYZ: {x} / {y} / {z}\n' \
-                                    f'Block: {x_r} {y_r} {z_r}'
+                                    f'Block: {x_r} {y_r} {z_r}\n' \
+                                    f'Terrain: {self.model.generator.name} (seed {self.model.generator.seed})\n' \
+                                    f'Sectors: {self.model.drawn} drawn / {self.model.culled} culled / {self.model.pruned} pruned\n' \
+                                    f'{self.profile_text()}'
         else:
             self.debugScreen.text = ''
 
 
         # self.label.draw()
         self.debugScreen.draw()
+        if self.enable_debugScreen:
+            self.draw_frame_graph()
+
+    def profile_text(self):
+        """ Return the model counters and the percentiles of every
+        profiler scope for the debug screen, formatted again at most twice a
+        second so that they can be read.
+        调试屏幕上的性能数据
+
+        """
+        now = time.perf_counter()
+        if now - self._profile_time >= 0.5:
+            self._profile_time = now
+            counters = self.model.counters()
+            lines = [f'Queue: {counters["queue"]}',
+                     f'Blocks: {counters["shown_blocks"]} shown / {counters["blocks"]}',
+                     f'Vertices: {counters["resident_vertices"]}',
+                     '',
+                     'p50 / p95 / p99']
+            for name, stat in PROFILER.stats().items():
+                lines.append('%s: %.2f / %.2f / %.2f ms' % (
+                    name, stat['p50'] * 1e3, stat['p95'] * 1e3,
+                    stat['p99'] * 1e3))
+            self._profile_text = '\n'.join(lines)
+        return self._profile_text
+
+    def draw_frame_graph(self):
+        """ Draw the latest frame times in the bottom left corner, 2 pixels
+        per millisecond, with marks at 30 and 60 fps.
+        绘制帧时间图
+
+        """
+        frames = numpy.array(PROFILER.history('frame'))
+        if len(frames) < 2:
+            return
+        x, y = 10, 10
+        vertices = numpy.empty((len(frames), 2))
+        vertices[:, 0] = x + numpy.arange(len(frames))
+        vertices[:, 1] = y + numpy.minimum(frames * 2000.0, 200.0)
+        vertices = vertices.ravel().tolist()
+        if self._graph is None or self._graph.get_size() != len(frames):
+            if self._graph is not None:
+                self._graph.delete()
+            self._graph = pyglet.graphics.vertex_list(
+                len(frames), ('v2f/stream', vertices))
+        else:
+            self._graph.vertices[:] = vertices
+        if self._graph_marks is None:
+            width = PROFILER.samples
+            marks = [y + 2000.0 / 60, y + 2000.0 / 30]
+            self._graph_marks = pyglet.graphics.vertex_list(
+                4, ('v2f', [x, marks[0], x + width, marks[0],
+                            x, marks[1], x + width, marks[1]]))
+        glColor3d(0.5, 0.5, 0.5)
+        self._graph_marks.draw(GL_LINES)
+        glColor3d(0, 1, 0)
+        self._graph.draw(GL_LINE_STRIP)
 
     def draw_reticle(self):
         """ Draw the crosshairs in the center of the screen.
@@ -1081,8 +4892,9 @@ class Window(pyglet.window.Window):
         self.reticle.draw(GL_LINES)
 
 
-def setup_fog():
-    """ Configure the OpenGL fog properties.
+def setup_fog(far=far_plane(RENDER_DISTANCE)):
+    """ Configure the OpenGL fog properties, the fog ending at the `far`
+    clipping plane.
 
     """
     # Enable fog. Fog "blends a fog color with each rasterized pixel fragment's
@@ -1096,8 +4908,8 @@ def setup_fog():
     glFogi(GL_FOG_MODE, GL_LINEAR)
     # How close and far away fog starts and ends. The closer the start and end,
     # the denser the fog in the fog range.
-    glFogf(GL_FOG_START, 20.0)
-    glFogf(GL_FOG_END, 60.0)
+    glFogf(GL_FOG_START, far / 3.0)
+    glFogf(GL_FOG_END, far)
 
 
 def setup():
@@ -1118,11 +4930,189 @@ def setup():
     # as smooth."
     glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
     glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+    # Leave out the see-through pixels of transparent blocks.
+    # 透明方块的镂空
+    glEnable(GL_ALPHA_TEST)
+    glAlphaFunc(GL_GREATER, 0.5)
     # 初始化视野雾
     # setup_fog()
 
 
-def main():
+def pregenerate(path, radius, seed=None, generator=None,
+                workers=GENERATION_WORKERS, interval=1.0):
+    """ Generate and save the chunks of the world at `path` up to `radius`
+    sectors from the origin along x and z, without opening a window.
+    Chunks are saved as they are generated, one region file at a time, so
+    memory use does not grow with the radius. Chunks saved already are
+    skipped: an interrupted run picks up where it stopped when run again.
+    Progress is printed every `interval` seconds.
+    预生成世界
+
+    Parameters
+    ----------
+    path : str
+        Directory of the world.
+    radius : int
+        The (2 radius + 1) ^ 2 sectors around the origin are generated.
+    seed : int or None
+        Seed of a new world, None for a random one. A saved world keeps
+        its seed, giving another one is an error.
+    generator : str or None
+        Key of GENERATORS for a new world, WORLD_GENERATOR by default. A
+        saved world keeps its generator, giving another one is an error. A
+        world saved before there were generators is flat with seed 0.
+    workers : int
+        Number of generation worker processes, 0 to generate on the calling
+        thread.
+
+    Returns
+    -------
+    count : int
+        The number of chunks generated.
+
+    """
+    store = RegionStore(path)
+    saved = store.level()
+    if not saved and store.exists():
+        # A world saved before there were generators is flat.
+        saved = {'generator': FlatGenerator.name, 'seed': '0'}
+    if saved and (generator not in (None, saved['generator']) or
+                  seed not in (None, int(saved['seed']))):
+        store.close()
+        raise ValueError('%s holds a %s world with seed %s'
+                         % (path, saved['generator'], saved['seed']))
+    terrain = world_generator(store, None if saved else GENERATORS[
+        generator or WORLD_GENERATOR](seed))
+
+    def square(region):
+        """ The sectors of `region` in the square that are not saved. """
+        rx, rz = region
+        xs = xrange(max(rx * REGION_SIZE, -radius),
+                    min((rx + 1) * REGION_SIZE, radius + 1))
+        zs = xrange(max(rz * REGION_SIZE, -radius),
+                    min((rz + 1) * REGION_SIZE, radius + 1))
+        return [(x, 0, z) for x in xs for z in zs
+                if not store.saved((x, 0, z))]
+
+    # The regions covering the square, nearest first. Only the count of
+    # sectors to go is kept for each, their lists are made when they are
+    # reached.
+    (x0, z0), (x1, z1) = (RegionStore.region((-radius, 0, -radius)),
+                          RegionStore.region((radius, 0, radius)))
+    regions = sorted(((rx, rz) for rx in xrange(x0, x1 + 1)
+                      for rz in xrange(z0, z1 + 1)),
+                     key=lambda r: (r[0] + 0.5) ** 2 + (r[1] + 0.5) ** 2)
+    total = 0
+    for region in regions:
+        total += len(square(region))
+        store.release(region)
+    print('Generating %d of %d chunks of a %s world with seed %d in %s'
+          % (total, (2 * radius + 1) ** 2, terrain.name, terrain.seed, path))
+
+    start = last = time.perf_counter()
+    done = 0
+    # Number of chunks of each region being generated, and the region
+    # whose chunks are being requested.
+    outstanding = {}
+    feeding = None
+    pool = finished = None
+    if workers:
+        finished = queue.Queue()
+        pool = GenerationPool(terrain, workers, finished.put)
+
+    def finish(sector, blocks):
+        """ Save a generated chunk and report progress. """
+        nonlocal done, last
+        if blocks is not None:
+            store.save(sector, blocks)
+        region = RegionStore.region(sector)
+        outstanding[region] -= 1
+        if not outstanding[region] and region != feeding:
+            del outstanding[region]
+            store.release(region)
+        done += 1
+        now = time.perf_counter()
+        if now - last >= interval or done == total:
+            last = now
+            rate = done / (now - start)
+            eta = int((total - done) / rate)
+            print('%d/%d chunks  %.0f chunks/s  ETA %d:%02d:%02d'
+                  % (done, total, rate, eta // 3600, eta // 60 % 60,
+                     eta % 60))
+
+    def collect():
+        sector, blocks = pool.collect(finished.get())
+        pool.submit()
+        finish(sector, blocks)
+
+    try:
+        for order, region in enumerate(regions):
+            sectors = square(region)
+            feeding = region
+            outstanding[region] = len(sectors)
+            for sector in sectors:
+                if pool is None:
+                    finish(sector, terrain.generate(sector))
+                    continue
+                pool.request(sector, float(order))
+                pool.submit()
+                # A few requests queued ahead of the workers at most.
+                while len(pool.requested) >= 4 * workers:
+                    collect()
+            feeding = None
+            if not outstanding[region]:
+                del outstanding[region]
+                store.release(region)
+        while pool is not None and pool.requested:
+            collect()
+    finally:
+        if pool is not None:
+            pool.close()
+        store.close()
+    return done
+
+
+def main(argv=None):
+    """ Start the game, or run the command given on the command line:
+
+        python main.py pregen --radius N [--seed S] [--out world/]
+
+    """
+    parser = argparse.ArgumentParser(
+        description='Minecraft: Python Edition. Without a command, play.')
+    commands = parser.add_subparsers(dest='command')
+    pregen = commands.add_parser(
+        'pregen', help='generate and save chunks without opening a window',
+        description='Generate and save the chunks around the origin without '
+                    'opening a window. Chunks are saved as they are '
+                    'generated; run the same command again to resume an '
+                    'interrupted run.')
+    pregen.add_argument('--radius', type=int, required=True,
+                        help='generate the (2 RADIUS + 1)^2 sectors around '
+                             'the origin')
+    pregen.add_argument('--seed', type=int,
+                        help='seed of a new world, random by default')
+    pregen.add_argument('--generator', choices=sorted(GENERATORS),
+                        help='terrain of a new world, %s by default'
+                             % WORLD_GENERATOR)
+    pregen.add_argument('--out', default=WORLD_PATH,
+                        help='world directory, %s by default' % WORLD_PATH)
+    pregen.add_argument('--workers', type=int, default=GENERATION_WORKERS,
+                        help='generation processes, 0 to use none '
+                             '(%d by default)' % GENERATION_WORKERS)
+    args = parser.parse_args(argv)
+
+    if args.command == 'pregen':
+        try:
+            pregenerate(args.out, args.radius, args.seed, args.generator,
+                        args.workers)
+        except ValueError as e:
+            parser.error(str(e))
+        except KeyboardInterrupt:
+            print('Interrupted, run the same command again to resume.')
+            sys.exit(130)
+        return
+
     # print(__file__)
     window = Window(width=854, height=480, caption='Minecraft:Python Edition', resizable=True)
     # Hide the mouse cursor and prevent the mouse from leaving the window.
@@ -1133,4 +5123,8 @@ def main():
 
 
 if __name__ == '__main__':
+    # In a frozen build the generation workers start this executable again,
+    # run as workers here and exit instead of opening a window.
+    # 打包后的程序中, 子进程在此处作为生成进程运行
+    multiprocessing.freeze_support()
     main()